@@ -0,0 +1,180 @@
+import argparse
+import os
+import time
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from record_stream import load_game
+
+# 导出格式及对应的文件扩展名：parquet 体积小，arrow（Arrow IPC文件）可以内存映射、读取最快
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+_STRING_LIST = pa.list_(pa.string())
+
+# 各表的结构；推理内容和玩家印象不导出，分析只需要对局结构
+SCHEMAS: Dict[str, pa.Schema] = {
+    "games": pa.schema([
+        ("game_id", pa.string()),
+        ("player_names", _STRING_LIST),
+        ("winner", pa.string()),
+        ("num_rounds", pa.int32()),
+    ]),
+    "rounds": pa.schema([
+        ("game_id", pa.string()),
+        ("round_id", pa.int32()),
+        ("target_card", pa.string()),
+        ("starting_player", pa.string()),
+        ("round_players", _STRING_LIST),
+    ]),
+    # 每行是一次出牌及其后的质疑，附带双方在本轮的初始手牌，对决分析不必再关联其他表
+    "plays": pa.schema([
+        ("game_id", pa.string()),
+        ("round_id", pa.int32()),
+        ("play_index", pa.int32()),
+        ("player_name", pa.string()),
+        ("next_player", pa.string()),
+        ("played_cards", _STRING_LIST),
+        ("remaining_cards", _STRING_LIST),
+        ("play_reason", pa.string()),
+        ("behavior", pa.string()),
+        ("was_challenged", pa.bool_()),
+        ("challenge_reason", pa.string()),
+        ("challenge_result", pa.bool_()),
+        ("player_initial_hand", _STRING_LIST),
+        ("next_player_initial_hand", _STRING_LIST),
+    ]),
+    "shots": pa.schema([
+        ("game_id", pa.string()),
+        ("round_id", pa.int32()),
+        ("shooter_name", pa.string()),
+        ("bullet_hit", pa.bool_()),
+    ]),
+}
+TABLES = tuple(SCHEMAS)
+
+class ColumnarBuilder:
+    """将游戏记录逐局展开为按列保存的 games、rounds、plays、shots 四张表"""
+    def __init__(self):
+        self._columns: Dict[str, Dict[str, List]] = {
+            table: {name: [] for name in schema.names} for table, schema in SCHEMAS.items()
+        }
+
+    def _append(self, table: str, **values) -> None:
+        columns = self._columns[table]
+        for name, value in values.items():
+            columns[name].append(value)
+
+    def add_game(self, game_data: Dict, game_id: Optional[str] = None) -> None:
+        """
+        添加一局游戏
+
+        Args:
+            game_data: GameRecord.to_dict() 格式的游戏记录
+            game_id: 游戏ID，默认使用记录中的 game_id
+        """
+        game_id = game_id or game_data["game_id"]
+        rounds = game_data.get("rounds", [])
+        self._append("games", game_id=game_id, player_names=game_data.get("player_names", []),
+                     winner=game_data.get("winner"), num_rounds=len(rounds))
+        for round_data in rounds:
+            round_id = round_data["round_id"]
+            self._append("rounds", game_id=game_id, round_id=round_id, target_card=round_data["target_card"],
+                         starting_player=round_data["starting_player"], round_players=round_data["round_players"])
+            initial_hands = {state["player_name"]: state["initial_hand"] for state in round_data.get("player_initial_states", [])}
+            for play_index, play in enumerate(round_data.get("play_history", [])):
+                self._append(
+                    "plays", game_id=game_id, round_id=round_id, play_index=play_index,
+                    player_name=play["player_name"], next_player=play["next_player"],
+                    played_cards=play["played_cards"], remaining_cards=play["remaining_cards"],
+                    play_reason=play.get("play_reason"), behavior=play.get("behavior"),
+                    was_challenged=play.get("was_challenged", False), challenge_reason=play.get("challenge_reason"),
+                    challenge_result=play.get("challenge_result"),
+                    player_initial_hand=initial_hands.get(play["player_name"]),
+                    next_player_initial_hand=initial_hands.get(play["next_player"]),
+                )
+            result = round_data.get("round_result")
+            if result:
+                self._append("shots", game_id=game_id, round_id=round_id,
+                             shooter_name=result["shooter_name"], bullet_hit=result["bullet_hit"])
+
+    def build(self) -> Dict[str, pa.Table]:
+        """生成各表"""
+        return {table: pa.table(self._columns[table], schema=schema) for table, schema in SCHEMAS.items()}
+
+def export_game_records(input_dir: str, output_dir: str, fmt: str = "parquet") -> Dict[str, str]:
+    """
+    将目录中的所有json游戏记录导出为列式表
+
+    游戏ID使用文件名（与 player_matchup_analyze 一致），无法读取的记录会被跳过。
+
+    Args:
+        input_dir: 游戏记录目录
+        output_dir: 输出目录，每张表保存为 <表名>.parquet 或 <表名>.arrow
+        fmt: parquet 或 arrow
+    Returns:
+        Dict[str, str]: 表名到文件路径的映射
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"未知的导出格式: {fmt}，可选: {', '.join(FORMATS)}")
+    builder = ColumnarBuilder()
+    for filename in sorted(os.listdir(input_dir)):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            # 推理内容和玩家印象不导出，读取时直接跳过
+            builder.add_game(load_game(os.path.join(input_dir, filename)), os.path.splitext(filename)[0])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"跳过 {filename}: {e}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for table, data in builder.build().items():
+        path = os.path.join(output_dir, table + FORMATS[fmt])
+        if fmt == "parquet":
+            pq.write_table(data, path)
+        else:
+            feather.write_feather(data, path, compression="uncompressed")
+        paths[table] = path
+    return paths
+
+def read_table(table_dir: str, table: str, columns: Optional[List[str]] = None) -> pa.Table:
+    """
+    读取导出的表，只读取需要的列
+
+    Args:
+        table_dir: export_game_records 的输出目录，自动识别 parquet 或 arrow 格式
+        table: 表名（games、rounds、plays、shots）
+        columns: 需要的列，为None时读取全部列
+    """
+    for fmt, extension in FORMATS.items():
+        path = os.path.join(table_dir, table + extension)
+        if os.path.exists(path):
+            if fmt == "parquet":
+                return pq.read_table(path, columns=columns)
+            return feather.read_table(path, columns=columns, memory_map=True)
+    raise FileNotFoundError(f"在 {table_dir} 中找不到表 {table}")
+
+def finished_games_filter(table: pa.Table, games: pa.Table) -> pa.Table:
+    """只保留有赢家的游戏中的行（与分析json记录时跳过未结束的游戏一致）"""
+    finished = pc.filter(games["game_id"], pc.is_valid(games["winner"]))
+    return table.filter(pc.is_in(table["game_id"], value_set=finished))
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='将游戏记录导出为Parquet或Arrow列式表，供分析工具快速读取')
+    parser.add_argument('-i', '--input', default='game_records', help='游戏记录目录 (默认: game_records)')
+    parser.add_argument('-o', '--output', default='game_tables', help='输出目录 (默认: game_tables)')
+    parser.add_argument('--format', choices=list(FORMATS), default='parquet', help='导出格式 (默认: parquet)')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    start = time.perf_counter()
+    paths = export_game_records(args.input, args.output, args.format)
+    games = read_table(args.output, "games", ["game_id"]).num_rows
+    print(f"已导出 {games} 局游戏，用时 {time.perf_counter() - start:.2f} 秒")
+    for table, path in paths.items():
+        print(f"  {table}: {path} ({os.path.getsize(path) / 1024:.1f} KB)")
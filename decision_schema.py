@@ -0,0 +1,97 @@
+from typing import Dict, List, Optional
+
+# 出牌和质疑决策的JSON Schema，同时用于请求结构化输出和本地验证
+PLAY_DECISION_SCHEMA: Dict = {
+    "type": "object",
+    "properties": {
+        "played_cards": {
+            "type": "array",
+            "items": {"type": "string", "enum": ["Q", "K", "A", "Joker"]},
+            "minItems": 1,
+            "maxItems": 3,
+        },
+        "behavior": {"type": "string"},
+        "play_reason": {"type": "string"},
+    },
+    "required": ["played_cards", "behavior", "play_reason"],
+    "additionalProperties": False,
+}
+
+CHALLENGE_DECISION_SCHEMA: Dict = {
+    "type": "object",
+    "properties": {
+        "was_challenged": {"type": "boolean"},
+        "challenge_reason": {"type": "string"},
+    },
+    "required": ["was_challenged", "challenge_reason"],
+    "additionalProperties": False,
+}
+
+# 结构化输出模式：json_object 只要求输出合法JSON，json_schema 要求服务端按Schema约束生成
+STRUCTURED_OUTPUT_MODES = ("json_object", "json_schema")
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "integer": int,
+    "number": (int, float),
+}
+
+def _type_matches(value, expected: str) -> bool:
+    # bool 是 int 的子类，数值类型需要单独排除
+    if expected in ("integer", "number") and isinstance(value, bool):
+        return False
+    return isinstance(value, _JSON_TYPES[expected])
+
+def validate_decision(value, schema: Dict, path: str = "") -> List[str]:
+    """
+    按Schema验证决策，支持本项目用到的子集（type、properties、required、items、enum、minItems、maxItems）
+
+    多余的字段不视为错误：模型在非结构化输出模式下常会附带额外字段，不影响游戏逻辑。
+
+    Returns:
+        List[str]: 错误说明，为空表示验证通过
+    """
+    name = path or "回复"
+    expected = schema.get("type")
+    if expected and not _type_matches(value, expected):
+        return [f"{name} 的类型应为 {expected}"]
+
+    errors = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{name} 的取值必须是 {', '.join(map(str, schema['enum']))} 之一")
+    if expected == "object":
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"缺少字段 {key}")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate_decision(value[key], subschema, key))
+    elif expected == "array":
+        if "minItems" in schema and len(value) < schema["minItems"]:
+            errors.append(f"{name} 至少需要 {schema['minItems']} 项")
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            errors.append(f"{name} 最多只能有 {schema['maxItems']} 项")
+        if "items" in schema:
+            for i, item in enumerate(value):
+                errors.extend(validate_decision(item, schema["items"], f"{name}[{i}]"))
+    return errors
+
+def build_response_format(mode: Optional[str], name: str, schema: Dict) -> Optional[Dict]:
+    """
+    构造 chat.completions 的 response_format 参数
+
+    Args:
+        mode: None（不使用结构化输出）、json_object 或 json_schema
+        name: Schema名称
+        schema: 决策的JSON Schema
+    """
+    if mode is None:
+        return None
+    if mode == "json_object":
+        return {"type": "json_object"}
+    if mode == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+    raise ValueError(f"未知的结构化输出模式: {mode}，可选: {', '.join(STRUCTURED_OUTPUT_MODES)}")
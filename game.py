@@ -1,17 +1,56 @@
+import asyncio
+import logging
 import random
-from typing import List, Optional, Dict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Dict, Tuple
 from player import Player
+from llm_client import run_async
 from game_record import GameRecord, PlayerInitialState
+from record_index import RecordIndex
+from policy import create_policy
+from game_logging import configure_logging, event, get_logger
+from metrics import metrics
+
+logger = get_logger("game")
 
 class Game:
-    def __init__(self, player_configs: List[Dict[str, str]]) -> None:
+    def __init__(self, player_configs: List[Dict[str, str]], parallel_reflection: bool = False, reflection_workers: int = 12, batch_reflection: bool = False, game_id: Optional[str] = None, event_log: bool = False,
+                 streaming: bool = False, record_thinking: bool = True, save_record: bool = True,
+                 retry_budgets: Optional[Dict[str, int]] = None, structured_output: Optional[str] = None,
+                 speculative_challenge: bool = False, offload_thinking: bool = False, index_path: Optional[str] = None) -> None:
         """初始化游戏
         
         Args:
-            player_configs: 包含玩家配置的列表，每个配置是一个字典，包含 name 和 model 字段
+            player_configs: 包含玩家配置的列表，每个配置是一个字典，包含 name 和 model 字段；
+                也可以用 policy 字段（策略名称或 Policy 实例，见 policy.py）代替 model，由脚本策略做决策
+            parallel_reflection: 是否并发执行反思阶段的LLM请求
+            reflection_workers: 并发反思时同时进行的最大请求数
+            batch_reflection: 是否让每个玩家在一次请求中反思所有对手，失败时回退到逐个反思
+            game_id: 游戏ID，默认根据当前时间生成
+            event_log: 是否以追加写入的JSONL事件日志保存记录，游戏结束时再压缩为完整JSON
+            streaming: 是否以流式方式请求LLM，收到完整的JSON决策后立即返回
+            record_thinking: 是否在游戏记录中保存LLM的推理内容
+            save_record: 是否将游戏记录保存到文件，大批量模拟时可关闭
+            retry_budgets: 各阶段（play/challenge/reflect）LLM决策的最大尝试次数，见 retry_policy.DEFAULT_RETRY_BUDGETS
+            structured_output: 出牌和质疑请求的结构化输出模式（json_object 或 json_schema），
+                玩家配置中的 structured_output 字段可以为单个玩家覆盖该设置
+            speculative_challenge: 是否在当前玩家思考出牌时，并行预热下家质疑提示词的前缀缓存
+            offload_thinking: 是否将推理内容压缩保存到 game_records/traces，记录中只保留引用和字符数
+            index_path: 游戏记录索引文件（见 record_index.py），设置后出牌、质疑和开枪实时写入索引
         """
         # 使用配置创建玩家对象
-        self.players = [Player(config["name"], config["model"]) for config in player_configs]
+        self.players = [
+            Player(
+                config["name"],
+                config.get("model"),
+                streaming=streaming,
+                capture_reasoning=record_thinking,
+                policy=create_policy(config["policy"]) if "policy" in config else None,
+                retry_budgets=retry_budgets,
+                structured_output=config.get("structured_output", structured_output)
+            )
+            for config in player_configs
+        ]
         
         # 初始化每个玩家对其他玩家的看法
         for player in self.players:
@@ -22,10 +61,25 @@ class Game:
         self.current_player_idx: int = random.randint(0, len(self.players) - 1)
         self.last_shooter_name: Optional[str] = None
         self.game_over: bool = False
+        self.parallel_reflection = parallel_reflection
+        self.reflection_workers = reflection_workers
+        self.batch_reflection = batch_reflection
+        # 预热请求在后台线程中发出，不阻塞出牌
+        self._speculation_executor = ThreadPoolExecutor(max_workers=1) if speculative_challenge else None
+        self._speculation_future: Optional[Future] = None
 
         # 创建游戏记录
-        self.game_record: GameRecord = GameRecord()
-        self.game_record.start_game([p.name for p in self.players])
+        self.game_record: GameRecord = GameRecord(
+            game_id,
+            event_log=event_log,
+            save_directory="game_records" if save_record else None,
+            offload_thinking=offload_thinking,
+            index=RecordIndex(index_path) if index_path else None
+        )
+        self.game_record.start_game(
+            [p.name for p in self.players],
+            {p.name: p.model_name if p.policy is None else f"policy:{p.policy.name}" for p in self.players}
+        )
         self.round_count = 0
 
     def _create_deck(self) -> List[str]:
@@ -45,16 +99,20 @@ class Game:
             for player in self.players:
                 if player.alive and self.deck:
                     player.hand.append(self.deck.pop())
-                    player.print_status()
+        if logger.isEnabledFor(logging.INFO):
+            for player in self.players:
+                if player.alive:
+                    player.log_status()
 
     def choose_target_card(self) -> None:
         """随机选择目标牌"""
         self.target_card = random.choice(['Q', 'K', 'A'])
-        print(f"目标牌是: {self.target_card}")
+        logger.info("目标牌是: %s", self.target_card)
 
     def start_round_record(self) -> None:
         """开始新的回合，并在 `GameRecord` 里记录信息"""
         self.round_count += 1
+        metrics.set_context(self.game_record.game_id, self.round_count)
         starting_player = self.players[self.current_player_idx].name
         player_initial_states = [
             PlayerInitialState(
@@ -69,13 +127,14 @@ class Game:
         # 获取当前存活的玩家
         round_players = [player.name for player in self.players if player.alive]
 
-        # 创建一个深拷贝，而不是引用
-        player_opinions = {}
-        for player in self.players:
-            player_opinions[player.name] = {}
-            for target, opinion in player.opinions.items():
-                player_opinions[player.name][target] = opinion
+        # 游戏记录会为变化的印象保存副本，这里直接传入各玩家当前的印象
+        player_opinions = {player.name: player.opinions for player in self.players}
 
+        if logger.isEnabledFor(logging.INFO):
+            event(logger, logging.INFO, "round_start", "第 %d 轮开始，目标牌 %s，由 %s 先出牌",
+                  self.round_count, self.target_card, starting_player,
+                  game_id=self.game_record.game_id, round_id=self.round_count,
+                  target_card=self.target_card, starting_player=starting_player, round_players=round_players)
         self.game_record.start_round(
             round_id=self.round_count,
             target_card=self.target_card,
@@ -108,7 +167,7 @@ class Game:
         Args:
             player: 需要执行惩罚的玩家
         """
-        print(f"玩家 {player.name} 开枪！")
+        logger.info("玩家 %s 开枪！", player.name)
         
         # 执行射击并获取存活状态
         still_alive = player.process_penalty()
@@ -120,8 +179,10 @@ class Game:
             bullet_hit=not still_alive  # 如果玩家死亡，说明子弹命中
         )
 
-        if not still_alive:
-            print(f"{player.name} 已死亡！")
+        if logger.isEnabledFor(logging.INFO):
+            event(logger, logging.INFO, "shooting", "%s %s", player.name, "已死亡！" if not still_alive else "未中弹",
+                  game_id=self.game_record.game_id, round_id=self.round_count,
+                  shooter=player.name, bullet_hit=not still_alive)
         
         # 检查胜利条件
         if not self.check_victory():
@@ -129,7 +190,7 @@ class Game:
 
     def reset_round(self, record_shooter: bool) -> None:
         """重置当前小局"""
-        print("小局游戏重置，开始新的一局！")
+        logger.info("小局游戏重置，开始新的一局！")
 
         # 在发新牌之前进行反思，并获取存活玩家列表
         alive_players = self.handle_reflection()
@@ -144,14 +205,14 @@ class Game:
             if shooter_idx is not None and self.players[shooter_idx].alive:
                 self.current_player_idx = shooter_idx
             else:
-                print(f"{self.last_shooter_name} 已死亡，顺延至下一个存活且有手牌的玩家")
+                logger.info("%s 已死亡，顺延至下一个存活且有手牌的玩家", self.last_shooter_name)
                 self.current_player_idx = self.find_next_player_with_cards(shooter_idx or 0)
         else:
             self.last_shooter_name = None
             self.current_player_idx = self.players.index(random.choice(alive_players))
 
         self.start_round_record()
-        print(f"从 {self.players[self.current_player_idx].name} 开始新的一轮！")
+        logger.info("从 %s 开始新的一轮！", self.players[self.current_player_idx].name)
 
     def check_victory(self) -> bool:
         """
@@ -163,7 +224,9 @@ class Game:
         alive_players = [p for p in self.players if p.alive]
         if len(alive_players) == 1:
             winner = alive_players[0]
-            print(f"\n{winner.name} 获胜！")
+            if logger.isEnabledFor(logging.INFO):
+                event(logger, logging.INFO, "game_finish", "\n%s 获胜！", winner.name,
+                      game_id=self.game_record.game_id, winner=winner.name, rounds=self.round_count)
             # 记录胜利者并保存游戏记录
             self.game_record.finish_game(winner.name)
             self.game_over = True
@@ -188,24 +251,33 @@ class Game:
         Returns:
             List[str]: 返回打出的牌组
         """
-        # 获取当前轮次的基础信息
-        round_base_info = self.game_record.get_latest_round_info()
-        round_action_info = self.game_record.get_latest_round_actions(current_player.name, include_latest=True)
+        if current_player.policy is not None:
+            # 脚本策略直接读取游戏状态，无需拼装提示词
+            play_result, reasoning = current_player.policy.choose_cards_to_play(current_player, self, next_player)
+        else:
+            # 获取当前轮次的基础信息
+            round_base_info = self.game_record.get_latest_round_info()
+            round_action_info = self.game_record.get_latest_round_actions(current_player.name, include_latest=True)
         
-        # 获取出牌决策相关信息
-        play_decision_info = self.game_record.get_play_decision_info(
-            current_player.name,
-            next_player.name
-        )
+            # 获取出牌决策相关信息
+            play_decision_info = self.game_record.get_play_decision_info(
+                current_player.name,
+                next_player.name
+            )
 
-        # 让当前玩家选择出牌
-        play_result, reasoning = current_player.choose_cards_to_play(
-            round_base_info,
-            round_action_info,
-            play_decision_info
-        )
+            # 让当前玩家选择出牌
+            play_result, reasoning = current_player.choose_cards_to_play(
+                round_base_info,
+                round_action_info,
+                play_decision_info
+            )
 
         # 记录出牌行为
+        if logger.isEnabledFor(logging.INFO):
+            event(logger, logging.INFO, "play", "%s 打出 %d 张牌，表现：%s",
+                  current_player.name, len(play_result["played_cards"]), play_result["behavior"],
+                  game_id=self.game_record.game_id, round_id=self.round_count, player=current_player.name,
+                  played_cards=play_result["played_cards"], remaining_cards=len(current_player.hand))
         self.game_record.record_play(
             player_name=current_player.name,
             played_cards=play_result["played_cards"].copy(),
@@ -230,35 +302,44 @@ class Game:
         Returns:
             Player: 返回需要执行惩罚的玩家
         """
-        # 获取当前轮次的基础信息
-        round_base_info = self.game_record.get_latest_round_info()
-        round_action_info = self.game_record.get_latest_round_actions(next_player.name, include_latest=False)
+        if next_player.policy is not None:
+            # 脚本策略直接读取游戏状态，无需拼装提示词
+            challenge_result, reasoning = next_player.policy.decide_challenge(next_player, self, current_player)
+        else:
+            # 获取当前轮次的基础信息
+            round_base_info = self.game_record.get_latest_round_info()
+            round_action_info = self.game_record.get_latest_round_actions(next_player.name, include_latest=False)
         
-        # 获取质疑决策相关信息
-        challenge_decision_info = self.game_record.get_challenge_decision_info(
-            next_player.name,
-            current_player.name
-        )
+            # 获取质疑决策相关信息
+            challenge_decision_info = self.game_record.get_challenge_decision_info(
+                next_player.name,
+                current_player.name
+            )
 
-        # 获取被质疑玩家的表现
-        challenging_player_behavior = self.game_record.get_latest_play_behavior()
+            # 获取被质疑玩家的表现
+            challenging_player_behavior = self.game_record.get_latest_play_behavior()
 
-        # 检查是否需要添加额外提示
-        extra_hint = "注意：其他玩家手牌均已打空。" if self.check_other_players_no_cards(next_player) else ""
+            # 检查是否需要添加额外提示
+            extra_hint = "注意：其他玩家手牌均已打空。" if self.check_other_players_no_cards(next_player) else ""
 
-        # 让下一位玩家决定是否质疑
-        challenge_result, reasoning = next_player.decide_challenge(
-            round_base_info,
-            round_action_info,
-            challenge_decision_info,
-            challenging_player_behavior,
-            extra_hint
-        )
+            # 让下一位玩家决定是否质疑
+            challenge_result, reasoning = next_player.decide_challenge(
+                round_base_info,
+                round_action_info,
+                challenge_decision_info,
+                challenging_player_behavior,
+                extra_hint
+            )
 
         # 如果选择质疑
         if challenge_result["was_challenged"]:
             # 验证出牌是否合法
             is_valid = self.is_valid_play(played_cards)
+            if logger.isEnabledFor(logging.INFO):
+                event(logger, logging.INFO, "challenge", "%s 质疑 %s，%s",
+                      next_player.name, current_player.name, "质疑失败" if is_valid else "质疑成功",
+                      game_id=self.game_record.game_id, round_id=self.round_count,
+                      challenger=next_player.name, challenged=current_player.name, success=not is_valid)
             
             # 记录质疑结果
             self.game_record.record_challenge(
@@ -288,7 +369,7 @@ class Game:
         Args:
             current_player: 当前玩家（最后一个有手牌的玩家）
         """
-        print(f"系统自动质疑 {current_player.name} 的手牌！")
+        logger.info("系统自动质疑 %s 的手牌！", current_player.name)
         
         # 记录玩家自动出牌
         all_cards = current_player.hand.copy()  # 复制当前手牌以供记录
@@ -317,7 +398,7 @@ class Game:
         )
         
         if is_valid:
-            print(f"系统质疑失败！{current_player.name} 的手牌符合规则。")
+            logger.info("系统质疑失败！%s 的手牌符合规则。", current_player.name)
             # 记录一个特殊的射击结果（无人射击）
             self.game_record.record_shooting(
                 shooter_name="无",
@@ -325,7 +406,7 @@ class Game:
             )
             self.reset_round(record_shooter=False)
         else:
-            print(f"系统质疑成功！{current_player.name} 的手牌违规，将执行射击惩罚。")
+            logger.info("系统质疑成功！%s 的手牌违规，将执行射击惩罚。", current_player.name)
             self.perform_penalty(current_player)
 
     def handle_reflection(self) -> None:
@@ -337,11 +418,25 @@ class Game:
         alive_players = [p for p in self.players if p.alive]
         alive_player_names = [p.name for p in alive_players]
         
+        # 脚本策略玩家由策略自行处理，不调用LLM反思
+        reflecting_players = []
+        for player in alive_players:
+            if player.policy is not None:
+                player.policy.reflect(player, self)
+            else:
+                reflecting_players.append(player)
+        if not reflecting_players:
+            return alive_players
+        
         # 获取当前轮次的相关信息
         round_base_info = self.game_record.get_latest_round_info()
         
+        if self.parallel_reflection:
+            self._reflect_concurrently(reflecting_players, alive_player_names, round_base_info)
+            return alive_players
+        
         # 让每个存活的玩家进行反思
-        for player in alive_players:
+        for player in reflecting_players:
             # 获取针对当前玩家的轮次行动信息
             round_action_info = self.game_record.get_latest_round_actions(player.name, include_latest=True)
             # 获取针对当前玩家的轮次结果
@@ -352,11 +447,98 @@ class Game:
                 alive_players=alive_player_names,
                 round_base_info=round_base_info,
                 round_action_info=round_action_info,
-                round_result=round_result
+                round_result=round_result,
+                batched=self.batch_reflection
             )
 
         return alive_players
 
+    def _reflect_concurrently(self, reflecting_players: List[Player], alive_player_names: List[str], round_base_info: str) -> None:
+        """
+        并发执行所有（反思者, 反思对象）组合的反思请求，全部完成后再统一写回印象
+        
+        请求由进程内共享的异步客户端在后台事件循环中发出。每个请求只读取已结束的轮次记录和反思者此前的印象，结果按固定顺序写回，
+        因此最终印象与顺序执行时一致。
+        """
+        round_infos = {
+            player.name: (
+                self.game_record.get_latest_round_actions(player.name, include_latest=True),
+                self.game_record.get_latest_round_result(player.name)
+            )
+            for player in reflecting_players
+        }
+        
+        batch_opinions, tasks, opinions = run_async(
+            self._areflect(reflecting_players, alive_player_names, round_base_info, round_infos)
+        )
+        
+        for player in reflecting_players:
+            if player.name in batch_opinions:
+                player.opinions.update(batch_opinions[player.name])
+                logger.info("%s 更新了对 %s 的印象", player.name, "、".join(batch_opinions[player.name]))
+        for (player, target_name), opinion in zip(tasks, opinions):
+            if opinion is not None:
+                player.opinions[target_name] = opinion
+                logger.info("%s 更新了对 %s 的印象", player.name, target_name)
+
+    async def _areflect(self, reflecting_players: List[Player], alive_player_names: List[str], round_base_info: str,
+                        round_infos: Dict[str, Tuple[str, str]]):
+        """
+        在共享事件循环中并发发出反思请求，同时进行的请求数不超过 reflection_workers
+        
+        Returns:
+            tuple: (批量反思成功的印象, 逐个反思的 (反思者, 反思对象) 列表, 对应的新印象)
+        """
+        limit = asyncio.Semaphore(self.reflection_workers)
+        
+        async def limited(coroutine):
+            async with limit:
+                return await coroutine
+        
+        # 批量模式：每个反思者一次请求，验证失败的反思者回退到逐个反思
+        batch_opinions = {}
+        if self.batch_reflection:
+            results = await asyncio.gather(*(
+                limited(player.areflect_batch(
+                    [name for name in alive_player_names if name != player.name],
+                    round_base_info,
+                    *round_infos[player.name]
+                ))
+                for player in reflecting_players
+            ))
+            for player, opinions in zip(reflecting_players, results):
+                if opinions is not None:
+                    batch_opinions[player.name] = opinions
+                else:
+                    logger.info("%s 的批量反思失败，改为逐个反思", player.name)
+        
+        tasks = [
+            (player, target_name)
+            for player in reflecting_players if player.name not in batch_opinions
+            for target_name in alive_player_names if target_name != player.name
+        ]
+        opinions = await asyncio.gather(*(
+            limited(player.areflect_on_player(target_name, round_base_info, *round_infos[player.name]))
+            for player, target_name in tasks
+        ))
+        return batch_opinions, tasks, opinions
+
+    def _warm_challenge_prefix(self, current_player: Player, next_player: Player) -> None:
+        """
+        提交下家质疑提示词前缀的预热请求
+        
+        质疑时使用的操作信息不包含最新一次出牌，因此出牌前包含全部已有操作的信息与之相同；
+        质疑决策信息（开枪次数、印象）也不受这次出牌影响。前缀在当前线程中生成，读取的是此刻的手牌和记录，
+        后台线程只负责发出请求；上一次尚未开始的预热已经过时，提交前先取消。
+        """
+        round_base_info = self.game_record.get_latest_round_info()
+        round_action_info = self.game_record.get_latest_round_actions(next_player.name, include_latest=True)
+        challenge_decision_info = self.game_record.get_challenge_decision_info(next_player.name, current_player.name)
+        prefix = next_player.challenge_prefix(round_base_info, round_action_info, challenge_decision_info)
+        if self._speculation_future is not None:
+            self._speculation_future.cancel()
+        self._speculation_future = self._speculation_executor.submit(next_player.warm_challenge_prefix, prefix)
+
     def play_round(self) -> None:
         """执行一轮游戏逻辑"""
         current_player = self.players[self.current_player_idx]
@@ -366,13 +548,18 @@ class Game:
             self.handle_system_challenge(current_player)
             return
 
-        print(f"\n轮到 {current_player.name} 出牌, 目标牌是 {self.target_card}")
-        current_player.print_status()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("\n轮到 %s 出牌, 目标牌是 %s", current_player.name, self.target_card)
+            current_player.log_status()
 
         # 找到下一位有手牌的玩家
         next_idx = self.find_next_player_with_cards(self.current_player_idx)
         next_player = self.players[next_idx]
 
+        # 在当前玩家思考时预热下家的质疑提示词
+        if self._speculation_executor is not None and next_player != current_player and next_player.policy is None:
+            self._warm_challenge_prefix(current_player, next_player)
+
         # 处理出牌环节
         played_cards = self.handle_play_cards(current_player, next_player)
 
@@ -382,8 +569,7 @@ class Game:
             if player_to_penalize:
                 self.perform_penalty(player_to_penalize)
                 return
-            else:
-                print(f"{next_player.name} 选择不质疑，游戏继续。")
+            logger.info("%s 选择不质疑，游戏继续。", next_player.name)
                 
         # 切换至下一玩家
         self.current_player_idx = next_idx
@@ -393,8 +579,14 @@ class Game:
         self.deal_cards()
         self.choose_target_card()
         self.start_round_record()
-        while not self.game_over:
-            self.play_round()
+        try:
+            while not self.game_over:
+                self.play_round()
+        finally:
+            if self._speculation_executor is not None:
+                self._speculation_executor.shutdown(wait=True, cancel_futures=True)
+            if self.game_record.index is not None:
+                self.game_record.index.close()
 
 if __name__ == '__main__':
     # 配置玩家信息, 其中model为你通过API调用的模型名称
@@ -417,6 +609,8 @@ if __name__ == '__main__':
         }
     ]
 
+    configure_logging("INFO")
+
     print("游戏开始！玩家配置如下：")
     for config in player_configs:
         print(f"玩家：{config['name']}, 使用模型：{config['model']}")
@@ -1,104 +1,230 @@
 import os
 import json
+import argparse
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 from collections import defaultdict, Counter
+from record_stream import load_game
 
-def analyze_game_records(folder_path):
-    # 初始化统计数据结构
-    stats = {
+# 默认的统计缓存文件，记录每个游戏记录文件的统计结果
+DEFAULT_CACHE_PATH = "game_analyze_cache.sqlite3"
+
+def _new_stats():
+    return {
         'wins': Counter(),
         'shots_fired': Counter(),
         'survival_points': Counter(),
         'matchups': defaultdict(lambda: defaultdict(int)),  # A和B之间的对决次数记录
         'win_counts': defaultdict(lambda: defaultdict(int))  # A对B的胜利次数
     }
-    
-    player_names = set()
-    game_count = 0
-    
-    # 遍历文件夹中的所有JSON文件
-    for filename in os.listdir(folder_path):
-        if not filename.endswith('.json'):
-            continue
-            
-        file_path = os.path.join(folder_path, filename)
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                game_data = json.load(f)
-                
-            # 跳过没有赢家的游戏
-            if game_data.get('winner') is None:
-                continue
-                
-            game_count += 1
-            
-            # 记录玩家名称
-            for player in game_data.get('player_names', []):
-                player_names.add(player)
-                
-            # 统计获胜情况
-            winner = game_data.get('winner')
-            if winner:
-                stats['wins'][winner] += 1
-            
-            # 分析每一轮的数据
-            rounds = game_data.get('rounds', [])
-            for round_data in rounds:
-                # 统计开枪情况
-                round_result = round_data.get('round_result', {})
-                shooter = round_result.get('shooter_name')
-                if shooter:
-                    stats['shots_fired'][shooter] += 1
-                
-                # 分析挑战对决情况
-                play_history = round_data.get('play_history', [])
-                for play in play_history:
-                    player = play.get('player_name')
-                    next_player = play.get('next_player')
-                    was_challenged = play.get('was_challenged')
-                    
-                    if was_challenged and next_player:
-                        challenge_result = play.get('challenge_result')
-                        
-                        # 记录对决次数 - 只记录一个方向，避免重复计数
-                        # 确保按照字母顺序记录，使得对决始终以相同方式计数
-                        if player < next_player:
-                            stats['matchups'][player][next_player] += 1
-                        else:
-                            stats['matchups'][next_player][player] += 1
-                        
-                        # 记录谁赢了这次对决
-                        if challenge_result is True:  # 挑战成功，next_player赢
-                            stats['win_counts'][next_player][player] += 1
-                        elif challenge_result is False:  # 挑战失败，player赢
-                            stats['win_counts'][player][next_player] += 1
-            
-            # 计算存活积分
-            # 首先确定淘汰顺序
-            elimination_order = []
-            alive_players = set(game_data.get('player_names', []))
-            
-            for round_data in rounds:
-                round_result = round_data.get('round_result', {})
-                shooter = round_result.get('shooter_name')
-                bullet_hit = round_result.get('bullet_hit')
-                
-                if shooter and bullet_hit and shooter in alive_players:
+
+class GameStats:
+    """可合并的统计结果
+
+    每局游戏的统计只与该局有关，因此单个文件、一批文件或多台机器上的统计结果都可以通过 merge 累加，
+    snapshot 导出为可以写入JSON的字典，用于缓存和跨进程、跨分片传递。
+    """
+    def __init__(self):
+        self.game_count = 0
+        self.player_names = set()
+        self.stats = _new_stats()
+
+    def add_game(self, game_data):
+        """
+        按轮次顺序遍历一次，同时统计开枪、对决和淘汰顺序
+
+        返回:
+            是否计入统计（没有赢家的游戏会被跳过）
+        """
+        # 跳过没有赢家的游戏
+        winner = game_data.get('winner')
+        if winner is None:
+            return False
+
+        stats = self.stats
+        self.game_count += 1
+        player_names = game_data.get('player_names', [])
+        self.player_names.update(player_names)
+        if winner:
+            stats['wins'][winner] += 1
+
+        elimination_order = []
+        alive_players = set(player_names)
+        for round_data in game_data.get('rounds', []):
+            # 分析挑战对决情况
+            for play in round_data.get('play_history', []):
+                player = play.get('player_name')
+                next_player = play.get('next_player')
+                if play.get('was_challenged') and next_player:
+                    challenge_result = play.get('challenge_result')
+
+                    # 记录对决次数 - 只记录一个方向，避免重复计数
+                    if player < next_player:
+                        stats['matchups'][player][next_player] += 1
+                    else:
+                        stats['matchups'][next_player][player] += 1
+
+                    # 记录谁赢了这次对决
+                    if challenge_result is True:  # 挑战成功，next_player赢
+                        stats['win_counts'][next_player][player] += 1
+                    elif challenge_result is False:  # 挑战失败，player赢
+                        stats['win_counts'][player][next_player] += 1
+
+            # 统计开枪情况并确定淘汰顺序
+            round_result = round_data.get('round_result') or {}
+            shooter = round_result.get('shooter_name')
+            if shooter:
+                stats['shots_fired'][shooter] += 1
+                if round_result.get('bullet_hit') and shooter in alive_players:
                     elimination_order.append(shooter)
                     alive_players.remove(shooter)
-            
-            # 将剩余存活的玩家按照游戏结束时的顺序添加到淘汰顺序中
-            elimination_order.extend(alive_players)
-            
-            # 计算每个玩家的存活积分
-            # 如果有n个玩家，第一个淘汰的玩家得0分，第二个得1分，以此类推
-            for i, player in enumerate(elimination_order):
-                if i > 0:  # 第一个淘汰的不得分
-                    stats['survival_points'][player] += i
-                    
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
-    
-    # 计算对决胜率
+
+        # 将剩余存活的玩家添加到淘汰顺序中
+        elimination_order.extend(alive_players)
+
+        # 如果有n个玩家，第一个淘汰的玩家得0分，第二个得1分，以此类推
+        for i, player in enumerate(elimination_order):
+            if i > 0:
+                stats['survival_points'][player] += i
+        return True
+
+    def merge(self, other):
+        """合并另一份统计结果（GameStats 或 snapshot() 导出的字典）"""
+        if isinstance(other, GameStats):
+            other = other.snapshot()
+        self.game_count += other['game_count']
+        self.player_names.update(other['player_names'])
+        for key in ('wins', 'shots_fired', 'survival_points'):
+            self.stats[key].update(other[key])
+        for key in ('matchups', 'win_counts'):
+            for player, counts in other[key].items():
+                for opponent, count in counts.items():
+                    self.stats[key][player][opponent] += count
+
+    def snapshot(self):
+        """导出为只包含基本类型的字典"""
+        snapshot = {'game_count': self.game_count, 'player_names': sorted(self.player_names)}
+        for key in ('wins', 'shots_fired', 'survival_points'):
+            snapshot[key] = dict(self.stats[key])
+        for key in ('matchups', 'win_counts'):
+            snapshot[key] = {player: dict(counts) for player, counts in self.stats[key].items()}
+        return snapshot
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        game_stats = cls()
+        game_stats.merge(snapshot)
+        return game_stats
+
+    def result(self):
+        """返回与 print_statistics 参数一致的 (stats, win_rates, game_count, player_names)"""
+        return self.stats, compute_win_rates(self.stats, self.player_names), self.game_count, self.player_names
+
+class SummaryCache:
+    """按文件路径、修改时间和大小缓存每个游戏记录文件的统计结果（SQLite）
+
+    文件被修改或替换后修改时间或大小会变化，对应的缓存自动失效；未结束的游戏也会被缓存（为空），
+    游戏结束重新保存后再统计。
+    """
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, summary TEXT)"
+        )
+        self._conn.commit()
+
+    def load(self):
+        """返回 {路径: (修改时间, 大小, 统计结果或None)}"""
+        rows = self._conn.execute("SELECT path, mtime_ns, size, summary FROM summaries")
+        return {path: (mtime_ns, size, json.loads(summary)) for path, mtime_ns, size, summary in rows}
+
+    def put_many(self, entries):
+        """写入 (路径, 修改时间, 大小, 统计结果或None) 列表"""
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO summaries (path, mtime_ns, size, summary) VALUES (?, ?, ?, ?)",
+            [(path, mtime_ns, size, json.dumps(summary, ensure_ascii=False)) for path, mtime_ns, size, summary in entries]
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+def summarize_file(file_path):
+    """
+    统计单个游戏记录文件
+
+    返回:
+        (统计结果快照或None, 错误信息或None)；没有赢家的游戏统计结果为None
+    """
+    try:
+        # 流式读取，跳过统计用不到的推理内容和玩家印象
+        game_data = load_game(file_path)
+        game_stats = GameStats()
+        if not game_stats.add_game(game_data):
+            return None, None
+        return game_stats.snapshot(), None
+    except Exception as e:
+        return None, str(e)
+
+def analyze_game_records(folder_path, workers=None, cache_path=None):
+    """
+    统计目录中的所有游戏记录
+
+    参数:
+        folder_path: 游戏记录目录
+        workers: 并行解析文件的进程数，默认为CPU核数；为1时在当前进程中逐个解析
+        cache_path: 统计缓存文件路径，为None时不使用缓存；再次运行时只解析新增或修改过的文件
+    返回:
+        (stats, win_rates, game_count, player_names)
+    """
+    return collect_game_stats(folder_path, workers, cache_path).result()
+
+def collect_game_stats(folder_path, workers=None, cache_path=None):
+    """统计目录中的所有游戏记录，返回可合并的 GameStats，参数同 analyze_game_records"""
+    cache = SummaryCache(cache_path) if cache_path else None
+    cached = cache.load() if cache else {}
+
+    total = GameStats()
+    pending = []
+    for filename in sorted(os.listdir(folder_path)):
+        if not filename.endswith('.json'):
+            continue
+        file_path = os.path.abspath(os.path.join(folder_path, filename))
+        stat = os.stat(file_path)
+        entry = cached.get(file_path)
+        if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            if entry[2] is not None:
+                total.merge(entry[2])
+        else:
+            pending.append((file_path, stat.st_mtime_ns, stat.st_size))
+
+    paths = [file_path for file_path, _, _ in pending]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as executor:
+            results = list(executor.map(summarize_file, paths, chunksize=max(1, len(paths) // (workers * 4))))
+    else:
+        results = [summarize_file(file_path) for file_path in paths]
+
+    new_entries = []
+    for (file_path, mtime_ns, size), (summary, error) in zip(pending, results):
+        if error is not None:
+            # 出错的文件不缓存，修复后下次运行会重新解析
+            print(f"Error processing {os.path.basename(file_path)}: {error}")
+            continue
+        if summary is not None:
+            total.merge(summary)
+        new_entries.append((file_path, mtime_ns, size, summary))
+
+    if cache:
+        cache.put_many(new_entries)
+        cache.close()
+    return total
+
+def compute_win_rates(stats, player_names):
+    """根据对决次数和胜利次数计算两两之间的对决胜率"""
     win_rates = {}
     for player in player_names:
         win_rates[player] = {}
@@ -115,8 +241,64 @@ def analyze_game_records(folder_path):
                     win_rates[player][opponent] = wins / total_matchups
                 else:
                     win_rates[player][opponent] = 0
-    
-    return stats, win_rates, game_count, player_names
+    return win_rates
+
+def analyze_game_tables(table_dir):
+    """
+    从 columnar_export.py 导出的列式表中统计，结果与 analyze_game_records 相同
+
+    只读取 games、shots 和 plays 表中需要的列，不解析出牌理由和推理内容，适合大量对局。
+    需要安装 pyarrow。
+    """
+    import pyarrow.compute as pc
+    from columnar_export import finished_games_filter, read_table
+
+    aggregate = GameStats()
+    stats = aggregate.stats
+    games = read_table(table_dir, "games", ["game_id", "player_names", "winner"])
+    shots = finished_games_filter(read_table(table_dir, "shots", ["game_id", "shooter_name", "bullet_hit"]), games)
+    plays = read_table(table_dir, "plays", ["game_id", "player_name", "next_player", "was_challenged", "challenge_result"])
+    plays = finished_games_filter(plays.filter(pc.fill_null(plays["was_challenged"], False)), games)
+    games = games.filter(pc.is_valid(games["winner"]))
+
+    aggregate.game_count = games.num_rows
+    aggregate.player_names = set(pc.unique(pc.list_flatten(games["player_names"])).to_pylist())
+    stats['wins'].update(games["winner"].to_pylist())
+    stats['shots_fired'].update(shots["shooter_name"].to_pylist())
+
+    # 对决次数和胜负：先按 (出牌方, 质疑方, 质疑结果) 分组计数，再按与逐局统计相同的规则累加
+    grouped = plays.group_by(["player_name", "next_player", "challenge_result"]).aggregate([([], "count_all")])
+    for player, next_player, challenge_result, count in zip(*(grouped[name].to_pylist() for name in
+                                                               ("player_name", "next_player", "challenge_result", "count_all"))):
+        if not next_player:
+            continue
+        if player < next_player:
+            stats['matchups'][player][next_player] += count
+        else:
+            stats['matchups'][next_player][player] += count
+        if challenge_result is True:
+            stats['win_counts'][next_player][player] += count
+        elif challenge_result is False:
+            stats['win_counts'][player][next_player] += count
+
+    # 存活积分：按轮次顺序确定淘汰顺序（shots 表按游戏和轮次顺序导出）
+    eliminations = defaultdict(list)
+    for game_id, shooter, bullet_hit in zip(*(shots[name].to_pylist() for name in ("game_id", "shooter_name", "bullet_hit"))):
+        if bullet_hit:
+            eliminations[game_id].append(shooter)
+    for game_id, names in zip(games["game_id"].to_pylist(), games["player_names"].to_pylist()):
+        elimination_order = []
+        alive_players = set(names)
+        for shooter in eliminations.get(game_id, []):
+            if shooter in alive_players:
+                elimination_order.append(shooter)
+                alive_players.remove(shooter)
+        elimination_order.extend(alive_players)
+        for i, player in enumerate(elimination_order):
+            if i > 0:
+                stats['survival_points'][player] += i
+
+    return aggregate.result()
 
 def print_statistics(stats, win_rates, game_count, player_names):
     players = sorted(list(player_names))
@@ -157,6 +339,28 @@ def print_statistics(stats, win_rates, game_count, player_names):
                 print(f"{player} vs {opponent:<10} {matchups:<10} {wins:<10} {win_rate:.1f}%")
 
 if __name__ == "__main__":
-    folder_path = "game_records"  # 替换为实际的文件夹路径
-    stats, win_rates, game_count, player_names = analyze_game_records(folder_path)
+    parser = argparse.ArgumentParser(description='统计所有对局数据')
+    parser.add_argument('folder', nargs='?', default=None, help='游戏记录目录 (默认: game_records，只合并统计结果时默认不读取)')
+    parser.add_argument('--tables', default=None, help='读取 columnar_export.py 导出的列式表目录，而不是逐个读取json记录')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='并行解析记录的进程数 (默认: CPU核数)')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help=f'统计缓存文件，再次运行时只解析新增或修改过的记录 (默认: {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--no-cache', action='store_true', help='不使用统计缓存')
+    parser.add_argument('--partial-out', default=None, help='将统计结果导出为JSON，可以之后与其他分片的结果合并')
+    parser.add_argument('--merge', nargs='+', default=[], metavar='PARTIAL', help='合并 --partial-out 导出的统计结果，同时指定记录目录时一并统计')
+    args = parser.parse_args()
+
+    if args.tables:
+        stats, win_rates, game_count, player_names = analyze_game_tables(args.tables)
+    else:
+        folder_path = args.folder or (None if args.merge else "game_records")
+        game_stats = GameStats()
+        if folder_path:
+            game_stats = collect_game_stats(folder_path, args.workers, None if args.no_cache else args.cache)
+        for partial_path in args.merge:
+            with open(partial_path, 'r', encoding='utf-8') as f:
+                game_stats.merge(json.load(f))
+        if args.partial_out:
+            with open(args.partial_out, 'w', encoding='utf-8') as f:
+                json.dump(game_stats.snapshot(), f, ensure_ascii=False)
+        stats, win_rates, game_count, player_names = game_stats.result()
     print_statistics(stats, win_rates, game_count, player_names)
\ No newline at end of file
@@ -0,0 +1,85 @@
+import json
+import logging
+import sys
+from typing import Optional, Union
+
+# 项目内所有日志记录器的根名称
+ROOT_LOGGER_NAME = "liars_bar"
+
+def get_logger(name: str) -> logging.Logger:
+    """获取项目内的日志记录器，例如 get_logger("game") -> liars_bar.game"""
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+class JsonEventFormatter(logging.Formatter):
+    """将日志格式化为一行JSON
+
+    通过 extra={"event": 事件名, "data": {...}} 传入的结构化字段会原样写入，
+    便于之后用脚本过滤和统计，而不必解析面向人的文本。
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.process,
+            "message": record.getMessage(),
+        }
+        event = getattr(record, "event", None)
+        if event is not None:
+            entry["event"] = event
+        data = getattr(record, "data", None)
+        if data:
+            entry["data"] = data
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def _parse_level(level: Union[int, str]) -> int:
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(level.upper())
+    if not isinstance(value, int):
+        raise ValueError(f"未知的日志级别: {level}")
+    return value
+
+def configure_logging(level: Union[int, str] = "WARNING", json_path: Optional[str] = None,
+                      json_level: Union[int, str] = "INFO") -> None:
+    """
+    配置项目日志：控制台输出面向人的文本，可选地将结构化事件追加写入JSONL文件
+
+    未调用时只有WARNING及以上的消息会输出到stderr（logging模块的默认行为），
+    批量运行因此默认是安静的；交互运行单局游戏时使用INFO，查看完整的LLM请求和响应时使用DEBUG。
+    重复调用会替换之前的配置，可以在工作进程中再次调用。
+
+    Args:
+        level: 控制台日志级别
+        json_path: JSON事件文件路径，为None时不写入；多个进程可以追加写入同一个文件
+        json_level: JSON事件文件的日志级别
+    """
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+    console_level = _parse_level(level)
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(console_level)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    root.addHandler(console)
+    effective_level = console_level
+
+    if json_path:
+        file_level = _parse_level(json_level)
+        sink = logging.FileHandler(json_path, mode="a", encoding="utf-8")
+        sink.setLevel(file_level)
+        sink.setFormatter(JsonEventFormatter())
+        root.addHandler(sink)
+        effective_level = min(effective_level, file_level)
+
+    root.setLevel(effective_level)
+    root.propagate = False
+
+def event(logger: logging.Logger, level: int, event_name: str, message: str, *args, **data) -> None:
+    """记录一条带结构化字段的事件，级别未启用时不做任何格式化"""
+    if logger.isEnabledFor(level):
+        logger.log(level, message, *args, extra={"event": event_name, "data": data})
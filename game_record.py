@@ -1,13 +1,36 @@
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, TYPE_CHECKING
 import datetime
 import json
 import os
+import tempfile
+import uuid
+from game_logging import get_logger
+from trace_store import Trace, TraceStore, default_trace_directory
+
+if TYPE_CHECKING:
+    from record_index import RecordIndex
+
+logger = get_logger("game_record")
 
 def generate_game_id():
-    """生成包含时间信息的游戏ID"""
+    """生成包含时间信息的游戏ID，附加随机后缀保证同一秒开始的游戏ID不冲突"""
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    return timestamp
+    return f"{timestamp}_{uuid.uuid4().hex[:8]}"
+
+def _atomic_write_json(file_path: str, data: Dict) -> None:
+    """先写入同目录下的临时文件再原子替换，写入中途崩溃不会留下被截断的文件"""
+    directory = os.path.dirname(file_path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(file_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(data, file, indent=4, ensure_ascii=False)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
 
 @dataclass
 class PlayerInitialState:
@@ -37,8 +60,9 @@ class PlayAction:
     was_challenged: bool = False
     challenge_reason: Optional[str] = None
     challenge_result: Optional[bool] = None
-    play_thinking: Optional[str] = None
-    challenge_thinking: Optional[str] = None
+    # 推理内容：文本，或开启推理存储时的引用 {"ref": ..., "length": ...}
+    play_thinking: Trace = None
+    challenge_thinking: Trace = None
     
     def to_dict(self) -> Dict:
         return {
@@ -55,7 +79,7 @@ class PlayAction:
             "challenge_thinking": self.challenge_thinking
         }
     
-    def update_challenge(self, was_challenged: bool, reason: str, result: bool, challenge_thinking: str = None) -> None:
+    def update_challenge(self, was_challenged: bool, reason: str, result: bool, challenge_thinking: Trace = None) -> None:
         """更新质疑信息"""
         self.was_challenged = was_challenged
         self.challenge_reason = reason
@@ -74,6 +98,34 @@ class ShootingResult:
             "bullet_hit": self.bullet_hit,
         }
 
+class OpinionStore:
+    """按玩家保存印象的历史版本
+
+    每个版本是某个玩家在某一轮开始时对其他玩家印象的快照，内容未变化时复用上一个版本。
+    淘汰玩家和反思失败的玩家印象不再变化，长对局中各轮只需引用已有版本，不必重复保存快照。
+    """
+    def __init__(self):
+        self._versions: Dict[str, List[Dict[str, str]]] = {}
+
+    def commit(self, player_name: str, opinions: Dict[str, str]) -> int:
+        """
+        保存玩家当前的印象，内容与最新版本相同时不新建版本
+        
+        Args:
+            player_name: 玩家名称
+            opinions: 玩家对其他玩家的印象，会被复制，之后修改不影响已保存的版本
+        Returns:
+            int: 版本号
+        """
+        versions = self._versions.setdefault(player_name, [])
+        if not versions or versions[-1] != opinions:
+            versions.append(dict(opinions))
+        return len(versions) - 1
+
+    def get(self, player_name: str, version: int) -> Dict[str, str]:
+        """返回玩家某个版本的印象（只读，调用方不应修改）"""
+        return self._versions[player_name][version]
+
 @dataclass
 class RoundRecord:
     """记录一轮游戏"""
@@ -82,9 +134,23 @@ class RoundRecord:
     starting_player: str
     player_initial_states: List[PlayerInitialState]
     round_players: List[str] = field(default_factory=list)
-    player_opinions: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    # 本轮开始时各玩家印象在 opinion_store 中的版本号
+    opinion_versions: Dict[str, int] = field(default_factory=dict)
+    opinion_store: OpinionStore = field(default_factory=OpinionStore, repr=False, compare=False)
     play_history: List[PlayAction] = field(default_factory=list)
     round_result: Optional[ShootingResult] = None
+
+    @property
+    def player_opinions(self) -> Dict[str, Dict[str, str]]:
+        """本轮开始时各玩家对其他玩家的印象"""
+        return {name: self.opinion_store.get(name, version) for name, version in self.opinion_versions.items()}
+
+    def get_opinion(self, self_player: str, target_player: str) -> str:
+        """本轮开始时 self_player 对 target_player 的印象"""
+        version = self.opinion_versions.get(self_player)
+        if version is None:
+            return "还不了解这个玩家"
+        return self.opinion_store.get(self_player, version).get(target_player, "还不了解这个玩家")
     
     def to_dict(self) -> Dict:
         return {
@@ -215,7 +281,7 @@ class RoundRecord:
         """
         self_gun = next((ps.current_gun_position for ps in self.player_initial_states if ps.player_name == self_player), None)
         other_gun = next((ps.current_gun_position for ps in self.player_initial_states if ps.player_name == interacting_player), None)
-        opinion = self.player_opinions[self_player].get(interacting_player, "还不了解这个玩家")
+        opinion = self.get_opinion(self_player, interacting_player)
         
         return (f"{interacting_player}是你的下家，决定是否质疑你的出牌。\n"
                 f"你已经开了{self_gun}枪，{interacting_player}开了{other_gun}枪。"
@@ -232,7 +298,7 @@ class RoundRecord:
         """
         self_gun = next((ps.current_gun_position for ps in self.player_initial_states if ps.player_name == self_player), None)
         other_gun = next((ps.current_gun_position for ps in self.player_initial_states if ps.player_name == interacting_player), None)
-        opinion = self.player_opinions[self_player].get(interacting_player, "还不了解这个玩家")
+        opinion = self.get_opinion(self_player, interacting_player)
         
         return (f"你正在判断是否质疑{interacting_player}的出牌。\n"
                 f"你已经开了{self_gun}枪，{interacting_player}开了{other_gun}枪。"
@@ -241,45 +307,98 @@ class RoundRecord:
 @dataclass
 class GameRecord:
     """完整游戏记录"""
-    def __init__(self):
-        self.game_id: str = generate_game_id()
+    def __init__(self, game_id: Optional[str] = None, event_log: bool = False,
+                 save_directory: Optional[str] = "game_records", offload_thinking: bool = False,
+                 index: Optional["RecordIndex"] = None):
+        """
+        Args:
+            game_id: 游戏ID，默认根据当前时间生成
+            event_log: 是否使用追加写入的JSONL事件日志代替每次射击后重写完整记录，
+                游戏结束时再压缩为完整的JSON记录
+            save_directory: 记录保存目录，为None时只在内存中记录、不写文件
+            offload_thinking: 是否将推理内容压缩保存到记录目录下的 traces 推理存储，
+                记录中只保留引用和字符数，每次自动保存不必重写大段推理文本
+            index: 实时写入的游戏记录索引（见 record_index.py），游戏进行中即可查询
+        """
+        self.game_id: str = game_id or generate_game_id()
         self.player_names: List[str] = []
+        self.player_models: Dict[str, str] = {}
         self.rounds: List[RoundRecord] = []
         self.winner: Optional[str] = None
-        self.save_directory: str = "game_records"
+        self.save_directory: Optional[str] = save_directory
+        self.event_log: bool = event_log and save_directory is not None
+        self._event_file = None
+        self.opinion_store = OpinionStore()
+        self.trace_store: Optional[TraceStore] = (
+            TraceStore(default_trace_directory(save_directory)) if offload_thinking and save_directory is not None else None
+        )
+        self.index = index
         
-        # 确保保存目录存在
-        if not os.path.exists(self.save_directory):
-            os.makedirs(self.save_directory)
+        # 确保保存目录存在（多进程同时创建时不报错）
+        if self.save_directory is not None:
+            os.makedirs(self.save_directory, exist_ok=True)
     
     def to_dict(self) -> Dict:
-        return {
-            "game_id": self.game_id,
-            "player_names": self.player_names,
-            "rounds": [round.to_dict() for round in self.rounds],
-            "winner": self.winner,
-        }
+        data = {"game_id": self.game_id, "player_names": self.player_names}
+        if self.player_models:
+            data["player_models"] = self.player_models
+        data["rounds"] = [round.to_dict() for round in self.rounds]
+        data["winner"] = self.winner
+        return data
     
-    def start_game(self, player_names: List[str]) -> None:
-        """初始化游戏，记录玩家信息"""
+    def start_game(self, player_names: List[str], player_models: Optional[Dict[str, str]] = None) -> None:
+        """初始化游戏，记录玩家信息
+
+        Args:
+            player_names: 玩家名称
+            player_models: 玩家名称到所用模型（或脚本策略）的映射，供索引按模型查询
+        """
         self.player_names = player_names
+        self.player_models = player_models or {}
+        if self.event_log:
+            game_data = {"game_id": self.game_id, "player_names": player_names}
+            if self.player_models:
+                game_data["player_models"] = self.player_models
+            self._append_event("game_start", game_data)
+        if self.index is not None:
+            self.index.begin_game(self.game_id, player_names, self.player_models, self._record_path())
     
     def start_round(self, round_id: int, target_card: str, round_players: List[str], starting_player: str, player_initial_states: List[PlayerInitialState], player_opinions: Dict[str, Dict[str, str]]) -> None:
-        """开始新的一轮游戏"""
+        """开始新的一轮游戏，player_opinions 会保存为印象版本，之后修改不影响记录"""
+        previous_versions = self.rounds[-1].opinion_versions if self.rounds else {}
         round_record = RoundRecord(
             round_id=round_id,
             target_card=target_card,
             round_players=round_players,
             starting_player=starting_player,
             player_initial_states=player_initial_states,
-            player_opinions=player_opinions
+            opinion_versions={name: self.opinion_store.commit(name, opinions) for name, opinions in player_opinions.items()},
+            opinion_store=self.opinion_store
         )
         self.rounds.append(round_record)
+        if self.event_log:
+            round_data = round_record.to_dict()
+            del round_data["play_history"], round_data["round_result"]
+            # 事件日志只写入与上一轮相比发生变化的印象，压缩时再与上一轮合并
+            round_data["player_opinions"] = {
+                name: opinions for name, opinions in round_data["player_opinions"].items()
+                if previous_versions.get(name) != round_record.opinion_versions[name]
+            }
+            self._append_event("round_start", round_data)
+        if self.index is not None:
+            self.index.add_round(self.game_id, round_record.to_dict())
+    
+    def _store_trace(self, thinking: Optional[str]) -> Trace:
+        """开启推理存储时将非空的推理内容写入存储并返回引用"""
+        if self.trace_store is None or not thinking:
+            return thinking
+        return self.trace_store.put(thinking)
     
     def record_play(self, player_name: str, played_cards: List[str], remaining_cards: List[str], play_reason: str, behavior: str, next_player: str, play_thinking: str = None) -> None:
         """记录玩家的出牌行为"""
         current_round = self.get_current_round()
         if current_round:
+            play_thinking = self._store_trace(play_thinking)
             play_action = PlayAction(
                 player_name=player_name,
                 played_cards=played_cards,
@@ -290,6 +409,16 @@ class GameRecord:
                 play_thinking=play_thinking
             )
             current_round.add_play_action(play_action)
+            if self.event_log:
+                play_data = play_action.to_dict()
+                for key in ("was_challenged", "challenge_reason", "challenge_result", "challenge_thinking"):
+                    del play_data[key]
+                self._append_event("play", play_data)
+            if self.index is not None:
+                # 索引只需要轮次的目标牌和初始手牌，不必序列化整轮记录
+                round_data = {"round_id": current_round.round_id, "target_card": current_round.target_card,
+                              "player_initial_states": [ps.to_dict() for ps in current_round.player_initial_states]}
+                self.index.add_play(self.game_id, round_data, len(current_round.play_history) - 1, play_action.to_dict())
     
     def record_challenge(self, was_challenged: bool, reason: str = None, result: bool = None, challenge_thinking: str = None) -> None:
         """记录质疑信息"""
@@ -297,7 +426,18 @@ class GameRecord:
         if current_round:
             last_action = current_round.get_last_action()
             if last_action:
+                challenge_thinking = self._store_trace(challenge_thinking)
                 last_action.update_challenge(was_challenged, reason, result, challenge_thinking)
+                if self.event_log:
+                    self._append_event("challenge", {
+                        "was_challenged": was_challenged,
+                        "challenge_reason": reason,
+                        "challenge_result": result,
+                        "challenge_thinking": challenge_thinking
+                    })
+                if self.index is not None:
+                    self.index.update_challenge(self.game_id, current_round.round_id,
+                                                len(current_round.play_history) - 1, was_challenged, reason, result)
     
     def record_shooting(self, shooter_name: str, bullet_hit: bool) -> None:
         """记录射击结果"""
@@ -305,12 +445,31 @@ class GameRecord:
         if current_round:
             shooting_result = ShootingResult(shooter_name=shooter_name, bullet_hit=bullet_hit)
             current_round.set_shooting_result(shooting_result)
-            self.auto_save()  # 射击后自动保存
+            if self.event_log:
+                self._append_event("shooting", shooting_result.to_dict())
+            else:
+                self.auto_save()  # 射击后自动保存
+            if self.index is not None:
+                self.index.add_shot(self.game_id, current_round.round_id, shooter_name, bullet_hit)
     
     def finish_game(self, winner_name: str) -> None:
         """记录胜利者并保存最终结果"""
         self.winner = winner_name
+        if self.event_log:
+            self._append_event("finish", {"winner": winner_name})
+            self._event_file.close()
+            self._event_file = None
         self.auto_save()  # 游戏结束时保存
+        if self.index is not None:
+            self.index.finish_game(self.game_id, winner_name)
+
+    def _append_event(self, event: str, data: Dict) -> None:
+        """向JSONL事件日志追加一条事件（仅写入新事件）"""
+        if self._event_file is None:
+            file_path = os.path.join(self.save_directory, f"{self.game_id}.jsonl")
+            self._event_file = open(file_path, "a", encoding="utf-8")
+        self._event_file.write(json.dumps({"event": event, **data}, ensure_ascii=False) + "\n")
+        self._event_file.flush()
     
     def get_current_round(self) -> Optional[RoundRecord]:
         """获取当前轮次"""
@@ -350,9 +509,104 @@ class GameRecord:
         current_round = self.get_current_round()
         return current_round.get_challenge_decision_info(self_player, interacting_player) if current_round else None
 
+    def _record_path(self) -> Optional[str]:
+        """完整JSON记录的保存路径，不保存文件时为None"""
+        if self.save_directory is None:
+            return None
+        return os.path.abspath(os.path.join(self.save_directory, f"{self.game_id}.json"))
+
     def auto_save(self) -> None:
-        """自动保存当前游戏记录到文件"""
+        """自动保存当前游戏记录到文件
+
+        先写入同目录下的临时文件再原子替换，写入中途崩溃不会留下被截断的记录文件
+        """
+        if self.save_directory is None:
+            return
         file_path = os.path.join(self.save_directory, f"{self.game_id}.json")
-        with open(file_path, "w", encoding="utf-8") as file:
-            json.dump(self.to_dict(), file, indent=4, ensure_ascii=False)
-        print(f"游戏记录已自动保存至 {file_path}")
+        _atomic_write_json(file_path, self.to_dict())
+        logger.info("游戏记录已自动保存至 %s", file_path)
+
+def compact_event_log(log_path: str, output_path: Optional[str] = None) -> Dict:
+    """
+    将JSONL事件日志压缩为与 GameRecord.to_dict() 相同结构的完整记录
+    
+    Args:
+        log_path: 事件日志路径（<game_id>.jsonl）
+        output_path: 输出JSON路径，默认为日志同目录下的 <game_id>.json；为空字符串时不写文件
+        
+    Returns:
+        Dict: 完整的游戏记录
+    """
+    game_data = {"game_id": None, "player_names": [], "player_models": {}, "rounds": [], "winner": None}
+    with open(log_path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                # 崩溃时最后一行可能只写了一半
+                break
+            event = data.pop("event")
+            if event == "game_start":
+                game_data["game_id"] = data["game_id"]
+                game_data["player_names"] = data["player_names"]
+                game_data["player_models"] = data.get("player_models", {})
+            elif event == "round_start":
+                # 印象只记录了变化的部分（旧版本日志记录完整印象，合并结果相同）
+                if game_data["rounds"]:
+                    data["player_opinions"] = {**game_data["rounds"][-1]["player_opinions"], **data["player_opinions"]}
+                data["play_history"] = []
+                data["round_result"] = None
+                game_data["rounds"].append(data)
+            elif event == "play":
+                # 按 PlayAction.to_dict() 的键顺序补齐质疑字段，压缩结果与直接保存的记录逐字节相同
+                play_thinking = data.pop("play_thinking", None)
+                data.update({"was_challenged": False, "challenge_reason": None, "challenge_result": None,
+                             "play_thinking": play_thinking, "challenge_thinking": None})
+                game_data["rounds"][-1]["play_history"].append(data)
+            elif event == "challenge":
+                game_data["rounds"][-1]["play_history"][-1].update(data)
+            elif event == "shooting":
+                game_data["rounds"][-1]["round_result"] = data
+            elif event == "finish":
+                game_data["winner"] = data["winner"]
+    
+    # 保持与 to_dict() 一致的键顺序，没有模型信息的旧日志不写出 player_models
+    if not game_data["player_models"]:
+        del game_data["player_models"]
+    game_data["rounds"] = [
+        {key: round_data[key] for key in ("round_id", "target_card", "round_players", "starting_player",
+                                          "player_initial_states", "player_opinions", "play_history", "round_result")}
+        for round_data in game_data["rounds"]
+    ]
+    
+    if output_path is None:
+        output_path = os.path.splitext(log_path)[0] + ".json"
+    if output_path:
+        _atomic_write_json(output_path, game_data)
+    return game_data
+
+def compact_event_logs(directory: str) -> List[str]:
+    """
+    压缩目录中所有比对应JSON记录更新（或没有JSON记录）的事件日志
+    
+    Returns:
+        List[str]: 生成的JSON记录路径
+    """
+    written = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".jsonl"):
+            continue
+        log_path = os.path.join(directory, filename)
+        json_path = os.path.splitext(log_path)[0] + ".json"
+        if os.path.exists(json_path) and os.path.getmtime(json_path) >= os.path.getmtime(log_path):
+            continue
+        compact_event_log(log_path, json_path)
+        written.append(json_path)
+    return written
+
+if __name__ == "__main__":
+    # 将未压缩的事件日志（例如中途中断的游戏）转换为完整JSON记录
+    for path in compact_event_logs("game_records"):
+        print(f"已压缩事件日志：{path}")
@@ -1,127 +1,265 @@
+import io
 import os
-import json
-
-def convert_game_record_to_chinese_text(json_file_path):
-    """将游戏记录转换为中文可读风格文本"""
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        game_data = json.load(f)
-
-    game_id = game_data["game_id"]
-    player_names = game_data["player_names"]
-    rounds = game_data["rounds"]
-    winner = game_data.get("winner", "游戏仍在进行")
-
-    # 开头介绍
-    text = f"游戏编号：{game_id}\n"
-    text += f"玩家列表：{', '.join(player_names)}\n\n"
-    text += "════════════════════════════\n"
-    text += "         游戏开始\n"
-    text += "════════════════════════════\n\n"
-
-    for round_record in rounds:
-        # 每轮开始的分隔符
-        text += "────────────────────────────\n"
-        text += f"第 {round_record['round_id']} 轮\n"
-        text += "────────────────────────────\n"
-        text += f"本轮玩家：{', '.join(round_record['round_players'])}\n"
-        text += f"本轮由 {round_record['starting_player']} 先开始。\n\n"
-
-        # 记录玩家间的意见
-        active_players = round_record["round_players"]
-        for player_name, opinions in round_record["player_opinions"].items():
-            # 只显示本轮参与的玩家的意见
-            if player_name in active_players:
-                text += f"{player_name} 对其他玩家的看法：\n"
-                for other_player, opinion in opinions.items():
-                    if other_player in active_players:
-                        text += f"  - {other_player}: {opinion}\n"
-                text += "\n"
-            
-        text += "开始发牌...\n\n"
-        text += f"本轮目标牌：{round_record['target_card']}\n"
-
-        # 添加player_initial_states的部分
-        if "player_initial_states" in round_record:
-            text += "各玩家初始状态：\n"
-            for player_state in round_record["player_initial_states"]:
-                player_name = player_state["player_name"]
-                bullet_pos = player_state["bullet_position"]
-                gun_pos = player_state["current_gun_position"]
-                initial_hand = ", ".join(player_state["initial_hand"])
+import argparse
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from record_stream import iter_record_events
+from trace_store import default_trace_directory, resolve_trace
+
+def write_game_text(json_file_path, out, include_thinking=False):
+    """将游戏记录转换为中文可读风格文本，边读取边写入 out
+
+    记录按轮次和出牌流式读取，玩家印象之外的大字段（推理内容）只在 include_thinking 为True时读取，
+    保存在推理存储中的推理内容也只在此时读取
+
+    参数:
+        json_file_path: json游戏记录路径
+        out: 文本输出（打开的文件或 io.StringIO）
+        include_thinking: 是否附上出牌和质疑的推理内容
+    """
+    trace_directory = default_trace_directory(os.path.dirname(json_file_path))
+    # 每个事件的文本先收集到列表中，事件结束时一次写入 out
+    parts = []
+    write = parts.append
+    target_card = None
+    winner = "游戏仍在进行"
+
+    for event, data in iter_record_events(json_file_path, include_thinking=include_thinking, include_opinions=True):
+        if event == "game_start":
+            # 开头介绍
+            write(f"游戏编号：{data['game_id']}\n")
+            write(f"玩家列表：{', '.join(data['player_names'])}\n\n")
+            write("════════════════════════════\n")
+            write("         游戏开始\n")
+            write("════════════════════════════\n\n")
+
+        elif event == "round_start":
+            round_record = data
+            target_card = round_record['target_card']
+            # 每轮开始的分隔符
+            write("────────────────────────────\n")
+            write(f"第 {round_record['round_id']} 轮\n")
+            write("────────────────────────────\n")
+            write(f"本轮玩家：{', '.join(round_record['round_players'])}\n")
+            write(f"本轮由 {round_record['starting_player']} 先开始。\n\n")
+
+            # 记录玩家间的意见
+            active_players = round_record["round_players"]
+            for player_name, opinions in round_record["player_opinions"].items():
+                # 只显示本轮参与的玩家的意见
+                if player_name in active_players:
+                    write(f"{player_name} 对其他玩家的看法：\n")
+                    for other_player, opinion in opinions.items():
+                        if other_player in active_players:
+                            write(f"  - {other_player}: {opinion}\n")
+                    write("\n")
                 
-                text += f"{player_name}：\n"
-                text += f"  - 子弹位置：{bullet_pos}\n"
-                text += f"  - 当前弹仓位置：{gun_pos}\n"
-                text += f"  - 初始手牌：{initial_hand}\n\n"
+            write("开始发牌...\n\n")
+            write(f"本轮目标牌：{target_card}\n")
 
-        text += "----------------------------------\n"
-        for action in round_record["play_history"]:
+            # 添加player_initial_states的部分
+            if "player_initial_states" in round_record:
+                write("各玩家初始状态：\n")
+                for player_state in round_record["player_initial_states"]:
+                    player_name = player_state["player_name"]
+                    bullet_pos = player_state["bullet_position"]
+                    gun_pos = player_state["current_gun_position"]
+                    initial_hand = ", ".join(player_state["initial_hand"])
+                    
+                    write(f"{player_name}：\n")
+                    write(f"  - 子弹位置：{bullet_pos}\n")
+                    write(f"  - 当前弹仓位置：{gun_pos}\n")
+                    write(f"  - 初始手牌：{initial_hand}\n\n")
+
+            write("----------------------------------\n")
+
+        elif event == "play":
+            action = data
             # 从 JSON 中获取玩家表现，并结合出牌行为
-            text += f"轮到 {action['player_name']} 出牌\n"
+            write(f"轮到 {action['player_name']} 出牌\n")
             # 从 JSON 中获取玩家表现，并结合出牌行为
-            text += f"{action['player_name']} {action['behavior']}\n"
+            write(f"{action['player_name']} {action['behavior']}\n")
             # 在一行显示出牌和剩余手牌，并在括号中显示目标牌
-            text += f"出牌：{'、'.join(action['played_cards'])}，剩余手牌：{'、'.join(action['remaining_cards'])} (目标牌：{round_record['target_card']})\n"
-            text += f"出牌理由：{action['play_reason']}\n\n"
+            write(f"出牌：{'、'.join(action['played_cards'])}，剩余手牌：{'、'.join(action['remaining_cards'])} (目标牌：{target_card})\n")
+            write(f"出牌理由：{action['play_reason']}\n")
+            if include_thinking:
+                play_thinking = resolve_trace(action.get('play_thinking'), trace_directory)
+                if play_thinking:
+                    write(f"出牌思考过程：{play_thinking}\n")
+            write("\n")
 
             # 不论是否质疑，都显示质疑原因，将理由放在下一行
             if action['was_challenged']:
-                text += f"{action['next_player']} 选择质疑\n"
-                text += f"质疑理由：{action['challenge_reason']}\n"
+                write(f"{action['next_player']} 选择质疑\n")
+                write(f"质疑理由：{action['challenge_reason']}\n")
             else:
-                text += f"{action['next_player']} 选择不质疑\n"
-                text += f"不质疑理由：{action['challenge_reason']}\n"
+                write(f"{action['next_player']} 选择不质疑\n")
+                write(f"不质疑理由：{action['challenge_reason']}\n")
+            if include_thinking:
+                challenge_thinking = resolve_trace(action.get('challenge_thinking'), trace_directory)
+                if challenge_thinking:
+                    write(f"质疑思考过程：{challenge_thinking}\n")
 
             # 质疑过程
             if action['was_challenged']:
                 if action['challenge_result']:
-                    text += f"质疑成功，{action['player_name']} 被揭穿。\n"
+                    write(f"质疑成功，{action['player_name']} 被揭穿。\n")
                 else:
-                    text += f"质疑失败，{action['next_player']} 被惩罚。\n"
-            text += "\n----------------------------------\n"
+                    write(f"质疑失败，{action['next_player']} 被惩罚。\n")
+            write("\n----------------------------------\n")
 
-        # 记录射击结果
-        if round_record['round_result']:
-            result = round_record['round_result']
-            text += f"射击结果：\n"
+        elif event == "shooting":
+            # 记录射击结果
+            result = data
+            write(f"射击结果：\n")
 
             if result["bullet_hit"]:
-                text += f"子弹命中，{result['shooter_name']} 死亡。\n"
+                write(f"子弹命中，{result['shooter_name']} 死亡。\n")
             else:
-                text += f"子弹未击中，{result['shooter_name']} 幸免于难。\n"
+                write(f"子弹未击中，{result['shooter_name']} 幸免于难。\n")
+
+            write("\n")
 
-            text += "\n"
+        elif event == "finish":
+            winner = data.get("winner", winner)
+
+        out.write("".join(parts))
+        parts.clear()
 
     # 游戏结束分隔符和赢家宣布
-    text += "\n════════════════════════════\n"
-    text += "         游戏结束\n"
-    text += "════════════════════════════\n\n"
+    write("\n════════════════════════════\n")
+    write("         游戏结束\n")
+    write("════════════════════════════\n\n")
     
     # 突出显示最终赢家
-    text += "★ ★ ★ ★ ★ ★ ★ ★ ★ ★ ★ ★\n"
-    text += f"    最终胜利者：{winner}\n"
-    text += "★ ★ ★ ★ ★ ★ ★ ★ ★ ★ ★ ★\n"
-    
-    return text
+    write("★ ★ ★ ★ ★ ★ ★ ★ ★ ★ ★ ★\n")
+    write(f"    最终胜利者：{winner}\n")
+    write("★ ★ ★ ★ ★ ★ ★ ★ ★ ★ ★ ★\n")
+    out.write("".join(parts))
+
+def convert_game_record_to_chinese_text(json_file_path, include_thinking=False):
+    """将游戏记录转换为中文可读风格文本并以字符串返回"""
+    buffer = io.StringIO()
+    write_game_text(json_file_path, buffer, include_thinking)
+    return buffer.getvalue()
 
-def process_game_records(input_directory, output_directory):
-    """处理目录中的所有游戏记录 JSON 文件，生成可读风格的 TXT 文件到指定输出目录"""
+def _temp_path(path):
+    """同目录下不会冲突的临时文件路径，由调用方用 open 创建，文件权限与直接写入时相同"""
+    return os.path.join(os.path.dirname(path) or ".", f".{os.path.basename(path)}.{uuid.uuid4().hex[:8]}.tmp")
+
+def _write_text_file(json_file_path, txt_file_path, include_thinking=False):
+    """
+    转换单个记录并写入文本文件，先写入同目录下的临时文件再原子替换，
+    中途失败不会留下比json记录更新、却不完整的文本文件
+
+    返回:
+        出错时返回错误信息，否则返回None
+    """
+    temp_path = _temp_path(txt_file_path)
+    try:
+        try:
+            with open(temp_path, 'x', encoding='utf-8') as txt_file:
+                write_game_text(json_file_path, txt_file, include_thinking)
+            os.replace(temp_path, txt_file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+def _convert_job(job):
+    return _write_text_file(*job)
+
+def is_up_to_date(json_file_path, txt_file_path):
+    """文本文件存在且不早于json记录时无需重新转换"""
+    try:
+        return os.path.getmtime(txt_file_path) >= os.path.getmtime(json_file_path)
+    except OSError:
+        return False
+
+def write_archive(txt_file_paths, archive_path):
+    """将转换后的文本打包为一个zip文件，同样先写入临时文件再原子替换"""
+    os.makedirs(os.path.dirname(archive_path) or ".", exist_ok=True)
+    temp_path = _temp_path(archive_path)
+    try:
+        with zipfile.ZipFile(temp_path, 'x', compression=zipfile.ZIP_DEFLATED) as archive:
+            for txt_file_path in txt_file_paths:
+                archive.write(txt_file_path, os.path.basename(txt_file_path))
+        os.replace(temp_path, archive_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def process_game_records(input_directory, output_directory, include_thinking=False, workers=None,
+                         force=False, archive_path=None):
+    """
+    处理目录中的所有游戏记录 JSON 文件，生成可读风格的 TXT 文件到指定输出目录
+
+    只转换新增或在上次转换后修改过的记录，多个记录在进程池中并行转换
+
+    参数:
+        input_directory: 游戏记录目录
+        output_directory: 文本输出目录
+        include_thinking: 是否附上出牌和质疑的推理内容
+        workers: 并行转换的进程数，默认为CPU核数；为1时在当前进程中逐个转换
+        force: 是否忽略已有的文本文件全部重新转换（例如切换 include_thinking 之后）
+        archive_path: 不为None时，将所有记录的文本额外打包为一个zip文件
+    返回:
+        dict: converted（转换的文件数）、skipped（未变化而跳过的文件数）、failed（转换失败的文件数）
+    """
     # 确保输出目录存在
     os.makedirs(output_directory, exist_ok=True)
-    
-    for filename in os.listdir(input_directory):
-        if filename.endswith('.json'):
-            json_file_path = os.path.join(input_directory, filename)
-            txt_file_path = os.path.join(output_directory, os.path.splitext(filename)[0] + '.txt')
 
-            print(f"正在处理 {filename}...")
-            game_text = convert_game_record_to_chinese_text(json_file_path)
+    txt_file_paths = []
+    jobs = []
+    skipped = 0
+    for filename in sorted(os.listdir(input_directory)):
+        if not filename.endswith('.json'):
+            continue
+        json_file_path = os.path.join(input_directory, filename)
+        txt_file_path = os.path.join(output_directory, os.path.splitext(filename)[0] + '.txt')
+        txt_file_paths.append(txt_file_path)
+        if not force and is_up_to_date(json_file_path, txt_file_path):
+            skipped += 1
+        else:
+            jobs.append((json_file_path, txt_file_path, include_thinking))
 
-            with open(txt_file_path, 'w', encoding='utf-8') as txt_file:
-                txt_file.write(game_text)
-            print(f"已生成：{txt_file_path}")
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            errors = list(executor.map(_convert_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        errors = [_convert_job(job) for job in jobs]
+
+    failed = set()
+    for (json_file_path, txt_file_path, _), error in zip(jobs, errors):
+        if error is not None:
+            print(f"转换 {os.path.basename(json_file_path)} 时出错: {error}")
+            failed.add(txt_file_path)
+
+    if archive_path is not None:
+        write_archive([path for path in txt_file_paths if path not in failed and os.path.exists(path)], archive_path)
+    return {"converted": len(jobs) - len(failed), "skipped": skipped, "failed": len(failed)}
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='将游戏记录转换为中文可读文本')
+    parser.add_argument('--thinking', action='store_true', help='在文本中附上出牌和质疑的推理内容')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='并行转换记录的进程数 (默认: CPU核数)')
+    parser.add_argument('--force', action='store_true', help='重新转换所有记录，包括文本文件比json记录新的记录')
+    parser.add_argument('--archive', default=None, metavar='ZIP', help='将所有记录的文本额外打包为一个zip文件')
+    args = parser.parse_args()
+
     game_records_directory = 'game_records'
     output_directory = 'converted_game_records'  # 新的输出目录
-    process_game_records(game_records_directory, output_directory)
\ No newline at end of file
+    start = time.perf_counter()
+    counts = process_game_records(game_records_directory, output_directory, include_thinking=args.thinking,
+                                  workers=args.workers, force=args.force, archive_path=args.archive)
+    print(f"已转换 {counts['converted']} 个记录，跳过 {counts['skipped']} 个未变化的记录，"
+          f"失败 {counts['failed']} 个，用时 {time.perf_counter() - start:.2f} 秒")
+    if args.archive:
+        print(f"已打包至 {args.archive}")
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+CACHE_MODES = ("passthrough", "record", "replay")
+
+class CacheMissError(RuntimeError):
+    """回放模式下请求的响应不在缓存中"""
+
+class LLMResponseCache:
+    def __init__(self, path: str = "llm_cache.sqlite3"):
+        """基于SQLite的LLM响应缓存，按内容寻址
+
+        Args:
+            path: SQLite数据库文件路径
+        """
+        self.path = path
+        # 并发反思会在多个线程中共享同一连接，由锁保证串行访问
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            # WAL模式允许多个工作进程同时读写同一个缓存文件
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, content TEXT, reasoning_content TEXT, created_at REAL)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, messages, occurrence: int = 0, response_format: Optional[Dict] = None) -> str:
+        """根据模型、消息内容、结构化输出参数和同一请求在本局中出现的次序生成缓存键"""
+        request = {"model": model, "messages": messages, "occurrence": occurrence}
+        # 未启用结构化输出时不写入该字段，已有的缓存键保持不变
+        if response_format is not None:
+            request["response_format"] = response_format
+        payload = json.dumps(request, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """读取缓存的 (content, reasoning_content)，不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, reasoning_content FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, key: str, model: str, content: str, reasoning_content: str) -> None:
+        """写入（覆盖）一条缓存"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, reasoning_content, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, content, reasoning_content or "", time.time())
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+class CachedLLMClient:
+    def __init__(self, cache: LLMResponseCache, mode: str = "record", client=None):
+        """带响应缓存的LLM客户端，接口与 LLMClient 一致
+
+        Args:
+            cache: 响应缓存
+            mode: record - 照常请求LLM并写入缓存；
+                  replay - 只从缓存读取，不访问网络，未命中时抛出 CacheMissError；
+                  passthrough - 不使用缓存
+            client: 实际发起请求的客户端，默认在首次需要时创建 LLMClient
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"未知的缓存模式: {mode}，可选: {', '.join(CACHE_MODES)}")
+        self.cache = cache
+        self.mode = mode
+        self._client = client
+        # 同一请求（如重试时的相同prompt）在本局中第几次出现，用于区分不同的响应
+        self._occurrences = Counter()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def client(self):
+        """实际发起请求的客户端，回放模式下不会被创建"""
+        if self._client is None:
+            from llm_client import LLMClient
+            self._client = LLMClient()
+        return self._client
+
+    def reset_occurrences(self) -> None:
+        """在每局游戏开始时调用，使同一局游戏在录制和回放时得到相同的缓存键"""
+        with self._lock:
+            self._occurrences.clear()
+
+    def _next_key(self, messages, model: str, response_format: Optional[Dict] = None) -> str:
+        base_key = LLMResponseCache.make_key(model, messages, response_format=response_format)
+        with self._lock:
+            occurrence = self._occurrences[base_key]
+            self._occurrences[base_key] += 1
+        return LLMResponseCache.make_key(model, messages, occurrence, response_format)
+
+    def chat(self, messages, model="deepseek-r1", response_format: Optional[Dict] = None):
+        """与LLM交互，根据缓存模式录制或回放响应
+
+        Returns:
+            tuple: (content, reasoning_content)
+        """
+        return self._cached_call(messages, model, response_format, lambda: self.client.chat(
+            messages, model=model, response_format=response_format
+        ))
+
+    def chat_stream(self, messages, model="deepseek-r1", required_keys=(), capture_reasoning: bool = True,
+                    response_format: Optional[Dict] = None):
+        """流式交互，与 LLMClient.chat_stream 一致，根据缓存模式录制或回放响应
+
+        Returns:
+            tuple: (content, reasoning_content)
+        """
+        return self._cached_call(messages, model, response_format, lambda: self.client.chat_stream(
+            messages, model=model, required_keys=required_keys, capture_reasoning=capture_reasoning,
+            response_format=response_format
+        ))
+
+    async def achat(self, messages, model="deepseek-r1", response_format: Optional[Dict] = None):
+        """异步交互，与 LLMClient.achat 一致，根据缓存模式录制或回放响应
+
+        Returns:
+            tuple: (content, reasoning_content)
+        """
+        if self.mode == "passthrough":
+            return await self.client.achat(messages, model=model, response_format=response_format)
+
+        key = self._next_key(messages, model, response_format)
+        if self.mode == "replay":
+            return self._replay(key, model)
+
+        content, reasoning_content = await self.client.achat(messages, model=model, response_format=response_format)
+        self._record(key, model, content, reasoning_content)
+        return content, reasoning_content
+
+    def warm_prefix(self, messages, model="deepseek-r1") -> None:
+        """预热服务端前缀缓存，响应不会被使用，因此不录制；回放模式下不访问网络"""
+        if self.mode != "replay":
+            self.client.warm_prefix(messages, model=model)
+
+    def _cached_call(self, messages, model: str, response_format: Optional[Dict], request) -> Tuple[str, str]:
+        """按缓存模式回放或执行请求并录制"""
+        if self.mode == "passthrough":
+            return request()
+
+        key = self._next_key(messages, model, response_format)
+        if self.mode == "replay":
+            return self._replay(key, model)
+
+        content, reasoning_content = request()
+        self._record(key, model, content, reasoning_content)
+        return content, reasoning_content
+
+    def _replay(self, key: str, model: str) -> Tuple[str, str]:
+        """从缓存读取响应，未命中时抛出 CacheMissError"""
+        cached = self.cache.get(key)
+        if cached is None:
+            self.misses += 1
+            raise CacheMissError(f"缓存未命中: model={model}, key={key[:12]}")
+        self.hits += 1
+        return cached
+
+    def _record(self, key: str, model: str, content: str, reasoning_content: str) -> None:
+        """录制一次响应；空回复不写入缓存（请求失败时客户端抛出异常，不会到达这里）"""
+        if content:
+            self.cache.put(key, model, content, reasoning_content)
@@ -1,54 +1,557 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
+from typing import Dict, Iterable, Optional
+import asyncio
+import contextvars
+import json
+import threading
+import time
+import httpx
 import os
+from game_logging import configure_logging, get_logger
+from retry_policy import RetryPolicy, is_retryable_error, retry_after_seconds
 
 load_dotenv()
 
+logger = get_logger("llm_client")
+
 API_BASE_URL = os.getenv("API_BASE_URL")
 API_KEY = os.getenv("API_KEY")
 
-if not API_BASE_URL or not API_KEY:
-    raise ValueError("Missing required environment variables. Please check your .env file.")
+def _require_api_config(api_key, base_url) -> None:
+    """创建真实客户端前检查API配置；离线回放缓存时不需要配置"""
+    if not base_url or not api_key:
+        raise ValueError("Missing required environment variables. Please check your .env file.")
+
+# 共享客户端的连接池大小与进程内单模型并发上限，可通过环境变量调整
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+MAX_CONCURRENCY_PER_MODEL = int(os.getenv("LLM_MAX_CONCURRENCY_PER_MODEL", "16"))
+
+# 流式请求收到完整决策后，为读取末尾的 usage 块最多再读取的块数（决策JSON通常就在响应末尾）
+STREAM_USAGE_MAX_TRAILING_CHUNKS = 64
+
+# 跨进程共享的单模型并发限制器（如 multiprocessing.Manager 提供的信号量），由多进程运行器注入
+_model_limiters: Dict[str, object] = {}
+
+def set_model_limiters(limiters: Dict[str, object]) -> None:
+    """设置同步客户端使用的单模型并发限制器
+
+    Args:
+        limiters: 模型名称到信号量（支持 with 语句）的映射
+    """
+    _model_limiters.clear()
+    _model_limiters.update(limiters)
+
+# 未注入跨进程限制器时，进程内各线程（并发反思、前缀预热等）共用的单模型信号量
+_local_limiters: Dict[str, threading.BoundedSemaphore] = {}
+_local_limiters_lock = threading.Lock()
+
+def _model_limiter(model: str):
+    """获取模型的并发限制器：优先使用多进程运行器注入的跨进程限制器，否则使用进程内的信号量"""
+    limiter = _model_limiters.get(model) or _local_limiters.get(model)
+    if limiter is None:
+        with _local_limiters_lock:
+            limiter = _local_limiters.setdefault(model, threading.BoundedSemaphore(MAX_CONCURRENCY_PER_MODEL))
+    return limiter
+
+class JsonObjectScanner:
+    def __init__(self, required_keys: Iterable[str] = ()):
+        """增量扫描流式文本中的JSON对象
+
+        逐段喂入文本，按括号配对（忽略字符串中的括号）找出完整的顶层对象，
+        一旦出现包含全部必需键的对象即可提前结束读取。
+
+        Args:
+            required_keys: 目标对象必须包含的键
+        """
+        self.required_keys = tuple(required_keys)
+        self.buffer = []
+        self.result: Optional[Dict] = None
+        self._text_length = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start: Optional[int] = None
+
+    def feed(self, text: str) -> Optional[Dict]:
+        """喂入一段文本，找到符合要求的对象时返回该对象"""
+        if self.result is not None:
+            return self.result
+        offset = self._text_length
+        self.buffer.append(text)
+        self._text_length += len(text)
+        for i, char in enumerate(text):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._start = offset + i
+                self._depth += 1
+            elif char == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = self._slice(self._start, offset + i + 1)
+                    self._start = None
+                    try:
+                        obj = json.loads(candidate)
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(obj, dict) and all(key in obj for key in self.required_keys):
+                        self.result = obj
+                        return obj
+        return None
+
+    def _slice(self, start: int, end: int) -> str:
+        """从已喂入的文本中截取 [start, end)"""
+        text = "".join(self.buffer)
+        self.buffer = [text]
+        return text[start:end]
+
+    @property
+    def text(self) -> str:
+        """已喂入的全部文本"""
+        return "".join(self.buffer)
+
+def extract_json_object(text: str, required_keys: Iterable[str] = ()) -> Optional[Dict]:
+    """
+    从完整的回复文本中按括号配对提取JSON对象
+
+    优先返回第一个包含全部 required_keys 的对象；没有时返回第一个可以解析的对象，
+    便于调用方指出缺少哪些字段。与贪婪正则不同，回复中前后出现的其他花括号不会影响结果。
+    """
+    scanner = JsonObjectScanner(required_keys)
+    result = scanner.feed(text)
+    if result is None and required_keys:
+        result = JsonObjectScanner().feed(text)
+    return result
+
+class UsageStats:
+    """按模型累计token用量，用于统计服务端前缀缓存命中率"""
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, usage) -> None:
+        """记录一次响应的 usage 字段"""
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) if details is not None else None
+        if cached_tokens is None:
+            # 部分服务商（如DeepSeek）使用独立字段返回缓存命中的token数
+            cached_tokens = getattr(usage, "prompt_cache_hit_tokens", 0)
+        with self._lock:
+            stats = self._stats.setdefault(model, {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0})
+            stats["requests"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_tokens"] += cached_tokens or 0
+            stats["completion_tokens"] += completion_tokens
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """返回当前统计的副本"""
+        with self._lock:
+            return {model: dict(stats) for model, stats in self._stats.items()}
+
+    def merge(self, other: Dict[str, Dict[str, int]]) -> None:
+        """合并其他进程返回的统计结果"""
+        with self._lock:
+            for model, stats in other.items():
+                target = self._stats.setdefault(model, {key: 0 for key in stats})
+                for key, value in stats.items():
+                    target[key] = target.get(key, 0) + value
+
+    def reset(self) -> None:
+        """清空统计"""
+        with self._lock:
+            self._stats.clear()
+
+    def format_report(self) -> str:
+        """格式化每个模型的前缀缓存命中率"""
+        lines = [f"{'模型':<30} {'请求数':<8} {'输入token':<12} {'缓存命中token':<14} {'命中率':<8}"]
+        for model, stats in sorted(self.snapshot().items()):
+            hit_rate = stats["cached_tokens"] / stats["prompt_tokens"] * 100 if stats["prompt_tokens"] else 0
+            lines.append(f"{model:<30} {stats['requests']:<8} {stats['prompt_tokens']:<12} {stats['cached_tokens']:<14} {hit_rate:.1f}%")
+        return "\n".join(lines)
+
+# 进程内所有客户端共享的token用量统计
+usage_stats = UsageStats()
+
+# 当前线程（或异步任务）最近一次请求的token用量和异常，供调用方记录逐次调用的指标；
+# 使用上下文变量，同一事件循环中并发的异步请求各自记录，互不覆盖
+_EMPTY_CALL = {"prompt_tokens": 0, "completion_tokens": 0, "error": None}
+_last_call: contextvars.ContextVar[Dict] = contextvars.ContextVar("llm_last_call", default=_EMPTY_CALL)
+
+def reset_last_call() -> None:
+    """在发起请求前清空当前线程或异步任务的调用信息（缓存回放时不会产生新的用量）"""
+    _last_call.set(_EMPTY_CALL)
+
+def get_last_call() -> Dict:
+    """返回当前线程或异步任务最近一次请求的 prompt_tokens、completion_tokens 和 error"""
+    return dict(_last_call.get())
+
+def _record_last_call(usage=None, error: Optional[Exception] = None) -> None:
+    call = dict(_last_call.get())
+    if usage is not None:
+        call["prompt_tokens"] = getattr(usage, "prompt_tokens", 0) or 0
+        call["completion_tokens"] = getattr(usage, "completion_tokens", 0) or 0
+    call["error"] = error
+    _last_call.set(call)
+
+def _response_format_kwargs(response_format: Optional[Dict]) -> Dict:
+    """只在启用结构化输出时传递 response_format，不支持该参数的服务商不受影响"""
+    return {"response_format": response_format} if response_format is not None else {}
 
 class LLMClient:
-    def __init__(self, api_key=API_KEY, base_url=API_BASE_URL):
-        """初始化LLM客户端"""
+    def __init__(self, api_key=API_KEY, base_url=API_BASE_URL, retry_policy: Optional[RetryPolicy] = None):
+        """初始化LLM客户端
+
+        Args:
+            api_key: API密钥
+            base_url: API地址
+            retry_policy: 限流（429）和服务端错误（5xx）时的重试策略，默认 RetryPolicy()；
+                SDK自带的重试被关闭，由该策略统一控制重试次数和等待时间
+        """
+        _require_api_config(api_key, base_url)
         self.client = OpenAI(
             api_key=api_key,
-            base_url=base_url
+            base_url=base_url,
+            max_retries=0,
+            # 所有线程复用同一个keep-alive连接池
+            http_client=DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_CONNECTIONS
+                )
+            )
         )
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    def _request_with_retries(self, model: str, request):
+        """在模型并发限制内执行请求，可重试的错误按退避策略等待后重试，等待期间不占用并发名额"""
+        retry = 0
+        while True:
+            try:
+                with _model_limiter(model):
+                    return request()
+            except Exception as e:
+                if retry >= self.retry_policy.max_retries or not is_retryable_error(e):
+                    raise
+                delay = self.retry_policy.backoff_delay(retry, retry_after_seconds(e))
+                logger.warning("LLM请求失败 (%s): %s，%.1f 秒后第 %d 次重试", model, e, delay, retry + 1)
+                time.sleep(delay)
+                retry += 1
         
-    def chat(self, messages, model="deepseek-r1"):
+    def chat(self, messages, model="deepseek-r1", response_format: Optional[Dict] = None):
         """与LLM交互
         
         Args:
             messages: 消息列表
             model: 使用的LLM模型
+            response_format: 结构化输出参数（JSON模式或JSON Schema），为None时不传递，需服务商支持
         
         Returns:
             tuple: (content, reasoning_content)
+        
+        Raises:
+            openai.APIError: 不可重试的错误（如400、401），或可重试的错误在 retry_policy 的次数内仍未成功
         """
         try:
-            print(f"LLM请求: {messages}")
-            response = self.client.chat.completions.create(
+            logger.debug("LLM请求 (%s): %s", model, messages)
+            response = self._request_with_retries(model, lambda: self.client.chat.completions.create(
                 model=model,
                 messages=messages,
-            )
+                **_response_format_kwargs(response_format)
+            ))
+            usage_stats.record(model, getattr(response, "usage", None))
+            _record_last_call(getattr(response, "usage", None))
             if response.choices:
                 message = response.choices[0].message
                 content = message.content if message.content else ""
                 reasoning_content = getattr(message, "reasoning_content", "")
-                print(f"LLM推理内容: {content}")
+                logger.debug("LLM响应 (%s): %s", model, content)
                 return content, reasoning_content
             
             return "", ""
                 
         except Exception as e:
-            print(f"LLM调用出错: {str(e)}")
+            logger.warning("LLM调用出错 (%s): %s", model, e)
+            _record_last_call(error=e)
+            raise
+
+    async def achat(self, messages, model="deepseek-r1", response_format: Optional[Dict] = None):
+        """与LLM异步交互，由进程内共享的 AsyncLLMClient 发出请求，行为与 chat 一致
+
+        Returns:
+            tuple: (content, reasoning_content)
+        """
+        return await get_async_llm_client().achat(messages, model=model, response_format=response_format)
+
+    def warm_prefix(self, messages, model="deepseek-r1") -> None:
+        """发送只生成1个token的请求，让服务端的前缀缓存提前收录 messages 的内容
+
+        之后以相同内容开头的请求可以命中缓存，缩短首token延迟。失败时不重试，也不抛出异常。
+        """
+        try:
+            with _model_limiter(model):
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=1,
+                )
+            usage_stats.record(model, getattr(response, "usage", None))
+            _record_last_call(getattr(response, "usage", None))
+        except Exception as e:
+            logger.debug("预热前缀缓存失败 (%s): %s", model, e)
+            _record_last_call(error=e)
+
+    def chat_stream(self, messages, model="deepseek-r1", required_keys: Iterable[str] = (), capture_reasoning: bool = True,
+                    response_format: Optional[Dict] = None):
+        """以流式方式与LLM交互，一旦收到包含全部必需键的完整JSON对象即停止读取
+        
+        Args:
+            messages: 消息列表
+            model: 使用的LLM模型
+            required_keys: 期望JSON对象包含的键，为空时读取完整响应
+            capture_reasoning: 是否收集推理内容，不需要记录时可以节省内存
+            response_format: 结构化输出参数，为None时不传递
+        
+        Returns:
+            tuple: (content, reasoning_content)，content截止到JSON对象结尾
+        
+        Raises:
+            openai.APIError: 与 chat 相同
+        """
+        def read_stream():
+            # 重试时从头读取新的响应流
+            scanner = JsonObjectScanner(required_keys)
+            reasoning_parts = []
+            usage = None
+            decided = False
+            trailing_chunks = 0
+            stream = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                # 让服务端在流末尾发送一个只包含 usage 的块（choices 为空）
+                stream_options={"include_usage": True},
+                **_response_format_kwargs(response_format)
+            )
+            try:
+                for chunk in stream:
+                    if getattr(chunk, "usage", None) is not None:
+                        usage = chunk.usage
+                    if decided:
+                        # 决策已完整，只继续读取末尾的 usage 块；超过上限时记录已收到的部分
+                        if usage is not None or trailing_chunks >= STREAM_USAGE_MAX_TRAILING_CHUNKS:
+                            break
+                        trailing_chunks += 1
+                        continue
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if capture_reasoning:
+                        reasoning = getattr(delta, "reasoning_content", None)
+                        if reasoning:
+                            reasoning_parts.append(reasoning)
+                    if delta.content and scanner.feed(delta.content) is not None and required_keys:
+                        decided = True
+                        if usage is not None:
+                            break
+            finally:
+                # 提前结束时关闭连接，服务端停止继续生成
+                stream.close()
+            return scanner.text, reasoning_parts, usage
+
+        try:
+            logger.debug("LLM请求 (%s): %s", model, messages)
+            content, reasoning_parts, usage = self._request_with_retries(model, read_stream)
+            usage_stats.record(model, usage)
+            _record_last_call(usage)
+            logger.debug("LLM响应 (%s): %s", model, content)
+            return content, "".join(reasoning_parts) if capture_reasoning else None
+                
+        except Exception as e:
+            logger.warning("LLM调用出错 (%s): %s", model, e)
+            _record_last_call(error=e)
+            raise
+
+class AsyncLLMClient:
+    def __init__(self, api_key=API_KEY, base_url=API_BASE_URL, retry_policy: Optional[RetryPolicy] = None,
+                 max_connections: int = MAX_CONNECTIONS, max_concurrency_per_model: int = MAX_CONCURRENCY_PER_MODEL):
+        """初始化异步LLM客户端
+
+        所有请求复用同一个keep-alive连接池，并按模型限制同时进行中的请求数。
+        连接池和信号量会绑定到首次使用它们的事件循环，同一实例应只在一个事件循环中使用，
+        进程内共享的实例（get_async_llm_client）只在 run_async 的后台事件循环中使用。
+
+        Args:
+            api_key: API密钥
+            base_url: API地址，可指向本地的OpenAI兼容测试服务
+            retry_policy: 限流（429）和服务端错误（5xx）时的重试策略，默认 RetryPolicy()
+            max_connections: 连接池最大连接数
+            max_concurrency_per_model: 单个模型同时进行中的最大请求数
+        """
+        _require_api_config(api_key, base_url)
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections
+                )
+            )
+        )
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.max_concurrency_per_model = max_concurrency_per_model
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        """获取（必要时创建）模型对应的并发信号量"""
+        semaphore = self._semaphores.get(model)
+        if semaphore is None:
+            semaphore = self._semaphores.setdefault(model, asyncio.Semaphore(self.max_concurrency_per_model))
+        return semaphore
+
+    async def _request_with_retries(self, model: str, request):
+        """
+        在模型并发限制内执行请求，可重试的错误按退避策略等待后重试，等待期间不占用并发名额
+
+        多进程运行器注入了跨进程限制器时，在进程内的信号量之外同时占用一个跨进程名额
+        （在线程中等待，不阻塞事件循环）
+        """
+        retry = 0
+        while True:
+            try:
+                async with self._semaphore(model):
+                    limiter = _model_limiters.get(model)
+                    if limiter is None:
+                        return await request()
+                    await asyncio.to_thread(limiter.acquire)
+                    try:
+                        return await request()
+                    finally:
+                        limiter.release()
+            except Exception as e:
+                if retry >= self.retry_policy.max_retries or not is_retryable_error(e):
+                    raise
+                delay = self.retry_policy.backoff_delay(retry, retry_after_seconds(e))
+                logger.warning("LLM请求失败 (%s): %s，%.1f 秒后第 %d 次重试", model, e, delay, retry + 1)
+                await asyncio.sleep(delay)
+                retry += 1
+
+    async def achat(self, messages, model="deepseek-r1", response_format: Optional[Dict] = None):
+        """与LLM异步交互，行为与 LLMClient.chat 一致
+
+        Args:
+            messages: 消息列表
+            model: 使用的LLM模型
+            response_format: 结构化输出参数，为None时不传递
+
+        Returns:
+            tuple: (content, reasoning_content)
+
+        Raises:
+            openai.APIError: 与 LLMClient.chat 相同
+        """
+        try:
+            logger.debug("LLM请求 (%s): %s", model, messages)
+            response = await self._request_with_retries(model, lambda: self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                **_response_format_kwargs(response_format)
+            ))
+            usage_stats.record(model, getattr(response, "usage", None))
+            _record_last_call(getattr(response, "usage", None))
+            if response.choices:
+                message = response.choices[0].message
+                content = message.content if message.content else ""
+                reasoning_content = getattr(message, "reasoning_content", "")
+                logger.debug("LLM响应 (%s): %s", model, content)
+                return content, reasoning_content
+
             return "", ""
 
+        except Exception as e:
+            logger.warning("LLM调用出错 (%s): %s", model, e)
+            _record_last_call(error=e)
+            raise
+
+    async def aclose(self) -> None:
+        """关闭底层连接池"""
+        await self.client.close()
+
+# 进程内共享的后台事件循环：同步代码通过 run_async 提交协程，异步客户端的连接池始终绑定在这个循环上
+_async_loop: Optional[asyncio.AbstractEventLoop] = None
+_async_loop_lock = threading.Lock()
+
+def _get_async_loop() -> asyncio.AbstractEventLoop:
+    global _async_loop
+    if _async_loop is None:
+        with _async_loop_lock:
+            if _async_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-async-loop", daemon=True).start()
+                _async_loop = loop
+    return _async_loop
+
+def run_async(coroutine):
+    """在进程内共享的后台事件循环中运行协程，阻塞等待并返回其结果"""
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_async_loop()).result()
+
+_shared_client = None
+_shared_async_client: Optional[AsyncLLMClient] = None
+_shared_lock = threading.Lock()
+
+def _reset_after_fork() -> None:
+    """子进程中没有父进程的后台线程，需要重新创建事件循环和绑定在其上的异步客户端"""
+    global _async_loop, _shared_async_client
+    _async_loop = None
+    _shared_async_client = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_llm_client():
+    """获取进程内共享的同步客户端，所有玩家复用同一个连接池
+
+    环境变量 LLM_CACHE_MODE 为 record 或 replay 时，返回带响应缓存的客户端（见 llm_cache.py）
+    """
+    global _shared_client
+    if _shared_client is None:
+        with _shared_lock:
+            if _shared_client is None:
+                cache_mode = os.getenv("LLM_CACHE_MODE", "passthrough")
+                if cache_mode == "passthrough":
+                    _shared_client = LLMClient()
+                else:
+                    from llm_cache import CachedLLMClient, LLMResponseCache
+                    cache = LLMResponseCache(os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3"))
+                    _shared_client = CachedLLMClient(cache, mode=cache_mode)
+    return _shared_client
+
+def get_async_llm_client() -> AsyncLLMClient:
+    """获取进程内共享的异步客户端，只应在 run_async 的后台事件循环中使用"""
+    global _shared_async_client
+    if _shared_async_client is None:
+        with _shared_lock:
+            if _shared_async_client is None:
+                _shared_async_client = AsyncLLMClient()
+    return _shared_async_client
+
 # 使用示例
 if __name__ == "__main__":
+    configure_logging("DEBUG")
     llm = LLMClient()
     messages = [
         {"role": "user", "content": "你好"}
@@ -0,0 +1,196 @@
+import csv
+import io
+import threading
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+# 单次LLM调用的结果分类
+OUTCOMES = ("ok", "parse_fail", "invalid_cards", "exception")
+QUANTILES = (0.5, 0.95, 0.99)
+
+@dataclass
+class CallMetric:
+    """一次LLM调用（包括每次重试）的耗时、token用量和结果"""
+    game_id: Optional[str]
+    round_id: Optional[int]
+    player: str
+    model: str
+    phase: str
+    attempt: int
+    latency: float
+    prompt_tokens: int
+    completion_tokens: int
+    outcome: str
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """对已排序的数据做线性插值分位数"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class MetricsCollector:
+    """收集每次LLM调用的指标，并汇总为按模型和阶段分组的报告
+
+    游戏ID和轮次由 Game 在每轮开始时通过 set_context 设置。一个进程同一时刻只运行一局游戏
+    （多进程运行器中每个工作进程依次运行各局），因此上下文在进程内共享，并发反思的线程也能读到。
+    """
+    def __init__(self):
+        self._records: List[CallMetric] = []
+        self._lock = threading.Lock()
+        self._game_id: Optional[str] = None
+        self._round_id: Optional[int] = None
+
+    def set_context(self, game_id: Optional[str], round_id: Optional[int]) -> None:
+        """设置之后的调用所属的游戏和轮次"""
+        self._game_id = game_id
+        self._round_id = round_id
+
+    def record(self, player: str, model: str, phase: str, attempt: int, latency: float,
+               prompt_tokens: int = 0, completion_tokens: int = 0, outcome: str = "ok") -> None:
+        """记录一次调用"""
+        metric = CallMetric(self._game_id, self._round_id, player, model, phase, attempt,
+                            latency, prompt_tokens, completion_tokens, outcome)
+        with self._lock:
+            self._records.append(metric)
+
+    def snapshot(self) -> List[Dict]:
+        """返回所有调用记录的副本（可跨进程传递）"""
+        with self._lock:
+            return [asdict(metric) for metric in self._records]
+
+    def merge(self, records: List[Dict]) -> None:
+        """合并其他进程返回的调用记录"""
+        with self._lock:
+            self._records.extend(CallMetric(**record) for record in records)
+
+    def reset(self) -> None:
+        """清空记录"""
+        with self._lock:
+            self._records.clear()
+
+    def summary(self) -> List[Dict]:
+        """
+        按 (模型, 阶段) 汇总
+
+        Returns:
+            List[Dict]: 每组的调用数、延迟分位数（秒）、重试率、token用量和各结果的次数；
+                重试率为第2次及以后的尝试在该组调用中所占的比例
+        """
+        with self._lock:
+            records = list(self._records)
+        groups: Dict[Tuple[str, str], List[CallMetric]] = defaultdict(list)
+        for metric in records:
+            groups[(metric.model, metric.phase)].append(metric)
+
+        rows = []
+        for (model, phase), calls in sorted(groups.items()):
+            latencies = sorted(metric.latency for metric in calls)
+            row = {
+                "model": model,
+                "phase": phase,
+                "calls": len(calls),
+                "latency_sum": sum(latencies),
+            }
+            for q in QUANTILES:
+                row[f"p{int(q * 100)}"] = _percentile(latencies, q)
+            row["retry_rate"] = sum(1 for metric in calls if metric.attempt > 1) / len(calls)
+            row["prompt_tokens"] = sum(metric.prompt_tokens for metric in calls)
+            row["completion_tokens"] = sum(metric.completion_tokens for metric in calls)
+            for outcome in OUTCOMES:
+                row[outcome] = sum(1 for metric in calls if metric.outcome == outcome)
+            rows.append(row)
+        return rows
+
+    def tokens_per_game(self) -> float:
+        """平均每局游戏消耗的token数（输入+输出）"""
+        with self._lock:
+            games = {metric.game_id for metric in self._records}
+            total = sum(metric.prompt_tokens + metric.completion_tokens for metric in self._records)
+        return total / len(games) if games else 0.0
+
+    def format_report(self) -> str:
+        """格式化每个模型和阶段的延迟分位数、重试率与token用量"""
+        lines = [f"{'模型':<30} {'阶段':<14} {'调用数':<8} {'p50(s)':<8} {'p95(s)':<8} {'p99(s)':<8} {'重试率':<8} {'输入token':<10} {'输出token':<10} 失败(解析/无效/异常)"]
+        for row in self.summary():
+            retry_rate = f"{row['retry_rate'] * 100:.1f}%"
+            lines.append(
+                f"{row['model']:<30} {row['phase']:<14} {row['calls']:<8} {row['p50']:<8.2f} {row['p95']:<8.2f} {row['p99']:<8.2f} "
+                f"{retry_rate:<8} {row['prompt_tokens']:<10} {row['completion_tokens']:<10} "
+                f"{row['parse_fail']}/{row['invalid_cards']}/{row['exception']}"
+            )
+        lines.append(f"平均每局token数: {self.tokens_per_game():.0f}")
+        return "\n".join(lines)
+
+    def to_prometheus(self) -> str:
+        """导出为Prometheus文本格式"""
+        rows = self.summary()
+        lines = [
+            "# HELP liars_bar_llm_call_latency_seconds LLM call latency by model and phase.",
+            "# TYPE liars_bar_llm_call_latency_seconds summary",
+        ]
+        for row in rows:
+            labels = f'model="{_escape_label(row["model"])}",phase="{_escape_label(row["phase"])}"'
+            for q in QUANTILES:
+                lines.append(f'liars_bar_llm_call_latency_seconds{{{labels},quantile="{q}"}} {row[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f"liars_bar_llm_call_latency_seconds_sum{{{labels}}} {row['latency_sum']:.6f}")
+            lines.append(f"liars_bar_llm_call_latency_seconds_count{{{labels}}} {row['calls']}")
+
+        lines += [
+            "# HELP liars_bar_llm_calls_total LLM calls by model, phase and outcome.",
+            "# TYPE liars_bar_llm_calls_total counter",
+        ]
+        for row in rows:
+            labels = f'model="{_escape_label(row["model"])}",phase="{_escape_label(row["phase"])}"'
+            for outcome in OUTCOMES:
+                lines.append(f'liars_bar_llm_calls_total{{{labels},outcome="{outcome}"}} {row[outcome]}')
+
+        lines += [
+            "# HELP liars_bar_llm_retry_ratio Share of calls that were retries.",
+            "# TYPE liars_bar_llm_retry_ratio gauge",
+        ]
+        for row in rows:
+            labels = f'model="{_escape_label(row["model"])}",phase="{_escape_label(row["phase"])}"'
+            lines.append(f"liars_bar_llm_retry_ratio{{{labels}}} {row['retry_rate']:.6f}")
+
+        lines += [
+            "# HELP liars_bar_llm_tokens_total Tokens used by model, phase and type.",
+            "# TYPE liars_bar_llm_tokens_total counter",
+        ]
+        for row in rows:
+            labels = f'model="{_escape_label(row["model"])}",phase="{_escape_label(row["phase"])}"'
+            lines.append(f'liars_bar_llm_tokens_total{{{labels},type="prompt"}} {row["prompt_tokens"]}')
+            lines.append(f'liars_bar_llm_tokens_total{{{labels},type="completion"}} {row["completion_tokens"]}')
+
+        lines += [
+            "# HELP liars_bar_tokens_per_game Average tokens used per game.",
+            "# TYPE liars_bar_tokens_per_game gauge",
+            f"liars_bar_tokens_per_game {self.tokens_per_game():.2f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def to_csv(self) -> str:
+        """导出为CSV，每行对应一个 (模型, 阶段) 分组"""
+        rows = self.summary()
+        output = io.StringIO()
+        fieldnames = ["model", "phase", "calls", "p50", "p95", "p99", "latency_sum", "retry_rate",
+                      "prompt_tokens", "completion_tokens", *OUTCOMES]
+        writer = csv.DictWriter(output, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue()
+
+    def export(self, path: str) -> None:
+        """根据扩展名导出报告：.csv 为CSV，其他为Prometheus文本格式"""
+        content = self.to_csv() if path.endswith(".csv") else self.to_prometheus()
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            file.write(content)
+
+# 进程内共享的调用指标
+metrics = MetricsCollector()
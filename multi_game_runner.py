@@ -1,29 +1,179 @@
 from game import Game
-from typing import Dict, List
+from llm_client import get_llm_client, set_model_limiters, usage_stats
+from llm_cache import CACHE_MODES, CachedLLMClient
+from game_logging import configure_logging, get_logger
+from metrics import metrics
+from retry_policy import DEFAULT_RETRY_BUDGETS
+from decision_schema import STRUCTURED_OUTPUT_MODES
+from record_index import DEFAULT_INDEX_PATH
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
 import argparse
+import multiprocessing
+import os
+import random
+
+logger = get_logger("runner")
+
+def _init_worker(model_limiters: Dict[str, object], log_level: str, log_json: Optional[str]) -> None:
+    """工作进程初始化：注入跨进程共享的单模型并发限制器，并按主进程的设置配置日志"""
+    set_model_limiters(model_limiters)
+    configure_logging(log_level, json_path=log_json)
+
+def _prepare_game(seed: Optional[int], game_num: int) -> None:
+    """每局开始前设置随机种子并重置缓存键计数，使录制和回放时的同一局游戏完全一致"""
+    if seed is not None:
+        random.seed(seed + game_num)
+    client = get_llm_client()
+    if isinstance(client, CachedLLMClient):
+        client.reset_occurrences()
+
+def _run_single_game(player_configs: List[Dict[str, str]], game_options: Dict, seed: Optional[int], game_num: int) -> Tuple[str, Dict[str, Dict[str, int]], List[Dict]]:
+    """在工作进程中运行一局游戏，返回游戏ID、本局的token用量统计和逐次调用指标"""
+    usage_stats.reset()
+    metrics.reset()
+    _prepare_game(seed, game_num)
+    game = Game(player_configs, **game_options)
+    game.start_game()
+    return game.game_record.game_id, usage_stats.snapshot(), metrics.snapshot()
 
 class MultiGameRunner:
-    def __init__(self, player_configs: List[Dict[str, str]], num_games: int = 10):
+    def __init__(self, player_configs: List[Dict[str, str]], num_games: int = 10, parallel_reflection: bool = False, batch_reflection: bool = False,
+                 workers: int = 1, model_concurrency: int = 8, event_log: bool = False, seed: Optional[int] = None,
+                 streaming: bool = False, record_thinking: bool = True, log_level: str = "WARNING", log_json: Optional[str] = None,
+                 metrics_out: Optional[str] = None, retry_budgets: Optional[Dict[str, int]] = None,
+                 structured_output: Optional[str] = None, speculative_challenge: bool = False,
+                 offload_thinking: bool = False, index_path: Optional[str] = None):
         """初始化多局游戏运行器
         
         Args:
             player_configs: 玩家配置列表
             num_games: 要运行的游戏局数
+            parallel_reflection: 是否并发执行反思阶段
+            batch_reflection: 是否让每个玩家在一次请求中反思所有对手
+            workers: 同时运行游戏的进程数，为1时在当前进程中逐局运行
+            model_concurrency: 多进程运行时，所有进程对单个模型同时发起的最大请求数
+            event_log: 是否以追加写入的JSONL事件日志保存记录
+            seed: 随机种子，第n局使用 seed+n；配合响应缓存回放可以确定性地重跑游戏
+            streaming: 是否以流式方式请求LLM，收到完整的JSON决策后立即返回
+            record_thinking: 是否在游戏记录中保存LLM的推理内容
+            log_level: 控制台日志级别，默认只输出警告和错误，避免控制台输出拖慢批量运行
+            log_json: JSON事件日志文件路径，所有工作进程追加写入同一个文件
+            metrics_out: 调用指标报告的导出路径，.csv 导出为CSV，其他扩展名导出为Prometheus文本格式
+            retry_budgets: 各阶段（play/challenge/reflect）LLM决策的最大尝试次数
+            structured_output: 出牌和质疑请求的结构化输出模式（json_object 或 json_schema）
+            speculative_challenge: 是否在当前玩家思考出牌时并行预热下家质疑提示词的前缀缓存
+            offload_thinking: 是否将推理内容压缩保存到 game_records/traces，记录中只保留引用和字符数
+            index_path: 游戏记录索引文件，设置后所有工作进程将对局实时写入该索引（SQLite WAL模式支持并发写入）
         """
         self.player_configs = player_configs
         self.num_games = num_games
+        self.parallel_reflection = parallel_reflection
+        self.batch_reflection = batch_reflection
+        self.workers = workers
+        self.model_concurrency = model_concurrency
+        self.event_log = event_log
+        self.seed = seed
+        self.streaming = streaming
+        self.record_thinking = record_thinking
+        self.log_level = log_level
+        self.log_json = log_json
+        self.metrics_out = metrics_out
+        self.retry_budgets = retry_budgets
+        self.structured_output = structured_output
+        self.speculative_challenge = speculative_challenge
+        self.offload_thinking = offload_thinking
+        self.index_path = index_path
+
+    def _game_options(self) -> Dict:
+        """传递给每局游戏的选项"""
+        return {
+            "parallel_reflection": self.parallel_reflection,
+            "batch_reflection": self.batch_reflection,
+            "event_log": self.event_log,
+            "streaming": self.streaming,
+            "record_thinking": self.record_thinking,
+            "retry_budgets": self.retry_budgets,
+            "structured_output": self.structured_output,
+            "speculative_challenge": self.speculative_challenge,
+            "offload_thinking": self.offload_thinking,
+            "index_path": self.index_path
+        }
 
     def run_games(self) -> None:
-        """运行指定数量的游戏"""
+        """运行指定数量的游戏，结束后打印每个模型的前缀缓存命中率和调用指标"""
+        configure_logging(self.log_level, json_path=self.log_json)
+        usage_stats.reset()
+        metrics.reset()
+        if self.workers > 1:
+            self._run_games_parallel()
+        else:
+            self._run_games_sequential()
+        
+        print("\n=== 前缀缓存统计 ===")
+        print(usage_stats.format_report())
+        print("\n=== LLM调用指标 ===")
+        print(metrics.format_report())
+        if self.metrics_out:
+            metrics.export(self.metrics_out)
+            print(f"调用指标已导出至 {self.metrics_out}")
+
+    def _run_games_sequential(self) -> None:
+        """在当前进程中逐局运行游戏"""
         for game_num in range(1, self.num_games + 1):
             print(f"\n=== 开始第 {game_num}/{self.num_games} 局游戏 ===")
             
             # 创建并运行新游戏
-            game = Game(self.player_configs)
+            _prepare_game(self.seed, game_num)
+            game = Game(self.player_configs, **self._game_options())
             game.start_game()
             
             print(f"第 {game_num} 局游戏结束")
 
+    def _run_games_parallel(self) -> None:
+        """使用进程池并行运行游戏
+
+        任意一局抛出异常（如 choose_cards_to_play/decide_challenge 的 RuntimeError，或重试后仍失败的LLM请求错误）时，
+        取消尚未开始的游戏，等待已开始的游戏结束后重新抛出该异常。
+        """
+        models = {config["model"] for config in self.player_configs if "model" in config}
+        
+        with multiprocessing.Manager() as manager:
+            model_limiters = {model: manager.BoundedSemaphore(self.model_concurrency) for model in models}
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(model_limiters, self.log_level, self.log_json)
+            )
+            try:
+                futures = {}
+                for game_num in range(1, self.num_games + 1):
+                    future = executor.submit(_run_single_game, self.player_configs, self._game_options(), self.seed, game_num)
+                    futures[future] = game_num
+                
+                completed = 0
+                for future in as_completed(futures):
+                    game_num = futures[future]
+                    try:
+                        game_id, game_usage, game_metrics = future.result()
+                    except Exception as e:
+                        logger.error("第 %d 局游戏出错: %s，取消剩余游戏并等待进行中的游戏结束", game_num, e)
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        raise
+                    usage_stats.merge(game_usage)
+                    metrics.merge(game_metrics)
+                    completed += 1
+                    print(f"进度: {completed}/{self.num_games} 局完成（第 {game_num} 局，记录 {game_id}）")
+            finally:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+def parse_retry_budget(item: str) -> Tuple[str, int]:
+    """将 "play=3" 解析为 (阶段, 最大尝试次数)"""
+    phase, _, value = item.partition("=")
+    if phase not in DEFAULT_RETRY_BUDGETS or not value.isdigit() or int(value) < 1:
+        raise argparse.ArgumentTypeError(f"无效的重试预算: {item}，格式为 PHASE=N，PHASE 可选: {', '.join(DEFAULT_RETRY_BUDGETS)}")
+    return phase, int(value)
+
 def parse_arguments():
     """解析命令行参数"""
     parser = argparse.ArgumentParser(
@@ -36,12 +186,120 @@ def parse_arguments():
         default=10,
         help='要运行的游戏局数 (默认: 10)'
     )
+    parser.add_argument(
+        '--parallel-reflection',
+        action='store_true',
+        help='并发执行每轮结束后的反思请求'
+    )
+    parser.add_argument(
+        '--batch-reflection',
+        action='store_true',
+        help='每个玩家在一次请求中反思所有对手，失败时回退到逐个反思'
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=1,
+        help='同时运行游戏的进程数 (默认: 1，逐局运行)'
+    )
+    parser.add_argument(
+        '--model-concurrency',
+        type=int,
+        default=8,
+        help='多进程运行时单个模型的全局最大并发请求数 (默认: 8)'
+    )
+    parser.add_argument(
+        '--event-log',
+        action='store_true',
+        help='以追加写入的JSONL事件日志保存记录，游戏结束时再生成完整JSON'
+    )
+    parser.add_argument(
+        '--streaming',
+        action='store_true',
+        help='以流式方式请求LLM，收到完整的JSON决策后立即返回'
+    )
+    parser.add_argument(
+        '--no-thinking',
+        action='store_true',
+        help='不在游戏记录中保存LLM的推理内容'
+    )
+    parser.add_argument(
+        '--offload-thinking',
+        action='store_true',
+        help='将推理内容压缩保存到 game_records/traces，记录中只保留引用和字符数'
+    )
+    parser.add_argument(
+        '--index',
+        nargs='?',
+        const=DEFAULT_INDEX_PATH,
+        default=None,
+        metavar='PATH',
+        help=f'将对局实时写入游戏记录索引，可用 record_index.py 按玩家、模型、目标牌和结果查询 (默认路径: {DEFAULT_INDEX_PATH})'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help='随机种子，第n局使用 seed+n'
+    )
+    parser.add_argument(
+        '--cache-mode',
+        choices=CACHE_MODES,
+        default=None,
+        help='LLM响应缓存模式：record 录制，replay 离线回放，passthrough 不使用缓存'
+    )
+    parser.add_argument(
+        '--cache-path',
+        default=None,
+        help='LLM响应缓存文件路径 (默认: llm_cache.sqlite3)'
+    )
+    parser.add_argument(
+        '--log-level',
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+        default='WARNING',
+        help='控制台日志级别：INFO 输出游戏过程，DEBUG 额外输出完整的LLM请求和响应 (默认: WARNING)'
+    )
+    parser.add_argument(
+        '--retry-budget',
+        nargs='+',
+        type=parse_retry_budget,
+        default=[],
+        metavar='PHASE=N',
+        help='各阶段LLM决策的最大尝试次数，例如 play=3 challenge=3 reflect=2 (默认: play=5 challenge=5 reflect=1)'
+    )
+    parser.add_argument(
+        '--structured-output',
+        choices=STRUCTURED_OUTPUT_MODES,
+        default=None,
+        help='出牌和质疑请求使用结构化输出：json_object 为JSON模式，json_schema 按Schema约束生成（需服务商支持）'
+    )
+    parser.add_argument(
+        '--speculative-challenge',
+        action='store_true',
+        help='在当前玩家思考出牌时，并行预热下家质疑提示词的前缀缓存，缩短每回合的等待时间'
+    )
+    parser.add_argument(
+        '--metrics-out',
+        default=None,
+        help='导出LLM调用指标报告：.csv 导出为CSV，其他扩展名（如 .prom）导出为Prometheus文本格式'
+    )
+    parser.add_argument(
+        '--log-json',
+        default=None,
+        help='将结构化事件（出牌、质疑、开枪等）以JSONL格式追加写入该文件'
+    )
     return parser.parse_args()
 
 if __name__ == '__main__':
     # 解析命令行参数
     args = parse_arguments()
     
+    # 通过环境变量传递缓存配置，工作进程会继承这些设置
+    if args.cache_mode:
+        os.environ["LLM_CACHE_MODE"] = args.cache_mode
+    if args.cache_path:
+        os.environ["LLM_CACHE_PATH"] = args.cache_path
+    
     # 配置玩家信息, 其中model为你通过API调用的模型名称
     player_configs = [
         {"name": "DeepSeek", "model": "deepseek-r1"},
@@ -51,5 +309,24 @@ if __name__ == '__main__':
     ]
     
     # 创建并运行多局游戏
-    runner = MultiGameRunner(player_configs, num_games=args.num_games)
+    runner = MultiGameRunner(
+        player_configs,
+        num_games=args.num_games,
+        parallel_reflection=args.parallel_reflection,
+        batch_reflection=args.batch_reflection,
+        workers=args.workers,
+        model_concurrency=args.model_concurrency,
+        event_log=args.event_log,
+        seed=args.seed,
+        streaming=args.streaming,
+        record_thinking=not args.no_thinking,
+        log_level=args.log_level,
+        log_json=args.log_json,
+        metrics_out=args.metrics_out,
+        retry_budgets=dict(args.retry_budget),
+        structured_output=args.structured_output,
+        speculative_challenge=args.speculative_challenge,
+        offload_thinking=args.offload_thinking,
+        index_path=args.index
+    )
     runner.run_games()
\ No newline at end of file
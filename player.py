@@ -1,21 +1,52 @@
 import random
-import json
-import re
-from typing import List, Dict
-from llm_client import LLMClient
+import logging
+import time
+from collections import Counter
+from typing import List, Dict, Optional
+from llm_client import extract_json_object, get_last_call, get_llm_client, reset_last_call
+from decision_schema import CHALLENGE_DECISION_SCHEMA, PLAY_DECISION_SCHEMA, build_response_format, validate_decision
+from prompt_registry import get_prompt_registry
+from game_logging import get_logger
+from metrics import metrics
+from retry_policy import DEFAULT_RETRY_BUDGETS
 
 RULE_BASE_PATH = "prompt/rule_base.txt"
 PLAY_CARD_PROMPT_TEMPLATE_PATH = "prompt/play_card_prompt_template.txt"
 CHALLENGE_PROMPT_TEMPLATE_PATH = "prompt/challenge_prompt_template.txt"
 REFLECT_PROMPT_TEMPLATE_PATH = "prompt/reflect_prompt_template.txt"
+REFLECT_BATCH_PROMPT_TEMPLATE_PATH = "prompt/reflect_batch_prompt_template.txt"
+
+# 出牌和质疑决策JSON必须包含的键（见 decision_schema.py）
+PLAY_DECISION_KEYS = PLAY_DECISION_SCHEMA["required"]
+CHALLENGE_DECISION_KEYS = CHALLENGE_DECISION_SCHEMA["required"]
+
+logger = get_logger("player")
+
+class InvalidDecision(ValueError):
+    """LLM返回的决策无法通过验证
+
+    Args:
+        feedback: 发回给模型的纠正提示
+        outcome: 调用指标中记录的结果分类（parse_fail 或 invalid_cards）
+    """
+    def __init__(self, feedback: str, outcome: str = "parse_fail"):
+        super().__init__(feedback)
+        self.feedback = feedback
+        self.outcome = outcome
 
 class Player:
-    def __init__(self, name: str, model_name: str):
+    def __init__(self, name: str, model_name: Optional[str] = None, streaming: bool = False, capture_reasoning: bool = True,
+                 policy=None, retry_budgets: Optional[Dict[str, int]] = None, structured_output: Optional[str] = None):
         """初始化玩家
         
         Args:
             name: 玩家名称
             model_name: 使用的LLM模型名称
+            streaming: 是否以流式方式请求LLM，收到完整的JSON决策后立即返回
+            capture_reasoning: 是否保留LLM的推理内容（写入游戏记录）
+            policy: 脚本策略（见 policy.py），指定后由策略代替LLM做决策
+            retry_budgets: 各阶段（play/challenge/reflect）的最大尝试次数，未指定的阶段使用 DEFAULT_RETRY_BUDGETS
+            structured_output: 出牌和质疑请求使用的结构化输出模式（json_object 或 json_schema），需服务商支持
         """
         self.name = name
         self.hand = []
@@ -24,23 +55,112 @@ class Player:
         self.current_bullet_position = 0
         self.opinions = {}
         
-        # LLM相关初始化
-        self.llm_client = LLMClient()
+        self.policy = policy
+        
+        # LLM相关初始化，脚本策略玩家不创建客户端
+        self.llm_client = get_llm_client() if policy is None else None
         self.model_name = model_name
+        self.streaming = streaming
+        self.capture_reasoning = capture_reasoning
+        self.retry_budgets = {**DEFAULT_RETRY_BUDGETS, **(retry_budgets or {})}
+        self.play_response_format = build_response_format(structured_output, "play_decision", PLAY_DECISION_SCHEMA)
+        self.challenge_response_format = build_response_format(structured_output, "challenge_decision", CHALLENGE_DECISION_SCHEMA)
+        
+        # 所有玩家共享的提示词模板缓存
+        self.prompts = get_prompt_registry()
 
-    def _read_file(self, filepath: str) -> str:
-        """读取文件内容"""
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return f.read().strip()
-        except Exception as e:
-            print(f"读取文件 {filepath} 失败: {str(e)}")
-            return ""
+    def _chat(self, messages: List[Dict], required_keys: List[str] = (), response_format: Optional[Dict] = None):
+        """向LLM发起请求，流式模式下收到包含 required_keys 的完整JSON后立即返回
+        
+        Returns:
+            tuple: (content, reasoning_content)，不保留推理内容时 reasoning_content 为None
+        """
+        reset_last_call()
+        # 未启用结构化输出时不传递该参数，保持与不支持它的客户端兼容
+        options = {"response_format": response_format} if response_format is not None else {}
+        if self.streaming:
+            return self.llm_client.chat_stream(
+                messages,
+                model=self.model_name,
+                required_keys=required_keys,
+                capture_reasoning=self.capture_reasoning,
+                **options
+            )
+        content, reasoning_content = self.llm_client.chat(messages, model=self.model_name, **options)
+        return content, reasoning_content if self.capture_reasoning else None
 
-    def print_status(self) -> None:
-        """打印玩家状态"""
-        print(f"{self.name} - 手牌: {', '.join(self.hand)} - "
-              f"子弹位置: {self.bullet_position} - 当前弹舱位置: {self.current_bullet_position}")
+    async def _achat(self, messages: List[Dict]):
+        """异步向LLM发起请求（不使用流式），在进程内共享的事件循环中与其他请求并发进行
+
+        Returns:
+            tuple: (content, reasoning_content)，不保留推理内容时 reasoning_content 为None
+        """
+        reset_last_call()
+        content, reasoning_content = await self.llm_client.achat(messages, model=self.model_name)
+        return content, reasoning_content if self.capture_reasoning else None
+
+    def _record_call(self, phase: str, attempt: int, started: float, outcome: str) -> None:
+        """记录一次LLM调用的耗时、token用量和结果；客户端内部出错时结果记为 exception"""
+        last_call = get_last_call()
+        if last_call["error"] is not None:
+            outcome = "exception"
+        metrics.record(
+            player=self.name,
+            model=self.model_name,
+            phase=phase,
+            attempt=attempt,
+            latency=time.perf_counter() - started,
+            prompt_tokens=last_call["prompt_tokens"],
+            completion_tokens=last_call["completion_tokens"],
+            outcome=outcome
+        )
+
+    @staticmethod
+    def _parse_decision(content: str, required_keys: List[str]) -> Dict:
+        """从LLM回复中按括号配对提取包含 required_keys 的JSON决策，失败时抛出 InvalidDecision"""
+        result = extract_json_object(content, required_keys)
+        if result is None:
+            raise InvalidDecision("没有在你的回复中找到合法的JSON对象。")
+        missing = [key for key in required_keys if key not in result]
+        if missing:
+            raise InvalidDecision(f"JSON缺少字段：{', '.join(missing)}。")
+        return result
+
+    @staticmethod
+    def _check_schema(result: Dict, schema: Dict) -> None:
+        """按决策Schema验证字段类型，失败时抛出 InvalidDecision"""
+        errors = validate_decision(result, schema)
+        if errors:
+            raise InvalidDecision("；".join(errors) + "。")
+
+    def _validate_played_cards(self, played_cards: List) -> None:
+        """检查出牌是从手牌中选出的1-3张牌，失败时抛出 InvalidDecision"""
+        if not 1 <= len(played_cards) <= 3:
+            raise InvalidDecision(f"你打出了{len(played_cards)}张牌，每次只能打出1-3张。", "invalid_cards")
+        if not all(isinstance(card, str) for card in played_cards):
+            raise InvalidDecision("played_cards 必须是由牌名字符串组成的列表。", "invalid_cards")
+        missing = Counter(played_cards) - Counter(self.hand)
+        if missing:
+            raise InvalidDecision(
+                f"{'、'.join(missing.elements())} 不在你的手牌中（或数量超过手牌），你的手牌是：{', '.join(self.hand)}。",
+                "invalid_cards"
+            )
+
+    @staticmethod
+    def _corrective_messages(prompt: str, content: str, feedback: str) -> List[Dict]:
+        """构造带纠正提示的重试消息：原始prompt、模型上一次的回复和指出问题的追问"""
+        return [
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": f"你的回复无效：{feedback}请修正后重新输出，只输出符合要求格式的JSON。"}
+        ]
+
+    def log_status(self) -> None:
+        """记录玩家状态"""
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        logger.info("%s - 手牌: %s - 子弹位置: %s - 当前弹舱位置: %s",
+                    self.name, ", ".join(self.hand), self.bullet_position, self.current_bullet_position)
         
     def init_opinions(self, other_players: List["Player"]) -> None:
         """初始化对其他玩家的看法
@@ -70,10 +190,14 @@ class Player:
             tuple: (结果字典, 推理内容)
             - 结果字典包含played_cards, behavior和play_reason
             - 推理内容为LLM的原始推理过程
+        
+        Raises:
+            RuntimeError: 重试预算内的回复都无效
+            openai.APIError: 请求出错且客户端重试后仍未成功
         """
         # 读取规则和模板
-        rules = self._read_file(RULE_BASE_PATH)
-        template = self._read_file(PLAY_CARD_PROMPT_TEMPLATE_PATH)
+        rules = self.prompts.read(RULE_BASE_PATH)
+        template = self.prompts.get(PLAY_CARD_PROMPT_TEMPLATE_PATH)
         
         # 准备当前手牌信息
         current_cards = ", ".join(self.hand)
@@ -88,43 +212,85 @@ class Player:
             current_cards=current_cards
         )
         
-        # 尝试获取有效的JSON响应，最多重试五次
-        for attempt in range(5):
-            # 每次都发送相同的原始prompt
-            messages = [
-                {"role": "user", "content": prompt}
-            ]
-            
+        # 尝试获取有效的JSON响应，回复无效时在下一次请求中指出问题；
+        # 重试预算只用于无效的回复，请求出错（限流、服务端错误等）由客户端的重试策略处理，仍失败时直接抛出
+        messages = [
+            {"role": "user", "content": prompt}
+        ]
+        for attempt in range(self.retry_budgets["play"]):
+            started = time.perf_counter()
+            outcome = "exception"
             try:
-                content, reasoning_content = self.llm_client.chat(messages, model=self.model_name)
+                content, reasoning_content = self._chat(messages, PLAY_DECISION_KEYS, self.play_response_format)
+                result = self._parse_decision(content, PLAY_DECISION_KEYS)
+                
+                # 确保played_cards是列表
+                if not isinstance(result["played_cards"], list):
+                    result["played_cards"] = [result["played_cards"]]
                 
-                # 尝试从内容中提取JSON部分
-                json_match = re.search(r'({[\s\S]*})', content)
-                if json_match:
-                    json_str = json_match.group(1)
-                    result = json.loads(json_str)
-                    
-                    # 验证JSON格式是否符合要求
-                    if all(key in result for key in ["played_cards", "behavior", "play_reason"]):
-                        # 确保played_cards是列表
-                        if not isinstance(result["played_cards"], list):
-                            result["played_cards"] = [result["played_cards"]]
-                        
-                        # 确保选出的牌是有效的（从手牌中选择1-3张）
-                        valid_cards = all(card in self.hand for card in result["played_cards"])
-                        valid_count = 1 <= len(result["played_cards"]) <= 3
-                        
-                        if valid_cards and valid_count:
-                            # 从手牌中移除已出的牌
-                            for card in result["played_cards"]:
-                                self.hand.remove(card)
-                            return result, reasoning_content
+                # 确保选出的牌是有效的（从手牌中选择1-3张），再检查其余字段的类型
+                self._validate_played_cards(result["played_cards"])
+                self._check_schema(result, PLAY_DECISION_SCHEMA)
+                
+                # 从手牌中移除已出的牌
+                for card in result["played_cards"]:
+                    self.hand.remove(card)
+                outcome = "ok"
+                return result, reasoning_content
                                 
-            except Exception as e:
-                # 仅记录错误，不修改重试请求
-                print(f"尝试 {attempt+1} 解析失败: {str(e)}")
+            except InvalidDecision as e:
+                outcome = e.outcome
+                logger.warning("%s 第 %d 次出牌决策无效: %s", self.name, attempt + 1, e.feedback)
+                # 模型返回空回复时原样重发
+                if content:
+                    messages = self._corrective_messages(prompt, content, e.feedback)
+            finally:
+                self._record_call("play", attempt + 1, started, outcome)
         raise RuntimeError(f"玩家 {self.name} 的choose_cards_to_play方法在多次尝试后失败")
 
+    def _build_challenge_prompt(self,
+                                round_base_info: str,
+                                round_action_info: str,
+                                challenge_decision_info: str,
+                                challenging_player_performance: str,
+                                extra_hint: str) -> str:
+        """填充质疑决策的提示词模板"""
+        # 读取规则和模板
+        rules = self.prompts.read(RULE_BASE_PATH)
+        template = self.prompts.get(CHALLENGE_PROMPT_TEMPLATE_PATH)
+        self_hand = f"你现在的手牌是: {', '.join(self.hand)}"
+        
+        # 填充模板
+        return template.format(
+            rules=rules,
+            self_name=self.name,
+            round_base_info=round_base_info,
+            round_action_info=round_action_info,
+            self_hand=self_hand,
+            challenge_decision_info=challenge_decision_info,
+            challenging_player_performance=challenging_player_performance,
+            extra_hint=extra_hint
+        )
+
+    def challenge_prefix(self, round_base_info: str, round_action_info: str, challenge_decision_info: str) -> str:
+        """
+        本玩家质疑提示词中与上家出牌无关的前缀
+        
+        质疑提示词只有末尾的上家表现和额外提示依赖这次出牌，其余部分（规则、轮次信息、此前的操作、
+        自己的手牌、质疑决策信息）在上家出牌前就已确定。参数应与之后调用 decide_challenge 时传入的值一致，
+        并且应在上家出牌前调用，此时读取的手牌与正式质疑时相同。
+        """
+        marker = "\0"
+        prompt = self._build_challenge_prompt(round_base_info, round_action_info, challenge_decision_info, marker, "")
+        return prompt[:prompt.index(marker)]
+
+    def warm_challenge_prefix(self, prefix: str) -> None:
+        """预热 challenge_prefix 返回的前缀，正式请求可以命中服务端的前缀缓存；只发出网络请求，可以在后台线程中调用"""
+        started = time.perf_counter()
+        reset_last_call()
+        self.llm_client.warm_prefix([{"role": "user", "content": prefix}], model=self.model_name)
+        self._record_call("warm", 1, started, "ok")
+
     def decide_challenge(self,
                         round_base_info: str,
                         round_action_info: str,
@@ -146,11 +312,54 @@ class Player:
             tuple: (result, reasoning_content)
             - result: 包含was_challenged和challenge_reason的字典
             - reasoning_content: LLM的原始推理过程
+        
+        Raises:
+            RuntimeError: 重试预算内的回复都无效
+            openai.APIError: 请求出错且客户端重试后仍未成功
         """
-        # 读取规则和模板
-        rules = self._read_file(RULE_BASE_PATH)
-        template = self._read_file(CHALLENGE_PROMPT_TEMPLATE_PATH)
-        self_hand = f"你现在的手牌是: {', '.join(self.hand)}"
+        prompt = self._build_challenge_prompt(
+            round_base_info,
+            round_action_info,
+            challenge_decision_info,
+            challenging_player_performance,
+            extra_hint
+        )
+        
+        # 尝试获取有效的JSON响应，回复无效时在下一次请求中指出问题；
+        # 重试预算只用于无效的回复，请求出错（限流、服务端错误等）由客户端的重试策略处理，仍失败时直接抛出
+        messages = [
+            {"role": "user", "content": prompt}
+        ]
+        for attempt in range(self.retry_budgets["challenge"]):
+            started = time.perf_counter()
+            outcome = "exception"
+            try:
+                content, reasoning_content = self._chat(messages, CHALLENGE_DECISION_KEYS, self.challenge_response_format)
+                result = self._parse_decision(content, CHALLENGE_DECISION_KEYS)
+                
+                # 确保was_challenged是布尔值、challenge_reason是字符串
+                self._check_schema(result, CHALLENGE_DECISION_SCHEMA)
+                outcome = "ok"
+                return result, reasoning_content
+                
+            except InvalidDecision as e:
+                outcome = e.outcome
+                logger.warning("%s 第 %d 次质疑决策无效: %s", self.name, attempt + 1, e.feedback)
+                # 模型返回空回复时原样重发
+                if content:
+                    messages = self._corrective_messages(prompt, content, e.feedback)
+            finally:
+                self._record_call("challenge", attempt + 1, started, outcome)
+        raise RuntimeError(f"玩家 {self.name} 的decide_challenge方法在多次尝试后失败")
+
+    def _reflect_messages(self, player_name: str, round_base_info: str, round_action_info: str, round_result: str) -> List[Dict]:
+        """构造对单个玩家进行反思的请求消息"""
+        # 读取反思模板和规则
+        template = self.prompts.get(REFLECT_PROMPT_TEMPLATE_PATH)
+        rules = self.prompts.read(RULE_BASE_PATH)
+        
+        # 获取此前对该玩家的印象
+        previous_opinion = self.opinions.get(player_name, "还不了解这个玩家")
         
         # 填充模板
         prompt = template.format(
@@ -158,40 +367,153 @@ class Player:
             self_name=self.name,
             round_base_info=round_base_info,
             round_action_info=round_action_info,
-            self_hand=self_hand,
-            challenge_decision_info=challenge_decision_info,
-            challenging_player_performance=challenging_player_performance,
-            extra_hint=extra_hint
+            round_result=round_result,
+            player=player_name,
+            previous_opinion=previous_opinion
         )
+        return [
+            {"role": "user", "content": prompt}
+        ]
+
+    def reflect_on_player(self, player_name: str, round_base_info: str, round_action_info: str, round_result: str) -> Optional[str]:
+        """
+        对单个玩家进行反思，返回更新后的印象，不修改 self.opinions
         
-        # 尝试获取有效的JSON响应，最多重试五次
-        for attempt in range(5):
-            # 每次都发送相同的原始prompt
-            messages = [
-                {"role": "user", "content": prompt}
-            ]
+        Args:
+            player_name: 反思对象的名称
+            round_base_info: 轮次基础信息
+            round_action_info: 轮次操作信息
+            round_result: 轮次结果
             
+        Returns:
+            Optional[str]: 更新后的印象，出错时返回None
+        """
+        # 向LLM请求分析
+        messages = self._reflect_messages(player_name, round_base_info, round_action_info, round_result)
+        
+        # 请求失败（空回复）时在预算内重试，仍失败则保留原有印象
+        for attempt in range(self.retry_budgets["reflect"]):
+            started = time.perf_counter()
+            outcome = "exception"
             try:
-                content, reasoning_content = self.llm_client.chat(messages, model=self.model_name)
-                
-                # 解析JSON响应
-                json_match = re.search(r'({[\s\S]*})', content)
-                if json_match:
-                    json_str = json_match.group(1)
-                    result = json.loads(json_str)
-                    
-                    # 验证JSON格式是否符合要求
-                    if all(key in result for key in ["was_challenged", "challenge_reason"]):
-                        # 确保was_challenged是布尔值
-                        if isinstance(result["was_challenged"], bool):
-                            return result, reasoning_content
-                
+                content, _ = self._chat(messages)
+                if content.strip():
+                    outcome = "ok"
+                    return content.strip()
+                outcome = "parse_fail"
             except Exception as e:
-                # 仅记录错误，不修改重试请求
-                print(f"尝试 {attempt+1} 解析失败: {str(e)}")
-        raise RuntimeError(f"玩家 {self.name} 的decide_challenge方法在多次尝试后失败")
+                # 请求出错时客户端已经按重试策略重试过，不再消耗反思预算，保留原有印象
+                logger.warning("%s 反思玩家 %s 时出错: %s", self.name, player_name, e)
+                return None
+            finally:
+                self._record_call("reflect", attempt + 1, started, outcome)
+        return None
+
+    async def areflect_on_player(self, player_name: str, round_base_info: str, round_action_info: str, round_result: str) -> Optional[str]:
+        """reflect_on_player 的异步版本，供并发反思使用"""
+        messages = self._reflect_messages(player_name, round_base_info, round_action_info, round_result)
+        for attempt in range(self.retry_budgets["reflect"]):
+            started = time.perf_counter()
+            outcome = "exception"
+            try:
+                content, _ = await self._achat(messages)
+                if content.strip():
+                    outcome = "ok"
+                    return content.strip()
+                outcome = "parse_fail"
+            except Exception as e:
+                # 请求出错时客户端已经按重试策略重试过，不再消耗反思预算，保留原有印象
+                logger.warning("%s 反思玩家 %s 时出错: %s", self.name, player_name, e)
+                return None
+            finally:
+                self._record_call("reflect", attempt + 1, started, outcome)
+        return None
 
-    def reflect(self, alive_players: List[str], round_base_info: str, round_action_info: str, round_result: str) -> None:
+    def _reflect_batch_messages(self, target_players: List[str], round_base_info: str, round_action_info: str, round_result: str) -> List[Dict]:
+        """构造在一次请求中反思多个玩家的请求消息"""
+        template = self.prompts.get(REFLECT_BATCH_PROMPT_TEMPLATE_PATH)
+        rules = self.prompts.read(RULE_BASE_PATH)
+        
+        previous_opinions = "\n".join(
+            f"{player_name}：{self.opinions.get(player_name, '还不了解这个玩家')}"
+            for player_name in target_players
+        )
+        
+        prompt = template.format(
+            rules=rules,
+            self_name=self.name,
+            round_base_info=round_base_info,
+            round_action_info=round_action_info,
+            round_result=round_result,
+            previous_opinions=previous_opinions,
+            player_names="、".join(target_players)
+        )
+        
+        return [
+            {"role": "user", "content": prompt}
+        ]
+
+    @staticmethod
+    def _parse_batch_opinions(content: str, target_players: List[str]) -> Optional[Dict[str, str]]:
+        """验证每个反思对象都有一段非空的文本印象，通过时返回新印象"""
+        result = extract_json_object(content, target_players)
+        if result is not None and all(
+            isinstance(result.get(player_name), str) and result[player_name].strip()
+            for player_name in target_players
+        ):
+            return {player_name: result[player_name].strip() for player_name in target_players}
+        return None
+
+    def reflect_batch(self, target_players: List[str], round_base_info: str, round_action_info: str, round_result: str) -> Optional[Dict[str, str]]:
+        """
+        在一次请求中对多个玩家进行反思，返回以玩家名称为键的新印象，不修改 self.opinions
+        
+        Args:
+            target_players: 反思对象的名称列表
+            round_base_info: 轮次基础信息
+            round_action_info: 轮次操作信息
+            round_result: 轮次结果
+            
+        Returns:
+            Optional[Dict[str, str]]: 更新后的印象，响应无法通过验证时返回None
+        """
+        messages = self._reflect_batch_messages(target_players, round_base_info, round_action_info, round_result)
+        
+        started = time.perf_counter()
+        outcome = "exception"
+        try:
+            content, _ = self._chat(messages, target_players)
+            outcome = "parse_fail"
+            opinions = self._parse_batch_opinions(content, target_players)
+            if opinions is not None:
+                outcome = "ok"
+            return opinions
+        except Exception as e:
+            logger.warning("%s 的批量反思解析失败: %s", self.name, e)
+        finally:
+            self._record_call("reflect_batch", 1, started, outcome)
+        return None
+
+    async def areflect_batch(self, target_players: List[str], round_base_info: str, round_action_info: str, round_result: str) -> Optional[Dict[str, str]]:
+        """reflect_batch 的异步版本，供并发反思使用"""
+        messages = self._reflect_batch_messages(target_players, round_base_info, round_action_info, round_result)
+        
+        started = time.perf_counter()
+        outcome = "exception"
+        try:
+            content, _ = await self._achat(messages)
+            outcome = "parse_fail"
+            opinions = self._parse_batch_opinions(content, target_players)
+            if opinions is not None:
+                outcome = "ok"
+            return opinions
+        except Exception as e:
+            logger.warning("%s 的批量反思解析失败: %s", self.name, e)
+        finally:
+            self._record_call("reflect_batch", 1, started, outcome)
+        return None
+
+    def reflect(self, alive_players: List[str], round_base_info: str, round_action_info: str, round_result: str, batched: bool = False) -> None:
         """
         玩家在轮次结束后对其他存活玩家进行反思，更新对他们的印象
         
@@ -200,56 +522,35 @@ class Player:
             round_base_info: 轮次基础信息
             round_action_info: 轮次操作信息
             round_result: 轮次结果
+            batched: 是否先尝试在一次请求中反思所有玩家，失败时回退到逐个反思
         """
-        # 读取反思模板
-        template = self._read_file(REFLECT_PROMPT_TEMPLATE_PATH)
+        # 排除自己
+        target_players = [player_name for player_name in alive_players if player_name != self.name]
         
-        # 读取规则
-        rules = self._read_file(RULE_BASE_PATH)
+        if batched and target_players:
+            opinions = self.reflect_batch(target_players, round_base_info, round_action_info, round_result)
+            if opinions is not None:
+                self.opinions.update(opinions)
+                logger.info("%s 更新了对 %s 的印象", self.name, "、".join(target_players))
+                return
+            logger.info("%s 的批量反思失败，改为逐个反思", self.name)
         
-        # 对每个存活的玩家进行反思和印象更新（排除自己）
-        for player_name in alive_players:
-            # 跳过对自己的反思
-            if player_name == self.name:
-                continue
-            
-            # 获取此前对该玩家的印象
-            previous_opinion = self.opinions.get(player_name, "还不了解这个玩家")
-            
-            # 填充模板
-            prompt = template.format(
-                rules=rules,
-                self_name=self.name,
-                round_base_info=round_base_info,
-                round_action_info=round_action_info,
-                round_result=round_result,
-                player=player_name,
-                previous_opinion=previous_opinion
-            )
-            
-            # 向LLM请求分析
-            messages = [
-                {"role": "user", "content": prompt}
-            ]
-            
-            try:
-                content, _ = self.llm_client.chat(messages, model=self.model_name)
-                
+        # 对每个存活的玩家进行反思和印象更新
+        for player_name in target_players:
+            opinion = self.reflect_on_player(player_name, round_base_info, round_action_info, round_result)
+            if opinion is not None:
                 # 更新对该玩家的印象
-                self.opinions[player_name] = content.strip()
-                print(f"{self.name} 更新了对 {player_name} 的印象")
-                
-            except Exception as e:
-                print(f"反思玩家 {player_name} 时出错: {str(e)}")
+                self.opinions[player_name] = opinion
+                logger.info("%s 更新了对 %s 的印象", self.name, player_name)
 
     def process_penalty(self) -> bool:
         """处理惩罚"""
-        print(f"玩家 {self.name} 执行射击惩罚：")
-        self.print_status()
+        logger.info("玩家 %s 执行射击惩罚：", self.name)
+        self.log_status()
         if self.bullet_position == self.current_bullet_position:
-            print(f"{self.name} 中枪死亡！")
+            logger.info("%s 中枪死亡！", self.name)
             self.alive = False
         else:
-            print(f"{self.name} 幸免于难！")
+            logger.info("%s 幸免于难！", self.name)
         self.current_bullet_position = (self.current_bullet_position + 1) % 6
         return self.alive
\ No newline at end of file
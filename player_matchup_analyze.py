@@ -1,16 +1,19 @@
-import json
+import argparse
 import os
-from itertools import combinations
+import uuid
 from collections import defaultdict
+from record_index import DEFAULT_INDEX_PATH, RecordIndex, matchup_pair
+from record_stream import load_game
+from trace_store import default_trace_directory, resolve_trace
 
-def format_challenge_event(history_item, round_data, player_states, game_id):
+def format_challenge_event(history_item, player_states, game_id, trace_directory=None):
     """
     将单次对决事件格式化为可读文本，包含更多细节
     参数:
         history_item: 包含对决信息的字典
-        round_data: 当前轮次的完整数据
-        player_states: 所有玩家的初始状态
+        player_states: 玩家名称到初始状态的字典（见 _initial_states）
         game_id: 游戏标识符
+        trace_directory: 推理存储目录，不为None时附上双方的推理内容（只在此时读取推理存储）
     返回:
         格式化后的对决文本描述
     """
@@ -19,13 +22,8 @@ def format_challenge_event(history_item, round_data, player_states, game_id):
     next_player = history_item['next_player']
     
     # 查找玩家初始状态
-    player_initial_state = None
-    next_player_initial_state = None
-    for state in round_data['player_initial_states']:
-        if state['player_name'] == player:
-            player_initial_state = state
-        elif state['player_name'] == next_player:
-            next_player_initial_state = state
+    player_initial_state = player_states.get(player)
+    next_player_initial_state = player_states.get(next_player)
     
     # 构建详细的对决记录
     output = []
@@ -42,6 +40,10 @@ def format_challenge_event(history_item, round_data, player_states, game_id):
         output.append(f"出牌理由: {history_item['play_reason']}")
     if 'behavior' in history_item and history_item['behavior']:
         output.append(f"出牌表现: {history_item['behavior']}")
+    if trace_directory is not None:
+        play_thinking = resolve_trace(history_item.get('play_thinking'), trace_directory)
+        if play_thinking:
+            output.append(f"出牌思考过程: {play_thinking}")
     
     # 添加质疑相关信息
     output.append(f"\n质疑方 ({next_player}):")
@@ -58,137 +60,252 @@ def format_challenge_event(history_item, round_data, player_states, game_id):
         output.append("选择不质疑")
         if 'challenge_reason' in history_item and history_item['challenge_reason']:
             output.append(f"不质疑理由: {history_item['challenge_reason']}")
+    if trace_directory is not None:
+        challenge_thinking = resolve_trace(history_item.get('challenge_thinking'), trace_directory)
+        if challenge_thinking:
+            output.append(f"质疑思考过程: {challenge_thinking}")
     
     # 添加额外空行以提高可读性
     output.append("")
     
     return "\n".join(output)
 
-def extract_matchups(game_data, game_id):
+def _load_thinking(source_path):
+    """读取一局游戏记录中的推理内容，按 (轮次, 出牌序号) 索引"""
+    game_data = load_game(source_path, include_thinking=True)
+    return {
+        (round_data['round_id'], play_index): play
+        for round_data in game_data['rounds']
+        for play_index, play in enumerate(round_data['play_history'])
+    }
+
+def _initial_states(play):
+    """由出牌记录附带的双方初始手牌建立按玩家名称索引的初始状态"""
+    player_states = {play['player_name']: {'player_name': play['player_name'], 'initial_hand': play['player_initial_hand'] or []}}
+    if play['next_player_initial_hand'] is not None:
+        player_states[play['next_player']] = {'player_name': play['next_player'], 'initial_hand': play['next_player_initial_hand']}
+    return player_states
+
+def iter_matchups(index, trace_directory=None, players=(), target_card=None, source_directory=None):
     """
-    从游戏数据中提取所有玩家间的详细对决记录
+    从游戏记录索引中逐条生成玩家间的详细对决记录，只查询发生质疑的出牌，不再逐个读取完整记录
     参数:
-        game_data: 完整的游戏数据字典
-        game_id: 游戏标识符
+        index: RecordIndex 游戏记录索引
+        trace_directory: 推理存储目录，不为None时在对决记录中附上推理内容（从原始记录中读取，每局只读取一次）
+        players: 只提取这些玩家之间的对决（一名或两名玩家）
+        target_card: 只提取该目标牌的对决
+        source_directory: 只提取记录文件位于该目录的游戏
+    返回:
+        依次生成 (对决配对, 对决记录文本)，按游戏、轮次和出牌顺序排列
+    """
+    thinking_game_id, thinking = None, {}
+    for play in index.iter_plays(players=players, target_card=target_card, challenged=True,
+                                 source_directory=source_directory):
+        game_id = play['game_id']
+        if trace_directory is not None:
+            # 结果按游戏排序，只需保留当前这一局的推理内容
+            if game_id != thinking_game_id:
+                source_path = index.game_source(game_id)
+                thinking_game_id = game_id
+                thinking = _load_thinking(source_path) if source_path and os.path.exists(source_path) else {}
+            recorded = thinking.get((play['round_id'], play['play_index']), {})
+            play['play_thinking'] = recorded.get('play_thinking')
+            play['challenge_thinking'] = recorded.get('challenge_thinking')
+        yield play['pair'], format_matchup(
+            play, play['round_id'], play['target_card'], _initial_states(play), game_id, trace_directory
+        )
+
+def extract_matchups(index, trace_directory=None, players=(), target_card=None, source_directory=None):
+    """
+    从游戏记录索引中提取玩家间的详细对决记录，参数同 iter_matchups
     返回:
         包含所有配对对决记录的字典
     """
-    # 获取所有玩家名称并创建对决配对
-    players = game_data['player_names']
     matchups = defaultdict(list)
+    for matchup_key, text in iter_matchups(index, trace_directory, players, target_card, source_directory):
+        matchups[matchup_key].append(text)
+    return matchups
+
+def format_matchup(play, round_id, target_card, player_states, game_id, trace_directory=None):
+    """
+    生成一次对决的完整记录，包括轮次信息和对决详情
+    参数:
+        play: 发生质疑的出牌记录
+        round_id: 轮次
+        target_card: 本轮目标牌
+        player_states: 玩家名称到初始状态的字典（见 _initial_states）
+        game_id: 游戏标识符
+        trace_directory: 推理存储目录，不为None时附上推理内容
+    返回:
+        对决记录文本
+    """
+    # 添加轮次信息
+    round_info = [
+        f"第 {round_id} 轮对决",
+        f"目标牌: {target_card}",
+        "=" * 40,
+        ""
+    ]
     
-    # 遍历处理每一轮的数据
-    for round_data in game_data['rounds']:
-        round_id = round_data['round_id']
-        target_card = round_data['target_card']
-        
-        # 处理每一次出牌
-        for play in round_data['play_history']:
-            player = play['player_name']
-            next_player = play['next_player']
-            
-            # 只记录发生质疑的对决
-            if play['was_challenged']:
-                matchup_key = '_vs_'.join(sorted([player, next_player]))
-                
-                # 添加轮次信息
-                round_info = [
-                    f"第 {round_id} 轮对决",
-                    f"目标牌: {target_card}",
-                    "=" * 40,
-                    ""
-                ]
-                
-                # 添加详细的对决记录
-                challenge_text = format_challenge_event(play, round_data, round_data['player_initial_states'], game_id)
-                
-                # 合并所有信息
-                full_text = "\n".join(round_info) + challenge_text
-                
-                matchups[matchup_key].append(full_text)
-                
+    # 添加详细的对决记录
+    challenge_text = format_challenge_event(play, player_states, game_id, trace_directory)
+    
+    # 合并所有信息
+    return "\n".join(round_info) + challenge_text
+
+def iter_matchups_from_tables(table_dir):
+    """
+    从 columnar_export.py 导出的列式表中逐条生成对决记录，结果与逐个读取json记录相同（不含推理内容）
+    只读取 plays 表中发生质疑的出牌和 rounds 表中的目标牌，需要安装 pyarrow
+    参数:
+        table_dir: 列式表目录
+    返回:
+        依次生成 (对决配对, 对决记录文本)
+    """
+    import pyarrow.compute as pc
+    from columnar_export import read_table
+
+    rounds = read_table(table_dir, "rounds", ["game_id", "round_id", "target_card"])
+    target_cards = {
+        (game_id, round_id): target_card
+        for game_id, round_id, target_card in zip(*(rounds[name].to_pylist() for name in ("game_id", "round_id", "target_card")))
+    }
+    plays = read_table(table_dir, "plays", [
+        "game_id", "round_id", "player_name", "next_player", "played_cards", "remaining_cards", "play_reason",
+        "behavior", "was_challenged", "challenge_reason", "challenge_result", "player_initial_hand", "next_player_initial_hand"
+    ])
+    plays = plays.filter(pc.fill_null(plays["was_challenged"], False))
+
+    # 按批转换为Python对象，不一次性展开整张表
+    for batch in plays.to_batches():
+        for play in batch.to_pylist():
+            yield matchup_pair(play['player_name'], play['next_player']), format_matchup(
+                play, play['round_id'], target_cards[(play['game_id'], play['round_id'])],
+                _initial_states(play), play['game_id']
+            )
+
+def extract_matchups_from_tables(table_dir):
+    """
+    从列式表中提取对决记录，参数同 iter_matchups_from_tables
+    返回:
+        包含所有配对对决记录的字典
+    """
+    matchups = defaultdict(list)
+    for matchup_key, text in iter_matchups_from_tables(table_dir):
+        matchups[matchup_key].append(text)
     return matchups
 
+class MatchupWriter:
+    """
+    边提取边将对决记录追加到各玩家对的文件中，内存中只保留每个文件的对决次数
+
+    每个文件先写入输出目录下的临时文件，close() 时写入总计并替换原文件；
+    中途出错时（作为上下文管理器使用）丢弃临时文件，保留上次的结果
+    """
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self._files = {}
+        self._counts = {}
+        # 如果输出文件夹不存在，则创建它
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _path(self, matchup_key):
+        return os.path.join(self.output_dir, f"{matchup_key}_detailed_matchups.txt")
+
+    def add(self, matchup_key, text):
+        """追加一条对决记录"""
+        f = self._files.get(matchup_key)
+        if f is None:
+            temp_path = f"{self._path(matchup_key)}.{uuid.uuid4().hex[:8]}.tmp"
+            f = self._files[matchup_key] = open(temp_path, 'x', encoding='utf-8')
+            self._counts[matchup_key] = 0
+            f.write(f"{matchup_key.replace('_vs_', ' 对阵 ')} 的详细对决记录\n")
+            f.write("=" * 50 + "\n\n")
+        else:
+            f.write("\n\n")
+        f.write(text)
+        self._counts[matchup_key] += 1
+
+    def close(self):
+        """在每个文件末尾添加统计信息并替换原文件"""
+        for matchup_key, f in self._files.items():
+            f.write(f"\n\n总计对决次数: {self._counts[matchup_key]}\n")
+            f.close()
+            os.replace(f.name, self._path(matchup_key))
+        self._files.clear()
+
+    def abort(self):
+        """丢弃尚未完成的文件"""
+        for f in self._files.values():
+            f.close()
+            os.remove(f.name)
+        self._files.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
 def save_matchups_to_files(all_matchups, output_dir):
     """
     将所有游戏的对决记录合并保存到单独的文件中
     参数:
-        all_matchups: 包含所有游戏所有配对对决记录的字典
+        all_matchups: 包含所有游戏所有配对对决记录的字典，或依次生成 (对决配对, 对决记录文本) 的迭代器
         output_dir: 输出文件夹路径
     """
-    # 如果输出文件夹不存在，则创建它
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    # 保存每对玩家的对决记录
-    for matchup_key, interactions in all_matchups.items():
-        if interactions:
-            # 在输出文件夹中创建文件
-            filename = os.path.join(output_dir, f"{matchup_key}_detailed_matchups.txt")
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(f"{matchup_key.replace('_vs_', ' 对阵 ')} 的详细对决记录\n")
-                f.write("=" * 50 + "\n\n")
-                f.write("\n\n".join(interactions))
-                # 在文件末尾添加统计信息
-                f.write(f"\n\n总计对决次数: {len(interactions)}\n")
-
-def process_all_json_files(input_dir, output_dir):
-    """
-    处理指定文件夹中的所有JSON文件，并合并相同玩家对的对决记录
+    if isinstance(all_matchups, dict):
+        all_matchups = ((key, text) for key, interactions in all_matchups.items() for text in interactions)
+    with MatchupWriter(output_dir) as writer:
+        for matchup_key, text in all_matchups:
+            writer.add(matchup_key, text)
+
+def process_all_json_files(input_dir, output_dir, include_thinking=False, index_path=DEFAULT_INDEX_PATH):
+    """
+    增量更新指定文件夹的游戏记录索引，并从索引中边提取边保存相同玩家对的对决记录
     参数:
         input_dir: 输入文件夹路径（包含JSON文件）
         output_dir: 输出文件夹路径
+        include_thinking: 是否在对决记录中附上推理内容（包括保存在推理存储中的推理内容）
+        index_path: 游戏记录索引文件，只有新增或修改过的JSON文件会被重新读取
     """
     # 确保输入文件夹存在
     if not os.path.exists(input_dir):
         print(f"错误：输入文件夹 '{input_dir}' 不存在")
         return
     
-    # 遍历所有JSON文件
-    json_files = [f for f in os.listdir(input_dir) if f.endswith('.json')]
-    if not json_files:
-        print(f"警告：在 '{input_dir}' 中没有找到JSON文件")
-        return
-    
-    print(f"找到 {len(json_files)} 个JSON文件")
-    
-    # 用于存储所有游戏的对决记录
-    all_matchups = defaultdict(list)
-    
-    # 处理每个JSON文件
-    for json_file in json_files:
-        print(f"正在处理: {json_file}")
-        file_path = os.path.join(input_dir, json_file)
+    index = RecordIndex(index_path)
+    try:
+        counts = index.update_from_directory(input_dir)
+        total = counts['indexed'] + counts['unchanged'] + counts['failed']
+        if not total:
+            print(f"警告：在 '{input_dir}' 中没有找到JSON文件")
+            return
+        print(f"找到 {total} 个JSON文件，新索引 {counts['indexed']} 个，{counts['unchanged']} 个未变化")
         
-        try:
-            # 读取JSON文件
-            with open(file_path, 'r', encoding='utf-8') as f:
-                game_data = json.load(f)
-            
-            # 使用文件名作为游戏ID
-            game_id = os.path.splitext(json_file)[0]
-            
-            # 提取对决记录
-            game_matchups = extract_matchups(game_data, game_id)
-            
-            # 合并到总记录中
-            for key, value in game_matchups.items():
-                all_matchups[key].extend(value)
-            
-            print(f"已成功处理 {json_file}")
-            
-        except Exception as e:
-            print(f"处理 {json_file} 时出错: {str(e)}")
-    
-    # 保存合并后的对决记录
-    save_matchups_to_files(all_matchups, output_dir)
+        trace_directory = default_trace_directory(input_dir) if include_thinking else None
+        save_matchups_to_files(iter_matchups(index, trace_directory, source_directory=input_dir), output_dir)
+    finally:
+        index.close()
     print("所有对决记录已合并保存")
 
-# 主程序开始
-
-# 定义输入和输出文件夹
-input_dir = "game_records"  # 包含JSON文件的文件夹
-output_dir = "matchup_records"  # 输出文件夹
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='提取所有游戏中玩家两两之间的对决记录')
+    parser.add_argument('-i', '--input', default='game_records', help='游戏记录目录 (默认: game_records)')
+    parser.add_argument('-o', '--output', default='matchup_records', help='输出目录 (默认: matchup_records)')
+    parser.add_argument('--thinking', action='store_true', help='在对决记录中附上出牌和质疑的推理内容')
+    parser.add_argument('--tables', default=None, help='从 columnar_export.py 导出的列式表目录读取（不含推理内容）')
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help=f'游戏记录索引文件 (默认: {DEFAULT_INDEX_PATH})')
+    return parser.parse_args()
 
-# 处理所有JSON文件
-process_all_json_files(input_dir, output_dir)
\ No newline at end of file
+if __name__ == '__main__':
+    args = parse_arguments()
+    if args.tables:
+        save_matchups_to_files(iter_matchups_from_tables(args.tables), args.output)
+        print("所有对决记录已合并保存")
+    else:
+        # 处理所有JSON文件
+        process_all_json_files(args.input, args.output, args.thinking, args.index)
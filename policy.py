@@ -0,0 +1,148 @@
+import abc
+import random
+from math import comb
+from typing import Dict, List, Optional, Tuple
+
+# 牌组构成：每种目标牌6张，外加2张Joker
+DECK_SIZE = 20
+CARDS_PER_RANK = 6
+JOKER_COUNT = 2
+
+class Policy(abc.ABC):
+    """脚本化的出牌/质疑策略，不调用LLM
+
+    玩家配置中指定 policy 后，Game 会直接调用策略做决策，跳过提示词拼装和反思阶段。
+    策略返回与 LLM 决策相同结构的结果字典，游戏记录格式保持不变。
+    """
+    name = "policy"
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        """
+        Args:
+            rng: 随机数生成器，默认使用全局 random 模块（可由 random.seed 控制）
+        """
+        self.rng = rng or random
+
+    def choose_cards_to_play(self, player, game, next_player) -> Tuple[Dict, Optional[str]]:
+        """选择出牌，返回 (结果字典, 推理内容)，结果字典包含played_cards, behavior和play_reason"""
+        cards = self.select_cards(player.hand, game.target_card)
+        for card in cards:
+            player.hand.remove(card)
+        return {"played_cards": cards, "behavior": "无", "play_reason": self.name}, None
+
+    def decide_challenge(self, player, game, challenged_player) -> Tuple[Dict, Optional[str]]:
+        """决定是否质疑上家，返回 (结果字典, 推理内容)，结果字典包含was_challenged和challenge_reason"""
+        last_action = game.game_record.get_current_round().get_last_action()
+        was_challenged = self.should_challenge(player, game, challenged_player, len(last_action.played_cards))
+        return {"was_challenged": was_challenged, "challenge_reason": self.name}, None
+
+    def reflect(self, player, game) -> None:
+        """轮次结束后的反思，脚本策略默认不做任何事"""
+
+    @abc.abstractmethod
+    def select_cards(self, hand: List[str], target_card: str) -> List[str]:
+        """从手牌中选择1-3张打出"""
+
+    @abc.abstractmethod
+    def should_challenge(self, player, game, challenged_player, claimed_count: int) -> bool:
+        """是否质疑上家宣称的 claimed_count 张目标牌"""
+
+def _matching_cards(hand: List[str], target_card: str) -> List[str]:
+    """手牌中可以当作目标牌打出的牌（目标牌优先，其次是Joker）"""
+    return [card for card in hand if card == target_card] + [card for card in hand if card == "Joker"]
+
+def _bluff_cards(hand: List[str], target_card: str) -> List[str]:
+    """手牌中的非目标牌"""
+    return [card for card in hand if card != target_card and card != "Joker"]
+
+def _claim_is_impossible(hand: List[str], target_card: str, claimed_count: int) -> bool:
+    """根据自己手中的目标牌数量，判断上家的宣称是否不可能为真"""
+    return claimed_count > CARDS_PER_RANK + JOKER_COUNT - len(_matching_cards(hand, target_card))
+
+class RandomPolicy(Policy):
+    """随机出1-3张牌，以固定概率质疑"""
+    name = "random"
+
+    def __init__(self, challenge_probability: float = 0.5, rng: Optional[random.Random] = None):
+        super().__init__(rng)
+        self.challenge_probability = challenge_probability
+
+    def select_cards(self, hand: List[str], target_card: str) -> List[str]:
+        count = self.rng.randint(1, min(3, len(hand)))
+        return self.rng.sample(hand, count)
+
+    def should_challenge(self, player, game, challenged_player, claimed_count: int) -> bool:
+        return self.rng.random() < self.challenge_probability
+
+class TruthfulPolicy(Policy):
+    """只打真牌，没有真牌时被迫打出一张假牌；只在上家的宣称不可能为真时质疑"""
+    name = "truthful"
+
+    def select_cards(self, hand: List[str], target_card: str) -> List[str]:
+        matching = _matching_cards(hand, target_card)
+        return matching[:3] if matching else [hand[0]]
+
+    def should_challenge(self, player, game, challenged_player, claimed_count: int) -> bool:
+        return _claim_is_impossible(player.hand, game.target_card, claimed_count)
+
+class ThresholdBlufferPolicy(Policy):
+    """优先打真牌；真牌不足 bluff_threshold 张时混入假牌凑数，以固定概率质疑"""
+    name = "threshold_bluffer"
+
+    def __init__(self, bluff_threshold: int = 2, challenge_probability: float = 0.3, rng: Optional[random.Random] = None):
+        super().__init__(rng)
+        self.bluff_threshold = bluff_threshold
+        self.challenge_probability = challenge_probability
+
+    def select_cards(self, hand: List[str], target_card: str) -> List[str]:
+        cards = _matching_cards(hand, target_card)[:3]
+        bluffs = _bluff_cards(hand, target_card)
+        while len(cards) < min(self.bluff_threshold, 3) and bluffs:
+            cards.append(bluffs.pop())
+        return cards
+
+    def should_challenge(self, player, game, challenged_player, claimed_count: int) -> bool:
+        if _claim_is_impossible(player.hand, game.target_card, claimed_count):
+            return True
+        return self.rng.random() < self.challenge_probability
+
+class ProbabilityChallengerPolicy(TruthfulPolicy):
+    """按真牌出牌；估计上家宣称为假的概率，超过阈值时质疑
+
+    上家出牌前的手牌视为从自己看不到的牌中随机抽取，按超几何分布计算
+    其至少拥有 claimed_count 张可当作目标牌的牌的概率。
+    """
+    name = "probability_challenger"
+
+    def __init__(self, lie_threshold: float = 0.5, rng: Optional[random.Random] = None):
+        super().__init__(rng)
+        self.lie_threshold = lie_threshold
+
+    def should_challenge(self, player, game, challenged_player, claimed_count: int) -> bool:
+        matching_unknown = CARDS_PER_RANK + JOKER_COUNT - len(_matching_cards(player.hand, game.target_card))
+        unknown = DECK_SIZE - len(player.hand)
+        hand_size = claimed_count + len(challenged_player.hand)
+        if claimed_count > matching_unknown:
+            return True
+        # P(X >= claimed_count)，X ~ 超几何分布(unknown, matching_unknown, hand_size)
+        total = comb(unknown, hand_size)
+        truthful = sum(
+            comb(matching_unknown, k) * comb(unknown - matching_unknown, hand_size - k)
+            for k in range(claimed_count, min(matching_unknown, hand_size) + 1)
+        ) / total
+        return 1 - truthful > self.lie_threshold
+
+POLICIES = {
+    RandomPolicy.name: RandomPolicy,
+    TruthfulPolicy.name: TruthfulPolicy,
+    ThresholdBlufferPolicy.name: ThresholdBlufferPolicy,
+    ProbabilityChallengerPolicy.name: ProbabilityChallengerPolicy,
+}
+
+def create_policy(policy) -> Policy:
+    """根据名称创建内置策略；传入 Policy 实例时直接返回"""
+    if isinstance(policy, Policy):
+        return policy
+    if policy not in POLICIES:
+        raise ValueError(f"未知的策略: {policy}，可选: {', '.join(POLICIES)}")
+    return POLICIES[policy]()
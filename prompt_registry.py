@@ -0,0 +1,117 @@
+import os
+import string
+import threading
+import time
+from typing import Dict, FrozenSet, Tuple
+from game_logging import get_logger
+
+logger = get_logger("prompt_registry")
+
+class PromptTemplate:
+    """已加载并解析的提示词模板"""
+    def __init__(self, text: str):
+        self.text = text
+        # 预先解析出模板中的占位符，便于检查缺失字段
+        self.fields: FrozenSet[str] = frozenset(
+            field_name for _, field_name, _, _ in string.Formatter().parse(text) if field_name
+        )
+
+    def format(self, **kwargs) -> str:
+        """填充模板"""
+        missing = self.fields - kwargs.keys()
+        if missing:
+            raise KeyError(f"提示词模板缺少字段: {', '.join(sorted(missing))}")
+        return self.text.format(**kwargs)
+
+class PromptRegistry:
+    def __init__(self, check_interval: float = 1.0):
+        """进程内共享的提示词模板缓存
+
+        每个文件只读取和解析一次，之后按修改时间判断是否需要重新加载，
+        因此修改模板后无需重启即可生效。
+
+        Args:
+            check_interval: 两次检查同一文件修改时间之间的最短间隔（秒），为0时每次都检查
+        """
+        self.check_interval = check_interval
+        # 路径 -> (模板, 文件修改时间, 上次检查时间)
+        self._cache: Dict[str, Tuple[PromptTemplate, float, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, filepath: str) -> PromptTemplate:
+        """获取模板，文件有更新时自动重新加载"""
+        now = time.monotonic()
+        cached = self._cache.get(filepath)
+        if cached is not None and now - cached[2] < self.check_interval:
+            return cached[0]
+
+        try:
+            mtime = os.stat(filepath).st_mtime
+        except OSError as e:
+            logger.warning("读取文件 %s 失败: %s", filepath, e)
+            return PromptTemplate("")
+
+        if cached is not None and cached[1] == mtime:
+            self._cache[filepath] = (cached[0], mtime, now)
+            return cached[0]
+
+        with self._lock:
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    template = PromptTemplate(f.read().strip())
+            except Exception as e:
+                logger.warning("读取文件 %s 失败: %s", filepath, e)
+                return PromptTemplate("")
+            self._cache[filepath] = (template, mtime, now)
+            return template
+
+    def read(self, filepath: str) -> str:
+        """获取文件的文本内容"""
+        return self.get(filepath).text
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._cache.clear()
+
+# 模块级单例：同一进程内的所有玩家共享；多进程运行时每个工作进程各自只加载一次
+_registry = PromptRegistry()
+
+def get_prompt_registry() -> PromptRegistry:
+    """获取进程内共享的提示词模板缓存"""
+    return _registry
+
+if __name__ == "__main__":
+    # 微基准：比较每次决策都重新读取规则和模板与使用缓存的开销
+    import timeit
+
+    rule_path = "prompt/rule_base.txt"
+    template_path = "prompt/play_card_prompt_template.txt"
+    fields = dict(
+        self_name="玩家",
+        round_base_info="现在是第1轮",
+        round_action_info="",
+        play_decision_info="",
+        current_cards="Q, K, A"
+    )
+
+    def read_file(filepath: str) -> str:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+
+    def uncached() -> str:
+        return read_file(template_path).format(rules=read_file(rule_path), **fields)
+
+    def cached() -> str:
+        return _registry.get(template_path).format(rules=_registry.read(rule_path), **fields)
+
+    def cached_always_stat() -> str:
+        return registry_stat.get(template_path).format(rules=registry_stat.read(rule_path), **fields)
+
+    registry_stat = PromptRegistry(check_interval=0)
+    assert uncached() == cached() == cached_always_stat()
+
+    number = 20000
+    for name, func in [("每次读取文件", uncached), ("缓存（每次检查mtime）", cached_always_stat), ("缓存（默认检查间隔）", cached)]:
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        print(f"{name}: 每次决策 {seconds / number * 1e6:.2f} 微秒")
@@ -0,0 +1,438 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from record_stream import load_game
+
+# 默认的索引文件
+DEFAULT_INDEX_PATH = "game_records_index.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, game_id TEXT
+);
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY, player_names TEXT, winner TEXT, num_rounds INTEGER, source_path TEXT
+);
+CREATE TABLE IF NOT EXISTS game_players (
+    game_id TEXT, player_name TEXT, model TEXT, PRIMARY KEY (game_id, player_name)
+);
+CREATE TABLE IF NOT EXISTS rounds (
+    game_id TEXT, round_id INTEGER, target_card TEXT, starting_player TEXT, round_players TEXT,
+    PRIMARY KEY (game_id, round_id)
+);
+CREATE TABLE IF NOT EXISTS plays (
+    game_id TEXT, round_id INTEGER, play_index INTEGER, target_card TEXT,
+    player_name TEXT, next_player TEXT, pair TEXT,
+    played_cards TEXT, remaining_cards TEXT, play_reason TEXT, behavior TEXT,
+    was_challenged INTEGER, challenge_reason TEXT, challenge_result INTEGER,
+    player_initial_hand TEXT, next_player_initial_hand TEXT,
+    PRIMARY KEY (game_id, round_id, play_index)
+);
+CREATE TABLE IF NOT EXISTS shots (
+    game_id TEXT, round_id INTEGER, shooter_name TEXT, bullet_hit INTEGER,
+    PRIMARY KEY (game_id, round_id)
+);
+CREATE INDEX IF NOT EXISTS plays_pair ON plays (pair, target_card, was_challenged);
+CREATE INDEX IF NOT EXISTS plays_player ON plays (player_name);
+CREATE INDEX IF NOT EXISTS plays_next_player ON plays (next_player);
+CREATE INDEX IF NOT EXISTS plays_target ON plays (target_card, was_challenged);
+CREATE INDEX IF NOT EXISTS shots_shooter ON shots (shooter_name, bullet_hit);
+CREATE INDEX IF NOT EXISTS game_players_model ON game_players (model);
+CREATE VIEW IF NOT EXISTS challenges AS
+    SELECT game_id, round_id, play_index, target_card, pair,
+           next_player AS challenger, player_name AS challenged, challenge_result AS challenge_succeeded
+    FROM plays WHERE was_challenged = 1;
+"""
+
+# 出牌记录中的手牌列，牌面（Q、K、A、Joker）不含逗号，以逗号连接保存
+_CARD_COLUMNS = ("played_cards", "remaining_cards", "player_initial_hand", "next_player_initial_hand")
+
+# iter_plays 每次从数据库读取的行数
+_FETCH_SIZE = 500
+
+_INSERT_PLAY = (
+    "INSERT OR REPLACE INTO plays (game_id, round_id, play_index, target_card, player_name, next_player, pair, "
+    "played_cards, remaining_cards, play_reason, behavior, was_challenged, challenge_reason, challenge_result, "
+    "player_initial_hand, next_player_initial_hand) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+def matchup_pair(player: str, opponent: str) -> str:
+    """两名玩家的对决标识，与 player_matchup_analyze 的文件名一致，例如 Claude_vs_Gemini"""
+    return "_vs_".join(sorted([player, opponent]))
+
+def _join_cards(cards: Optional[List[str]]) -> Optional[str]:
+    return None if cards is None else ",".join(cards)
+
+def _split_cards(text: Optional[str]) -> Optional[List[str]]:
+    if text is None:
+        return None
+    return text.split(",") if text else []
+
+def _to_bool(value) -> Optional[bool]:
+    return None if value is None else bool(value)
+
+class RecordIndex:
+    """游戏记录的SQLite索引
+
+    按玩家对、模型、目标牌和结果索引游戏、轮次、出牌、质疑（challenges 视图）和开枪记录。
+    可以从记录目录增量构建（只重新索引新增或修改过的文件），也可以由 GameRecord 在游戏进行中实时写入。
+    索引不保存推理内容和玩家印象，需要时通过 games.source_path 回到原始记录读取。
+    """
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        # 连接由锁保护，允许在创建它的线程之外使用（例如在其他线程中运行的游戏）
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            # WAL模式允许多个工作进程同时写入同一个索引
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ---- 写入 ----
+
+    def _delete_game(self, game_id: str) -> None:
+        for table in ("games", "game_players", "rounds", "plays", "shots"):
+            self._conn.execute(f"DELETE FROM {table} WHERE game_id = ?", (game_id,))
+
+    def _insert_game(self, game_id: str, player_names: List[str], player_models: Optional[Dict[str, str]],
+                     source_path: Optional[str]) -> None:
+        self._delete_game(game_id)
+        self._conn.execute(
+            "INSERT INTO games (game_id, player_names, winner, num_rounds, source_path) VALUES (?, ?, NULL, 0, ?)",
+            (game_id, json.dumps(player_names, ensure_ascii=False), source_path)
+        )
+        self._conn.executemany(
+            "INSERT INTO game_players (game_id, player_name, model) VALUES (?, ?, ?)",
+            [(game_id, name, (player_models or {}).get(name)) for name in player_names]
+        )
+
+    def _insert_round(self, game_id: str, round_data: Dict) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO rounds (game_id, round_id, target_card, starting_player, round_players) VALUES (?, ?, ?, ?, ?)",
+            (game_id, round_data["round_id"], round_data["target_card"], round_data["starting_player"],
+             json.dumps(round_data.get("round_players", []), ensure_ascii=False))
+        )
+        self._conn.execute("UPDATE games SET num_rounds = num_rounds + 1 WHERE game_id = ?", (game_id,))
+
+    def _play_rows(self, game_id: str, round_data: Dict, plays) -> List[tuple]:
+        """出牌表的行，plays 为 (出牌序号, 出牌记录)"""
+        round_id, target_card = round_data["round_id"], round_data["target_card"]
+        initial_hands = {state["player_name"]: _join_cards(state["initial_hand"])
+                         for state in round_data.get("player_initial_states", [])}
+        rows = []
+        for play_index, play in plays:
+            player, next_player = play["player_name"], play["next_player"]
+            was_challenged, challenge_result = play.get("was_challenged"), play.get("challenge_result")
+            rows.append((
+                game_id, round_id, play_index, target_card, player, next_player, matchup_pair(player, next_player),
+                _join_cards(play["played_cards"]), _join_cards(play["remaining_cards"]),
+                play.get("play_reason"), play.get("behavior"),
+                None if was_challenged is None else int(was_challenged), play.get("challenge_reason"),
+                None if challenge_result is None else int(challenge_result),
+                initial_hands.get(player), initial_hands.get(next_player)
+            ))
+        return rows
+
+    def _insert_shot(self, game_id: str, round_id: int, result: Dict) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO shots (game_id, round_id, shooter_name, bullet_hit) VALUES (?, ?, ?, ?)",
+            (game_id, round_id, result["shooter_name"], int(result["bullet_hit"]))
+        )
+
+    def _finish(self, game_id: str, winner: Optional[str]) -> None:
+        self._conn.execute("UPDATE games SET winner = ? WHERE game_id = ?", (winner, game_id))
+
+    def add_game(self, game_data: Dict, game_id: Optional[str] = None, source_path: Optional[str] = None) -> None:
+        """
+        索引（或重新索引）一局完整的游戏
+
+        Args:
+            game_data: GameRecord.to_dict() 格式的游戏记录
+            game_id: 游戏ID，默认使用记录中的 game_id
+            source_path: 记录文件路径，需要推理内容等未索引的字段时从这里读取
+        """
+        with self._lock:
+            try:
+                self._insert_full_game(game_id or game_data["game_id"], game_data, source_path)
+            except BaseException:
+                # 记录不完整时不留下半局游戏
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def _insert_full_game(self, game_id: str, game_data: Dict, source_path: Optional[str]) -> None:
+        self._insert_game(game_id, game_data.get("player_names", []), game_data.get("player_models"), source_path)
+        for round_data in game_data.get("rounds", []):
+            self._insert_round(game_id, round_data)
+            self._conn.executemany(_INSERT_PLAY, self._play_rows(game_id, round_data, enumerate(round_data.get("play_history", []))))
+            if round_data.get("round_result"):
+                self._insert_shot(game_id, round_data["round_id"], round_data["round_result"])
+        self._finish(game_id, game_data.get("winner"))
+
+    def update_from_directory(self, directory: str) -> Dict[str, int]:
+        """
+        增量索引目录中的json记录：按路径、修改时间和大小判断，只重新索引新增或修改过的文件，并移除已删除文件的索引
+
+        游戏ID使用文件名（与 player_matchup_analyze 一致）。所有文件在同一个事务中写入，
+        无法读取的文件通过保存点单独回滚。
+
+        Returns:
+            Dict[str, int]: indexed（本次索引的文件数）、unchanged（未变化的文件数）、removed（移除的文件数）、failed（读取失败的文件数）
+        """
+        directory = os.path.abspath(directory)
+        with self._lock:
+            known = {row["path"]: (row["mtime_ns"], row["size"], row["game_id"])
+                     for row in self._conn.execute("SELECT path, mtime_ns, size, game_id FROM files")}
+        counts = {"indexed": 0, "unchanged": 0, "removed": 0, "failed": 0}
+        present = set()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for filename in sorted(os.listdir(directory)):
+                    if not filename.endswith(".json"):
+                        continue
+                    path = os.path.join(directory, filename)
+                    present.add(path)
+                    stat = os.stat(path)
+                    entry = known.get(path)
+                    if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                        counts["unchanged"] += 1
+                        continue
+                    game_id = os.path.splitext(filename)[0]
+                    self._conn.execute("SAVEPOINT record")
+                    try:
+                        self._insert_full_game(game_id, load_game(path), path)
+                    except (OSError, ValueError, KeyError, TypeError) as e:
+                        self._conn.execute("ROLLBACK TO record")
+                        self._conn.execute("RELEASE record")
+                        print(f"无法索引 {filename}: {e}")
+                        counts["failed"] += 1
+                        continue
+                    self._conn.execute("RELEASE record")
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO files (path, mtime_ns, size, game_id) VALUES (?, ?, ?, ?)",
+                        (path, stat.st_mtime_ns, stat.st_size, game_id)
+                    )
+                    counts["indexed"] += 1
+
+                for path, (_, _, game_id) in known.items():
+                    if os.path.dirname(path) == directory and path not in present:
+                        self._delete_game(game_id)
+                        self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                        counts["removed"] += 1
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+        return counts
+
+    # ---- 实时写入（由 GameRecord 调用） ----
+
+    def begin_game(self, game_id: str, player_names: List[str], player_models: Optional[Dict[str, str]] = None,
+                   source_path: Optional[str] = None) -> None:
+        """开始实时索引一局游戏，同一ID的旧索引会被替换"""
+        with self._lock:
+            self._insert_game(game_id, player_names, player_models, source_path)
+            self._conn.commit()
+
+    def add_round(self, game_id: str, round_data: Dict) -> None:
+        """索引新一轮（RoundRecord.to_dict() 格式，出牌和结果分别写入）"""
+        with self._lock:
+            self._insert_round(game_id, round_data)
+            self._conn.commit()
+
+    def add_play(self, game_id: str, round_data: Dict, play_index: int, play: Dict) -> None:
+        """索引一次出牌（质疑信息之后由 update_challenge 写入）"""
+        with self._lock:
+            self._conn.execute(_INSERT_PLAY, self._play_rows(game_id, round_data, [(play_index, play)])[0])
+            self._conn.commit()
+
+    def update_challenge(self, game_id: str, round_id: int, play_index: int, was_challenged: bool,
+                         reason: Optional[str], result: Optional[bool]) -> None:
+        """写入出牌之后的质疑信息"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE plays SET was_challenged = ?, challenge_reason = ?, challenge_result = ? "
+                "WHERE game_id = ? AND round_id = ? AND play_index = ?",
+                (int(was_challenged), reason, None if result is None else int(result), game_id, round_id, play_index)
+            )
+            self._conn.commit()
+
+    def add_shot(self, game_id: str, round_id: int, shooter_name: str, bullet_hit: bool) -> None:
+        """索引一次开枪"""
+        with self._lock:
+            self._insert_shot(game_id, round_id, {"shooter_name": shooter_name, "bullet_hit": bullet_hit})
+            self._conn.commit()
+
+    def finish_game(self, game_id: str, winner: Optional[str]) -> None:
+        """记录胜利者"""
+        with self._lock:
+            self._finish(game_id, winner)
+            self._conn.commit()
+
+    # ---- 查询 ----
+
+    def query_plays(self, players: Sequence[str] = (), models: Sequence[str] = (), target_card: Optional[str] = None,
+                    challenged: Optional[bool] = None, challenge_result: Optional[bool] = None,
+                    game_id: Optional[str] = None, source_directory: Optional[str] = None,
+                    limit: Optional[int] = None) -> List[Dict]:
+        """查询出牌记录并以列表返回，参数和字段同 iter_plays"""
+        return list(self.iter_plays(players, models, target_card, challenged, challenge_result,
+                                    game_id, source_directory, limit))
+
+    def iter_plays(self, players: Sequence[str] = (), models: Sequence[str] = (), target_card: Optional[str] = None,
+                   challenged: Optional[bool] = None, challenge_result: Optional[bool] = None,
+                   game_id: Optional[str] = None, source_directory: Optional[str] = None,
+                   limit: Optional[int] = None) -> Iterator[Dict]:
+        """
+        逐条返回出牌记录，按游戏、轮次和出牌顺序排列；结果分批从数据库读取，内存占用与结果总数无关
+
+        Args:
+            players: 一名玩家时返回其出牌或被其质疑的记录，两名玩家时只返回两人之间的出牌（不分方向）
+            models: 按模型筛选，规则同 players
+            target_card: 目标牌
+            challenged: 是否被质疑
+            challenge_result: 质疑是否成功
+            game_id: 只查询某一局
+            source_directory: 只查询记录文件位于该目录的游戏（一个索引可以包含多个记录目录）
+            limit: 最多返回的条数
+        Yields:
+            Dict: 出牌记录，字段与游戏记录中的出牌相同，另有 game_id、round_id、play_index、target_card、
+                player_model、next_player_model、player_initial_hand、next_player_initial_hand
+        """
+        conditions, params = [], []
+        for column_pair, values in ((("p.player_name", "p.next_player"), players),
+                                    (("gp1.model", "gp2.model"), models)):
+            if len(values) == 1:
+                conditions.append(f"({column_pair[0]} = ? OR {column_pair[1]} = ?)")
+                params += [values[0], values[0]]
+            elif len(values) == 2:
+                conditions.append(f"(({column_pair[0]} = ? AND {column_pair[1]} = ?) OR ({column_pair[0]} = ? AND {column_pair[1]} = ?))")
+                params += [values[0], values[1], values[1], values[0]]
+            elif values:
+                raise ValueError("最多指定两名玩家或两个模型")
+        if source_directory is not None:
+            prefix = os.path.join(os.path.abspath(source_directory), "")
+            conditions.append("p.game_id IN (SELECT game_id FROM games WHERE substr(source_path, 1, ?) = ?)")
+            params += [len(prefix), prefix]
+        for column, value in (("p.target_card", target_card), ("p.was_challenged", challenged),
+                              ("p.challenge_result", challenge_result), ("p.game_id", game_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(int(value) if isinstance(value, bool) else value)
+
+        sql = ("SELECT p.*, gp1.model AS player_model, gp2.model AS next_player_model FROM plays p "
+               "LEFT JOIN game_players gp1 ON gp1.game_id = p.game_id AND gp1.player_name = p.player_name "
+               "LEFT JOIN game_players gp2 ON gp2.game_id = p.game_id AND gp2.player_name = p.next_player")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY p.game_id, p.round_id, p.play_index"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(_FETCH_SIZE)
+            if not rows:
+                return
+            for row in rows:
+                play = dict(row)
+                for column in _CARD_COLUMNS:
+                    play[column] = _split_cards(play[column])
+                play["was_challenged"] = _to_bool(play["was_challenged"])
+                play["challenge_result"] = _to_bool(play["challenge_result"])
+                yield play
+
+    def query_shots(self, player: Optional[str] = None, model: Optional[str] = None,
+                    bullet_hit: Optional[bool] = None, game_id: Optional[str] = None) -> List[Dict]:
+        """查询开枪记录，按游戏和轮次排列"""
+        conditions, params = [], []
+        for column, value in (("s.shooter_name", player), ("gp.model", model), ("s.bullet_hit", bullet_hit), ("s.game_id", game_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(int(value) if isinstance(value, bool) else value)
+        sql = ("SELECT s.*, r.target_card, gp.model AS shooter_model FROM shots s "
+               "JOIN rounds r ON r.game_id = s.game_id AND r.round_id = s.round_id "
+               "LEFT JOIN game_players gp ON gp.game_id = s.game_id AND gp.player_name = s.shooter_name")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY s.game_id, s.round_id"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row, bullet_hit=bool(row["bullet_hit"])) for row in rows]
+
+    def game_source(self, game_id: str) -> Optional[str]:
+        """游戏记录文件路径（实时索引且未保存文件的游戏为None）"""
+        with self._lock:
+            row = self._conn.execute("SELECT source_path FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        return row["source_path"] if row else None
+
+    def game_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+def _parse_bool_choice(value: Optional[str]) -> Optional[bool]:
+    return None if value is None else value == "yes"
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='游戏记录索引：增量构建并按玩家、模型、目标牌和结果查询')
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help=f'索引文件 (默认: {DEFAULT_INDEX_PATH})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='增量索引记录目录')
+    build.add_argument('-d', '--directory', default='game_records', help='游戏记录目录 (默认: game_records)')
+
+    plays = subparsers.add_parser('plays', help='查询出牌和质疑')
+    plays.add_argument('--players', nargs='+', default=[], metavar='NAME', help='一名或两名玩家')
+    plays.add_argument('--models', nargs='+', default=[], metavar='MODEL', help='一个或两个模型')
+    plays.add_argument('--target', choices=['Q', 'K', 'A'], default=None, help='目标牌')
+    plays.add_argument('--challenged', choices=['yes', 'no'], default=None, help='是否被质疑')
+    plays.add_argument('--succeeded', choices=['yes', 'no'], default=None, help='质疑是否成功')
+    plays.add_argument('-d', '--directory', default=None, help='只查询该记录目录中的游戏')
+    plays.add_argument('--limit', type=int, default=None, help='最多显示的条数')
+
+    shots = subparsers.add_parser('shots', help='查询开枪记录')
+    shots.add_argument('--player', default=None, help='开枪的玩家')
+    shots.add_argument('--model', default=None, help='开枪玩家的模型')
+    shots.add_argument('--hit', choices=['yes', 'no'], default=None, help='是否中弹')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    index = RecordIndex(args.index)
+    if args.command == 'build':
+        counts = index.update_from_directory(args.directory)
+        print(f"新索引 {counts['indexed']} 个文件，未变化 {counts['unchanged']} 个，移除 {counts['removed']} 个，失败 {counts['failed']} 个；"
+              f"索引中共 {index.game_count()} 局游戏")
+    elif args.command == 'plays':
+        rows = index.query_plays(args.players, args.models, args.target, _parse_bool_choice(args.challenged),
+                                 _parse_bool_choice(args.succeeded), source_directory=args.directory, limit=args.limit)
+        for play in rows:
+            line = (f"{play['game_id']} 第{play['round_id']}轮 目标牌{play['target_card']}："
+                    f"{play['player_name']} 打出 {'、'.join(play['played_cards'])}")
+            if play['was_challenged']:
+                line += f"，{play['next_player']} 质疑{'成功' if play['challenge_result'] else '失败'}"
+            else:
+                line += f"，{play['next_player']} 未质疑"
+            print(line)
+        print(f"共 {len(rows)} 条")
+    elif args.command == 'shots':
+        rows = index.query_shots(args.player, args.model, _parse_bool_choice(args.hit))
+        for shot in rows:
+            print(f"{shot['game_id']} 第{shot['round_id']}轮 目标牌{shot['target_card']}：{shot['shooter_name']} "
+                  f"{'中弹' if shot['bullet_hit'] else '未中弹'}")
+        print(f"共 {len(rows)} 条")
+    index.close()
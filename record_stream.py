@@ -0,0 +1,255 @@
+import json
+import os
+import re
+from typing import Dict, Iterator, Optional, Tuple
+
+try:
+    # 可选加速：ijson 会自动选用C实现的 yajl2_c 后端
+    import ijson
+except ImportError:
+    ijson = None
+
+# 小于该大小的记录直接用 json.load 读取，更快且内存占用本身有限；更大的记录流式解析
+STREAMING_THRESHOLD = 1 << 20
+_CHUNK_SIZE = 1 << 16
+
+# 默认跳过的大字段
+THINKING_KEYS = ("play_thinking", "challenge_thinking")
+OPINIONS_KEY = "player_opinions"
+
+_TOKEN = re.compile(r'\s*(?:([{}\[\]:,])|("[^"\\]*(?:\\.[^"\\]*)*")|(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)|(true|false|null))', re.S)
+# 数字记号之后可能属于同一个数字的字符：数字在这些字符处被块边界截断时（如 "12." 或 "3e"），需要读入下一块
+_NUMBER_TAIL = re.compile(r'[\d.eE+-]*')
+_LITERALS = {"true": ("boolean", True), "false": ("boolean", False), "null": ("null", None)}
+
+def _tokenize(file) -> Iterator[Tuple[str, object]]:
+    """逐块读取文件并切分为JSON记号，缓冲区最多只保存一个未读完的字符串"""
+    buffer = ""
+    position = 0
+    eof = False
+    while True:
+        match = _TOKEN.match(buffer, position)
+        # 记号可能被块边界截断（例如未闭合的字符串或数字），读入下一块后重新匹配
+        if not eof and (match is None or match.end() == len(buffer) or (
+                match.group(3) is not None and _NUMBER_TAIL.match(buffer, match.end()).end() == len(buffer))):
+            # 按缓冲区大小读取，超长字符串只需重新匹配对数次
+            chunk = file.read(max(_CHUNK_SIZE, len(buffer) - position))
+            if chunk:
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            eof = True
+            continue
+        if match is None:
+            if buffer[position:].strip():
+                raise ValueError(f"无法解析的JSON内容: {buffer[position:position + 40]!r}")
+            return
+        position = match.end()
+        punctuation, string, number, literal = match.groups()
+        if punctuation:
+            yield "punctuation", punctuation
+        elif string is not None:
+            yield "string", json.loads(string)
+        elif number is not None:
+            yield "number", float(number) if any(c in number for c in ".eE") else int(number)
+        else:
+            yield _LITERALS[literal]
+
+def _basic_parse(file) -> Iterator[Tuple[str, object]]:
+    """
+    纯Python的JSON事件解析，输出与 ijson.basic_parse 相同的 (事件, 值)：
+    start_map、map_key、end_map、start_array、end_array、string、number、boolean、null
+    """
+    # 栈中记录容器类型，对象中逗号或左花括号之后的字符串是键
+    stack = []
+    expect_key = False
+    for kind, value in _tokenize(file):
+        if kind == "punctuation":
+            if value == "{":
+                stack.append("map")
+                expect_key = True
+                yield "start_map", None
+            elif value == "}":
+                stack.pop()
+                expect_key = False
+                yield "end_map", None
+            elif value == "[":
+                stack.append("array")
+                yield "start_array", None
+            elif value == "]":
+                stack.pop()
+                yield "end_array", None
+            elif value == ",":
+                expect_key = bool(stack) and stack[-1] == "map"
+        elif kind == "string" and expect_key:
+            expect_key = False
+            yield "map_key", value
+        else:
+            yield kind, value
+
+def _events(file):
+    if ijson is not None:
+        return ijson.basic_parse(file, use_float=True)
+    return _basic_parse(file)
+
+def _read_value(events, first):
+    """从第一个事件开始读取一个完整的值"""
+    event, value = first
+    if event == "start_map":
+        result = {}
+        for key in _map_keys(events):
+            result[key] = _read_value(events, next(events))
+        return result
+    if event == "start_array":
+        return [_read_value(events, item) for item in _array_items(events)]
+    return value
+
+def _skip_value(events, first) -> None:
+    """跳过一个值，不构造任何对象"""
+    event, _ = first
+    if event not in ("start_map", "start_array"):
+        return
+    depth = 1
+    for event, _ in events:
+        if event in ("start_map", "start_array"):
+            depth += 1
+        elif event in ("end_map", "end_array"):
+            depth -= 1
+            if depth == 0:
+                return
+
+def _map_keys(events) -> Iterator[str]:
+    """依次返回对象的键（start_map 之后调用），调用方需要在取下一个键之前读取或跳过对应的值"""
+    for event, value in events:
+        if event == "end_map":
+            return
+        yield value
+
+def _array_items(events) -> Iterator[Tuple[str, object]]:
+    """依次返回数组中每个元素的第一个事件（start_array 之后调用），元素为对象时 start_map 已被读取"""
+    for item in events:
+        if item[0] == "end_array":
+            return
+        yield item
+
+def _skipped_keys(include_thinking: bool, include_opinions: bool) -> Tuple[str, ...]:
+    return (() if include_thinking else THINKING_KEYS) + (() if include_opinions else (OPINIONS_KEY,))
+
+def _game_start(game: Dict) -> Dict:
+    data = {"game_id": game.get("game_id"), "player_names": game.get("player_names", [])}
+    if "player_models" in game:
+        data["player_models"] = game["player_models"]
+    return data
+
+def _stream_events(file, skipped) -> Iterator[Tuple[str, Dict]]:
+    events = iter(_events(file))
+    if next(events)[0] != "start_map":
+        raise ValueError("游戏记录应为JSON对象")
+    game = {}
+    game_started = False
+    for key in _map_keys(events):
+        if key != "rounds":
+            game[key] = _read_value(events, next(events))
+            continue
+        game_started = True
+        yield "game_start", _game_start(game)
+        next(events)  # start_array
+        for _ in _array_items(events):
+            round_header = {}
+            round_result = None
+            header_sent = False
+            for round_key in _map_keys(events):
+                if round_key in skipped:
+                    _skip_value(events, next(events))
+                elif round_key == "play_history":
+                    header_sent = True
+                    yield "round_start", round_header
+                    next(events)  # start_array
+                    for _ in _array_items(events):
+                        play = {}
+                        for play_key in _map_keys(events):
+                            if play_key in skipped:
+                                _skip_value(events, next(events))
+                            else:
+                                play[play_key] = _read_value(events, next(events))
+                        yield "play", play
+                elif round_key == "round_result":
+                    round_result = _read_value(events, next(events))
+                else:
+                    round_header[round_key] = _read_value(events, next(events))
+            if not header_sent:
+                yield "round_start", round_header
+            if round_result:
+                yield "shooting", round_result
+    if not game_started:
+        yield "game_start", _game_start(game)
+    yield "finish", {key: game[key] for key in ("winner",) if key in game}
+
+def _dict_events(game_data: Dict, skipped) -> Iterator[Tuple[str, Dict]]:
+    yield "game_start", _game_start(game_data)
+    for round_data in game_data.get("rounds", []):
+        yield "round_start", {key: value for key, value in round_data.items()
+                              if key not in skipped and key not in ("play_history", "round_result")}
+        for play in round_data.get("play_history", []):
+            yield "play", {key: value for key, value in play.items() if key not in skipped}
+        if round_data.get("round_result"):
+            yield "shooting", round_data["round_result"]
+    yield "finish", {key: game_data[key] for key in ("winner",) if key in game_data}
+
+def iter_record_events(path: str, include_thinking: bool = False, include_opinions: bool = False) -> Iterator[Tuple[str, Dict]]:
+    """
+    逐个返回游戏记录中的事件，不把整个记录读入内存
+
+    事件与事件日志一致：game_start（game_id、player_names，记录中有 player_models 时一并返回）、round_start（不含出牌和结果的轮次字段）、
+    play（包含质疑字段的一次出牌）、shooting（本轮开枪结果）、finish（记录末尾的 winner，记录中没有该字段时为空）。
+    大记录的内存占用只取决于单次出牌的大小，与记录总大小无关。
+
+    Args:
+        path: json游戏记录路径
+        include_thinking: 是否保留 play_thinking 和 challenge_thinking，默认跳过
+        include_opinions: 是否保留 round_start 中的 player_opinions，默认跳过
+    """
+    skipped = _skipped_keys(include_thinking, include_opinions)
+    if os.path.getsize(path) < STREAMING_THRESHOLD:
+        with open(path, "r", encoding="utf-8") as file:
+            game_data = json.load(file)
+        yield from _dict_events(game_data, skipped)
+        return
+    # ijson 读取字节，纯Python解析器读取文本
+    with open(path, "rb") if ijson is not None else open(path, "r", encoding="utf-8") as file:
+        yield from _stream_events(file, skipped)
+
+def load_game(path: str, include_thinking: bool = False, include_opinions: bool = False) -> Dict:
+    """
+    读取游戏记录，结构与 GameRecord.to_dict() 相同，但默认不包含推理内容和玩家印象
+
+    参数同 iter_record_events。
+    """
+    if os.path.getsize(path) < STREAMING_THRESHOLD:
+        with open(path, "r", encoding="utf-8") as file:
+            game_data = json.load(file)
+        skipped = _skipped_keys(include_thinking, include_opinions)
+        for round_data in game_data.get("rounds", []):
+            for key in skipped:
+                round_data.pop(key, None)
+            for play in round_data.get("play_history", []):
+                for key in skipped:
+                    play.pop(key, None)
+        return game_data
+
+    game_data: Dict = {}
+    current_round: Optional[Dict] = None
+    for event, data in iter_record_events(path, include_thinking, include_opinions):
+        if event == "game_start":
+            game_data.update(data)
+            game_data["rounds"] = []
+        elif event == "round_start":
+            current_round = dict(data, play_history=[], round_result=None)
+            game_data["rounds"].append(current_round)
+        elif event == "play":
+            current_round["play_history"].append(data)
+        elif event == "shooting":
+            current_round["round_result"] = data
+        elif event == "finish":
+            game_data["winner"] = data.get("winner")
+    return game_data
@@ -0,0 +1,55 @@
+import random
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from openai import APIConnectionError, APITimeoutError
+
+# 各决策阶段默认的最大尝试次数（包括第一次请求）
+DEFAULT_RETRY_BUDGETS: Dict[str, int] = {
+    "play": 5,
+    "challenge": 5,
+    "reflect": 1,
+}
+
+def is_retryable_error(error: Exception) -> bool:
+    """限流（429）、服务端错误（5xx）、连接失败和超时可以重试，其他错误（如400、401）重试也不会成功"""
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+@dataclass
+class RetryPolicy:
+    """LLM请求的重试策略
+
+    max_retries 为请求出错后的最大重试次数，等待时间按指数增长并加入完全随机抖动（full jitter），
+    避免多个进程在服务商过载时同时重试。抖动使用独立的随机数生成器，不影响游戏的随机种子。
+    """
+    max_retries: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    rng: random.Random = field(default_factory=random.Random, repr=False)
+
+    def backoff_delay(self, retry: int, retry_after: Optional[float] = None) -> float:
+        """
+        第 retry 次重试（从0开始）前的等待秒数
+
+        Args:
+            retry: 已经重试的次数
+            retry_after: 服务端通过 Retry-After 指定的等待时间，存在时不早于该时间重试
+        """
+        delay = self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """读取错误响应中的 Retry-After 头（秒），不存在或无法解析时返回None"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
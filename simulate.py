@@ -0,0 +1,112 @@
+from game import Game
+from policy import POLICIES
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import argparse
+import random
+import time
+
+def run_simulations(player_configs: List[Dict], num_games: int, save_records: bool = False, seed: Optional[int] = None) -> Tuple[Counter, float]:
+    """
+    在不调用LLM、不打印过程的情况下批量运行游戏
+
+    Args:
+        player_configs: 玩家配置列表，每个配置包含 name 和 policy 字段
+        num_games: 游戏局数
+        save_records: 是否将每局记录保存到 game_records（可被现有分析工具读取）
+        seed: 随机种子
+
+    Returns:
+        tuple: (各玩家获胜次数, 耗时秒数)
+    """
+    if seed is not None:
+        random.seed(seed)
+
+    wins = Counter()
+    start = time.perf_counter()
+    for _ in range(num_games):
+        game = Game(player_configs, save_record=save_records)
+        game.start_game()
+        wins[game.game_record.winner] += 1
+    return wins, time.perf_counter() - start
+
+def _simulate_chunk(player_configs: List[Dict], num_games: int, save_records: bool, seed: Optional[int]) -> Counter:
+    """工作进程中模拟一批游戏，返回各玩家获胜次数"""
+    wins, _ = run_simulations(player_configs, num_games, save_records=save_records, seed=seed)
+    return wins
+
+def run_simulations_parallel(player_configs: List[Dict], num_games: int, workers: int, save_records: bool = False, seed: Optional[int] = None) -> Tuple[Counter, float]:
+    """
+    将模拟平均分配到多个进程，单进程吞吐受限于纯Python的游戏引擎
+
+    Returns:
+        tuple: (各玩家获胜次数, 耗时秒数)
+    """
+    chunk_sizes = [num_games // workers + (1 if i < num_games % workers else 0) for i in range(workers)]
+    start = time.perf_counter()
+    wins = Counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_simulate_chunk, player_configs, size, save_records, None if seed is None else seed + i)
+            for i, size in enumerate(chunk_sizes) if size
+        ]
+        for future in futures:
+            wins.update(future.result())
+    return wins, time.perf_counter() - start
+
+def parse_arguments():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description='使用脚本策略批量模拟游戏，估计规则本身的基准胜率',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        '-n', '--num-games',
+        type=int,
+        default=10000,
+        help='要模拟的游戏局数 (默认: 10000)'
+    )
+    parser.add_argument(
+        '-p', '--policies',
+        nargs='+',
+        choices=list(POLICIES),
+        default=['random', 'truthful', 'threshold_bluffer', 'probability_challenger'],
+        help='每个座位使用的策略，2-4个'
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=1,
+        help='并行模拟的进程数 (默认: 1)'
+    )
+    parser.add_argument(
+        '--save',
+        action='store_true',
+        help='将每局记录保存到 game_records'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help='随机种子'
+    )
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arguments()
+
+    player_configs = [
+        {"name": f"{policy}_{seat + 1}", "policy": policy}
+        for seat, policy in enumerate(args.policies)
+    ]
+
+    if args.workers > 1:
+        wins, elapsed = run_simulations_parallel(player_configs, args.num_games, args.workers, save_records=args.save, seed=args.seed)
+    else:
+        wins, elapsed = run_simulations(player_configs, args.num_games, save_records=args.save, seed=args.seed)
+
+    print(f"模拟 {args.num_games} 局，用时 {elapsed:.2f} 秒（{args.num_games / elapsed:.0f} 局/秒）")
+    for config in player_configs:
+        name = config["name"]
+        print(f"{name}: {wins[name]} 场 ({wins[name] / args.num_games * 100:.1f}%)")
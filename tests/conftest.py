@@ -0,0 +1,81 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# 仓库是平铺的模块，测试直接导入根目录下的模块
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+class StubServer:
+    """本地的OpenAI兼容服务：记录每个模型同时进行中的请求数和使用过的连接"""
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = Counter()
+        self.max_in_flight = Counter()
+        self.connections = set()
+        # 每个模型接下来的若干次请求返回的错误状态码
+        self.failures = defaultdict(list)
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                model = body["model"]
+                with stub.lock:
+                    stub.requests += 1
+                    stub.connections.add(self.client_address)
+                    if stub.failures[model]:
+                        self._reply(stub.failures[model].pop(0), {"error": {"message": "stub error"}})
+                        return
+                    stub.in_flight[model] += 1
+                    stub.max_in_flight[model] = max(stub.max_in_flight[model], stub.in_flight[model])
+                time.sleep(stub.delay)
+                with stub.lock:
+                    stub.in_flight[model] -= 1
+                self._reply(200, {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": body["messages"][-1]["content"].upper()},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 7, "completion_tokens": 3, "total_tokens": 10},
+                })
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    yield server
+    server.close()
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from llm_client import AsyncLLMClient, get_last_call, reset_last_call, run_async
+from retry_policy import RetryPolicy
+
+def make_client(stub, **kwargs):
+    return AsyncLLMClient(api_key="test", base_url=stub.base_url,
+                          retry_policy=RetryPolicy(base_delay=0.01, max_delay=0.05), **kwargs)
+
+def test_achat_returns_content_and_usage(stub):
+    client = make_client(stub)
+
+    async def call():
+        reset_last_call()
+        result = await client.achat([{"role": "user", "content": "hello"}], model="m")
+        return result, get_last_call()
+
+    (content, _), last_call = asyncio.run(call())
+    assert content == "HELLO"
+    assert last_call["prompt_tokens"] == 7 and last_call["completion_tokens"] == 3
+
+def test_achat_caps_in_flight_requests_per_model(stub):
+    client = make_client(stub, max_concurrency_per_model=3)
+
+    async def burst():
+        return await asyncio.gather(*(
+            client.achat([{"role": "user", "content": f"{model}{i}"}], model=model)
+            for model in ("a", "b") for i in range(12)
+        ))
+
+    started = time.perf_counter()
+    results = asyncio.run(burst())
+    elapsed = time.perf_counter() - started
+    assert [content for content, _ in results] == [f"{model}{i}".upper() for model in ("a", "b") for i in range(12)]
+    assert stub.max_in_flight == {"a": 3, "b": 3}
+    # 两个模型各4批请求并发进行，远快于逐个请求的 24 * delay
+    assert elapsed < 24 * stub.delay
+
+def test_achat_reuses_keep_alive_connections(stub):
+    client = make_client(stub, max_concurrency_per_model=2)
+
+    async def calls():
+        for _ in range(3):
+            await asyncio.gather(*(client.achat([{"role": "user", "content": "x"}], model="m") for _ in range(2)))
+
+    asyncio.run(calls())
+    assert stub.requests == 6
+    assert len(stub.connections) == 2
+
+def test_run_async_shares_one_loop_across_calls(stub):
+    client = make_client(stub)
+    for i in range(3):
+        content, _ = run_async(client.achat([{"role": "user", "content": f"call{i}"}], model="m"))
+        assert content == f"CALL{i}"
+    # 连接池绑定在共享的事件循环上，多次 run_async 之间复用同一个连接
+    assert len(stub.connections) == 1
+
+def test_achat_retries_server_errors(stub):
+    stub.failures["m"] = [503, 503]
+    client = make_client(stub)
+    content, _ = asyncio.run(client.achat([{"role": "user", "content": "retry"}], model="m"))
+    assert content == "RETRY"
+    assert stub.requests == 3
@@ -0,0 +1,64 @@
+import json
+import random
+
+import pytest
+
+from game import Game
+from game_record import compact_event_log, compact_event_logs
+from policy import RandomPolicy, ThresholdBlufferPolicy
+
+class OpinionatedPolicy(RandomPolicy):
+    """每轮结束后只更新对部分玩家的印象，使事件日志中出现只包含变化部分的印象"""
+    name = "opinionated"
+
+    def reflect(self, player, game) -> None:
+        round_id = len(game.game_record.rounds)
+        for other in player.opinions:
+            if (round_id + len(other)) % 3 == 0:
+                player.opinions[other] = f"{player.name} 在第{round_id}轮后对 {other} 的印象"
+
+def play_logged_game(seed, game_id):
+    random.seed(seed)
+    game = Game([
+        {"name": "甲", "policy": OpinionatedPolicy()},
+        {"name": "乙乙", "policy": "truthful"},
+        {"name": "丙丙丙", "policy": OpinionatedPolicy()},
+        {"name": "丁", "policy": ThresholdBlufferPolicy()},
+    ], game_id=game_id, event_log=True)
+    game.start_game()
+    return game
+
+@pytest.mark.parametrize("seed", range(10))
+def test_compacted_log_equals_full_record(tmp_path, monkeypatch, seed):
+    monkeypatch.chdir(tmp_path)
+    game = play_logged_game(seed, f"game{seed}")
+    expected = game.game_record.to_dict()
+    assert len(expected["rounds"]) > 1
+
+    compacted = compact_event_log(f"game_records/game{seed}.jsonl", "")
+    assert compacted == expected
+    # 键顺序也与完整记录一致，两种方式保存的文件逐字节相同
+    assert json.dumps(compacted, ensure_ascii=False) == json.dumps(expected, ensure_ascii=False)
+    with open(f"game_records/game{seed}.json", encoding="utf-8") as file:
+        assert json.load(file) == expected
+
+def test_truncated_log_compacts_to_the_complete_events(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    game = play_logged_game(0, "crashed")
+    expected = game.game_record.to_dict()
+    log_path = tmp_path / "game_records" / "crashed.jsonl"
+    lines = log_path.read_text(encoding="utf-8").splitlines(keepends=True)
+    # 模拟写入 finish 事件时崩溃：最后一行只写了一半
+    log_path.write_text("".join(lines[:-1]) + lines[-1][:5], encoding="utf-8")
+
+    compacted = compact_event_log(str(log_path), "")
+    assert compacted["rounds"] == expected["rounds"]
+    assert compacted["winner"] is None
+
+def test_compact_event_logs_only_rewrites_stale_records(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    play_logged_game(1, "fresh")
+    play_logged_game(2, "stale")
+    (tmp_path / "game_records" / "stale.json").unlink()
+    written = compact_event_logs("game_records")
+    assert [path.replace("\\", "/") for path in written] == ["game_records/stale.json"]
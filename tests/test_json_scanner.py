@@ -0,0 +1,78 @@
+import json
+import random
+
+import pytest
+
+from llm_client import JsonObjectScanner, extract_json_object
+
+KEYS = ("was_challenged", "challenge_reason")
+
+DECISION = {
+    "was_challenged": True,
+    "challenge_reason": '他说"全是{A}"，但 \\ 反斜杠和 } 括号都在字符串里 \\"',
+    "nested": {"a": [1, {"b": "}"}], "c": "\\\\"},
+}
+
+# 决策JSON前后带有模型的其他输出，包括不成对或不是JSON的花括号：(前缀, 决策JSON, 后缀)
+RESPONSES = [
+    ("", json.dumps(DECISION, ensure_ascii=False), ""),
+    ("我先想想 {不是JSON} 然后：\n", json.dumps(DECISION, ensure_ascii=False, indent=2), "\n以上 }"),
+    ('{"was_challenged": false} 补充：', json.dumps(DECISION), ""),
+    ("```json\n", json.dumps(DECISION, ensure_ascii=False), "\n```{"),
+]
+
+def feed_chunks(scanner, chunks):
+    """依次喂入各块，返回 (结果, 读取的块数)"""
+    for count, chunk in enumerate(chunks, 1):
+        result = scanner.feed(chunk)
+        if result is not None:
+            return result, count
+    return None, len(chunks)
+
+@pytest.mark.parametrize("parts", RESPONSES)
+def test_every_two_chunk_split_finds_the_decision(parts):
+    text = "".join(parts)
+    for split in range(len(text) + 1):
+        scanner = JsonObjectScanner(KEYS)
+        assert feed_chunks(scanner, [text[:split], text[split:]])[0] == DECISION, split
+
+@pytest.mark.parametrize("seed", range(100))
+def test_random_chunking_stops_at_the_decision(seed):
+    rng = random.Random(seed)
+    prefix, decision, suffix = rng.choice(RESPONSES)
+    text = prefix + decision + suffix
+    cuts = sorted(rng.sample(range(1, len(text)), rng.randrange(1, 40)))
+    chunks = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+    scanner = JsonObjectScanner(KEYS)
+    result, count = feed_chunks(scanner, chunks)
+    assert result == DECISION
+    # 在包含决策JSON右括号的那一块之后立即停止读取
+    decision_end = len(prefix) + len(decision)
+    assert len("".join(chunks[:count - 1])) < decision_end <= len(scanner.text)
+    assert scanner.text == "".join(chunks[:count])
+
+@pytest.mark.parametrize("chunk", ['"', "\\", '\\"', "{", "}"])
+def test_escape_and_quote_at_chunk_edges(chunk):
+    text = '{"challenge_reason": "a' + chunk.replace("\\", "\\\\").replace('"', '\\"') + '{", "was_challenged": true}'
+    expected = json.loads(text)
+    for split in range(len(text) + 1):
+        assert feed_chunks(JsonObjectScanner(KEYS), [text[:split], text[split:]])[0] == expected
+
+def test_stops_at_first_object_with_required_keys():
+    scanner = JsonObjectScanner(KEYS)
+    assert scanner.feed('{"was_challenged": true}') is None
+    assert scanner.feed('{"was_challenged": false, "challenge_reason": "x"}') == {"was_challenged": False, "challenge_reason": "x"}
+    # 已找到结果后继续喂入不会改变结果
+    assert scanner.feed('{"was_challenged": true, "challenge_reason": "y"}') == {"was_challenged": False, "challenge_reason": "x"}
+
+def test_unbalanced_or_invalid_objects_are_skipped():
+    text = '{"a": 1,} {"was_challenged": true, "challenge_reason": "ok"}'
+    assert JsonObjectScanner(KEYS).feed(text) == {"was_challenged": True, "challenge_reason": "ok"}
+    assert JsonObjectScanner(KEYS).feed('{"was_challenged": true, "challenge_reason": "unterminated}') is None
+
+def test_extract_json_object_prefers_required_keys_then_falls_back():
+    text = '{"was_challenged": true} 然后 {"was_challenged": true, "challenge_reason": "r"}'
+    assert extract_json_object(text, KEYS) == {"was_challenged": True, "challenge_reason": "r"}
+    # 没有对象包含全部必需键时返回第一个可以解析的对象，调用方据此指出缺少的字段
+    assert extract_json_object('先 {"was_challenged": true} 后', KEYS) == {"was_challenged": True}
+    assert extract_json_object("没有JSON", KEYS) is None
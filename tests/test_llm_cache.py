@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from llm_cache import CachedLLMClient, CacheMissError, LLMResponseCache
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+class ScriptedClient:
+    """按请求依次返回 response-<n> 的客户端，记录收到的请求"""
+    def __init__(self):
+        self.calls = []
+
+    def _reply(self, kind, messages, model):
+        self.calls.append((kind, model, messages[-1]["content"]))
+        return f"response-{len(self.calls)}", f"reasoning-{len(self.calls)}"
+
+    def chat(self, messages, model=None, response_format=None):
+        return self._reply("chat", messages, model)
+
+    def chat_stream(self, messages, model=None, required_keys=(), capture_reasoning=True, response_format=None):
+        return self._reply("stream", messages, model)
+
+    async def achat(self, messages, model=None, response_format=None):
+        return self._reply("achat", messages, model)
+
+class NoNetworkClient:
+    """回放模式下不应被调用的客户端"""
+    def __getattr__(self, name):
+        raise AssertionError(f"回放时访问了网络客户端: {name}")
+
+def test_key_is_stable_across_versions():
+    # 缓存文件会长期保留，键的算法变化会让已录制的缓存全部失效
+    assert LLMResponseCache.make_key("deepseek-r1", MESSAGES) == \
+        "58ee56dd9ea96851003d32b979e0bdb797238ddc6639efc830fa5e82ea6eee1e"
+    assert LLMResponseCache.make_key("deepseek-r1", MESSAGES, 1, {"type": "json_object"}) == \
+        "68c62f659a97e4c939701bb645deb0b3d038ac336ca4ebbb741bb9975a6e5472"
+
+def test_key_depends_only_on_request_content():
+    key = LLMResponseCache.make_key("m", [{"role": "user", "content": "x"}])
+    assert LLMResponseCache.make_key("m", [{"content": "x", "role": "user"}]) == key
+    assert LLMResponseCache.make_key("m", [{"role": "user", "content": "x"}], 0, None) == key
+    assert LLMResponseCache.make_key("other", [{"role": "user", "content": "x"}]) != key
+    assert LLMResponseCache.make_key("m", [{"role": "user", "content": "x"}], 1) != key
+    assert LLMResponseCache.make_key("m", [{"role": "user", "content": "x"}], 0, {"type": "json_object"}) != key
+
+def play_session(client):
+    """一局游戏中的请求序列：包括重复的相同请求、流式请求和异步请求"""
+    results = [
+        client.chat(MESSAGES, model="m"),
+        client.chat(MESSAGES, model="m"),
+        client.chat([{"role": "user", "content": "出牌"}], model="m", response_format={"type": "json_object"}),
+        client.chat_stream([{"role": "user", "content": "质疑"}], model="m", required_keys=("was_challenged",)),
+        asyncio.run(client.achat([{"role": "user", "content": "反思"}], model="m")),
+    ]
+    return results
+
+def test_record_then_replay_round_trip(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    backend = ScriptedClient()
+    recorder = CachedLLMClient(LLMResponseCache(path), mode="record", client=backend)
+    recorder.reset_occurrences()
+    recorded = play_session(recorder)
+    recorder.cache.close()
+    # 相同的请求第二次出现时得到各自的响应
+    assert recorded[0] != recorded[1]
+    assert len(backend.calls) == 5
+
+    # 重新打开缓存文件回放，不访问网络，结果与录制时相同
+    replayer = CachedLLMClient(LLMResponseCache(path), mode="replay", client=NoNetworkClient())
+    for _ in range(2):
+        replayer.reset_occurrences()
+        assert play_session(replayer) == recorded
+    assert replayer.hits == 10 and replayer.misses == 0
+
+def test_replay_miss_raises(tmp_path):
+    replayer = CachedLLMClient(LLMResponseCache(str(tmp_path / "cache.sqlite3")), mode="replay", client=NoNetworkClient())
+    with pytest.raises(CacheMissError):
+        replayer.chat(MESSAGES, model="m")
+    with pytest.raises(CacheMissError):
+        asyncio.run(replayer.achat(MESSAGES, model="m"))
+    assert replayer.misses == 2
+
+def test_empty_responses_and_passthrough_are_not_recorded(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"))
+
+    class EmptyClient(ScriptedClient):
+        def chat(self, messages, model=None, response_format=None):
+            return "", ""
+
+    CachedLLMClient(cache, mode="record", client=EmptyClient()).chat(MESSAGES, model="m")
+    CachedLLMClient(cache, mode="passthrough", client=ScriptedClient()).chat(MESSAGES, model="m")
+    assert cache.get(LLMResponseCache.make_key("m", MESSAGES)) is None
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        CachedLLMClient(LLMResponseCache(str(tmp_path / "cache.sqlite3")), mode="bogus")
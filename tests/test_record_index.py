@@ -0,0 +1,74 @@
+import os
+import random
+import sqlite3
+
+import pytest
+
+from game import Game
+from record_index import RecordIndex
+
+TABLES = {
+    "games": "game_id",
+    "game_players": "game_id, player_name",
+    "rounds": "game_id, round_id",
+    "plays": "game_id, round_id, play_index",
+    "shots": "game_id, round_id",
+}
+
+PLAYERS = [
+    {"name": "甲", "policy": "random"},
+    {"name": "乙", "policy": "truthful"},
+    {"name": "丙", "policy": "threshold_bluffer"},
+    {"name": "丁", "policy": "probability_challenger"},
+]
+
+def dump_tables(path):
+    """按主键排序读取索引中除文件表以外的所有行"""
+    conn = sqlite3.connect(path)
+    try:
+        return {table: conn.execute(f"SELECT * FROM {table} ORDER BY {order}").fetchall() for table, order in TABLES.items()}
+    finally:
+        conn.close()
+
+@pytest.mark.parametrize("event_log", [False, True])
+def test_rebuilt_index_matches_live_index(tmp_path, monkeypatch, event_log):
+    monkeypatch.chdir(tmp_path)
+    random.seed(7)
+    for game_number in range(8):
+        Game(PLAYERS, game_id=f"game{game_number}", event_log=event_log, index_path="live.sqlite3").start_game()
+
+    rebuilt = RecordIndex("rebuilt.sqlite3")
+    counts = rebuilt.update_from_directory("game_records")
+    rebuilt.close()
+    assert counts == {"indexed": 8, "unchanged": 0, "removed": 0, "failed": 0}
+
+    live_rows, rebuilt_rows = dump_tables("live.sqlite3"), dump_tables("rebuilt.sqlite3")
+    assert len(live_rows["games"]) == 8 and len(live_rows["plays"]) > 8
+    assert live_rows == rebuilt_rows
+
+def test_incremental_update_tracks_changed_and_removed_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    random.seed(11)
+    for game_number in range(3):
+        Game(PLAYERS, game_id=f"game{game_number}").start_game()
+
+    index = RecordIndex("index.sqlite3")
+    assert index.update_from_directory("game_records")["indexed"] == 3
+    assert index.update_from_directory("game_records") == {"indexed": 0, "unchanged": 3, "removed": 0, "failed": 0}
+
+    # 替换一局记录、删除一局记录、加入一个无法读取的文件
+    random.seed(12)
+    Game(PLAYERS, game_id="game0").start_game()
+    os.remove("game_records/game1.json")
+    with open("game_records/broken.json", "w", encoding="utf-8") as file:
+        file.write('{"game_id": "broken", "rounds": [')
+    counts = index.update_from_directory("game_records")
+    assert counts == {"indexed": 1, "unchanged": 1, "removed": 1, "failed": 1}
+    index.close()
+
+    # 增量更新后的索引与从头重建的索引一致
+    os.remove("game_records/broken.json")
+    rebuilt = RecordIndex("rebuilt.sqlite3")
+    rebuilt.update_from_directory("game_records")
+    rebuilt.close()
+    assert dump_tables("index.sqlite3") == dump_tables("rebuilt.sqlite3")
@@ -0,0 +1,63 @@
+import io
+import json
+import random
+
+import pytest
+
+import record_stream
+
+NUMBERS = ["0", "-0", "7", "-42", "12.25", "3e+10", "3E10", "-0.5e-3", "1e5", "123456789.000001", "2.5E+0"]
+STRINGS = ["", "a", "中文", 'quote " inside', "back\\slash", "line\nbreak", "tab\t", "{[,:]}", "é中", "\\u0041"]
+
+def random_json(rng: random.Random, depth: int = 0) -> str:
+    """生成随机的JSON文本：数字使用各种写法，字符串包含转义，记号之间有随机空白"""
+    ws = lambda: rng.choice(["", "", " ", "\n  ", "\t"])
+    kind = rng.randrange(7 if depth < 4 else 4)
+    if kind == 0:
+        return rng.choice(NUMBERS)
+    if kind == 1:
+        return json.dumps(rng.choice(STRINGS), ensure_ascii=rng.random() < 0.5)
+    if kind == 2:
+        return rng.choice(["true", "false", "null"])
+    if kind == 3:
+        return json.dumps(rng.uniform(-1e6, 1e6))
+    if kind in (4, 5):
+        items = [random_json(rng, depth + 1) for _ in range(rng.randrange(4))]
+        return "[" + ws() + ("," + ws()).join(items) + ws() + "]"
+    keys = rng.sample(STRINGS, rng.randrange(4))
+    members = [ws() + json.dumps(key) + ws() + ":" + ws() + random_json(rng, depth + 1) for key in keys]
+    return "{" + ",".join(members) + ws() + "}"
+
+def parse_fallback(text: str):
+    events = record_stream._basic_parse(io.StringIO(text))
+    value = record_stream._read_value(events, next(events))
+    assert next(events, None) is None
+    return value
+
+@pytest.mark.parametrize("text", ["[12.25]", "[ 3e+10]", "[-0.5E-3, 1e5]", '{"a": 1.5}', "[true,false,null]"])
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 5])
+def test_numbers_split_across_chunks(monkeypatch, text, chunk_size):
+    monkeypatch.setattr(record_stream, "_CHUNK_SIZE", chunk_size)
+    assert parse_fallback(text) == json.loads(text)
+
+@pytest.mark.parametrize("seed", range(200))
+def test_fallback_parser_matches_json_loads_at_any_chunk_boundary(monkeypatch, seed):
+    rng = random.Random(seed)
+    text = rng.choice(["", " ", "\n"]) + random_json(rng) + rng.choice(["", " ", "\n"])
+    expected = json.loads(text)
+    for chunk_size in (1, 2, 3, 7, 64):
+        monkeypatch.setattr(record_stream, "_CHUNK_SIZE", chunk_size)
+        assert parse_fallback(text) == expected, (chunk_size, text)
+
+@pytest.mark.skipif(record_stream.ijson is None, reason="ijson 未安装")
+@pytest.mark.parametrize("seed", range(50))
+def test_fallback_events_match_ijson(monkeypatch, seed):
+    text = random_json(random.Random(seed))
+    monkeypatch.setattr(record_stream, "_CHUNK_SIZE", 3)
+    expected = list(record_stream.ijson.basic_parse(io.BytesIO(text.encode("utf-8")), use_float=True))
+    assert list(record_stream._basic_parse(io.StringIO(text))) == expected
+
+def test_invalid_json_raises(monkeypatch):
+    monkeypatch.setattr(record_stream, "_CHUNK_SIZE", 2)
+    with pytest.raises(ValueError):
+        parse_fallback("[12.x]")
@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import openai
+import pytest
+
+import player as player_module
+from conftest import REPO_ROOT
+from llm_client import AsyncLLMClient, LLMClient
+from player import Player
+from retry_policy import RetryPolicy
+
+FAST_RETRY = RetryPolicy(max_retries=2, base_delay=0.01, max_delay=0.05)
+
+def test_chat_raises_non_retryable_errors_without_retrying(stub):
+    stub.failures["m"] = [400]
+    client = LLMClient(api_key="test", base_url=stub.base_url, retry_policy=FAST_RETRY)
+    with pytest.raises(openai.BadRequestError):
+        client.chat([{"role": "user", "content": "x"}], model="m")
+    assert stub.requests == 1
+
+def test_chat_retries_server_errors_then_raises(stub):
+    stub.failures["m"] = [503, 503]
+    client = LLMClient(api_key="test", base_url=stub.base_url, retry_policy=FAST_RETRY)
+    assert client.chat([{"role": "user", "content": "ok"}], model="m")[0] == "OK"
+    assert stub.requests == 3
+
+    stub.failures["m"] = [503, 503, 503]
+    with pytest.raises(openai.InternalServerError):
+        client.chat([{"role": "user", "content": "ok"}], model="m")
+    assert stub.requests == 6
+
+def test_achat_raises_non_retryable_errors(stub):
+    stub.failures["m"] = [401]
+    client = AsyncLLMClient(api_key="test", base_url=stub.base_url, retry_policy=FAST_RETRY)
+    with pytest.raises(openai.AuthenticationError):
+        asyncio.run(client.achat([{"role": "user", "content": "x"}], model="m"))
+    assert stub.requests == 1
+
+class ScriptedClient:
+    """按顺序返回预设回复的客户端，回复为异常时抛出"""
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def chat(self, messages, model=None, response_format=None):
+        self.calls.append(messages)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply, ""
+
+@pytest.fixture
+def make_player(monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+
+    def make(replies):
+        client = ScriptedClient(replies)
+        monkeypatch.setattr(player_module, "get_llm_client", lambda: client)
+        player = Player("甲", "m")
+        player.hand = ["Q", "K", "A", "Joker", "Q"]
+        return player, client
+    return make
+
+def play_decision(cards):
+    return json.dumps({"played_cards": cards, "behavior": "平静", "play_reason": "理由"}, ensure_ascii=False)
+
+def test_invalid_decision_is_retried_with_feedback(make_player):
+    player, client = make_player([play_decision(["A", "A"]), play_decision(["Q"])])
+    result, _ = player.choose_cards_to_play("基础信息", "操作信息", "决策信息")
+    assert result["played_cards"] == ["Q"]
+    assert len(client.calls) == 2
+    assert "不在你的手牌中" in client.calls[1][-1]["content"]
+
+def test_request_errors_do_not_spend_the_decision_budget(make_player):
+    error = openai.APIConnectionError(request=None)
+    player, client = make_player([error, play_decision(["Q"])])
+    with pytest.raises(openai.APIConnectionError):
+        player.choose_cards_to_play("基础信息", "操作信息", "决策信息")
+    assert len(client.calls) == 1
+    assert player.hand == ["Q", "K", "A", "Joker", "Q"]
+
+def test_challenge_budget_is_spent_only_on_invalid_replies(make_player):
+    player, client = make_player(["没有JSON"] * 5)
+    with pytest.raises(RuntimeError):
+        player.decide_challenge("基础信息", "操作信息", "决策信息", "表现", "")
+    assert len(client.calls) == player.retry_budgets["challenge"]
+
+def test_reflection_keeps_opinion_when_request_fails(make_player):
+    player, client = make_player([openai.APIConnectionError(request=None)])
+    player.retry_budgets["reflect"] = 3
+    assert player.reflect_on_player("乙", "基础信息", "操作信息", "结果") is None
+    assert len(client.calls) == 1
@@ -0,0 +1,76 @@
+import gzip
+import hashlib
+import os
+import tempfile
+from typing import Dict, Optional, Union
+
+# 推理内容在游戏记录中的取值：直接保存的文本，或指向推理存储的引用 {"ref": "sha256:<hex>", "length": 字符数}
+Trace = Union[str, Dict, None]
+
+# 推理存储默认位于游戏记录目录下
+DEFAULT_TRACE_SUBDIRECTORY = "traces"
+
+class TraceStore:
+    """按内容寻址的推理内容存储
+
+    每段推理内容以其SHA-256命名，gzip压缩后保存为 <directory>/<前两位>/<哈希>.gz。
+    相同内容只保存一次，写入先落到临时文件再原子替换，多个进程可以共用同一个目录。
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.gz")
+
+    def put(self, text: str) -> Dict:
+        """
+        保存推理内容
+
+        Returns:
+            Dict: 写入游戏记录的引用，包括内容哈希和字符数
+        """
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{digest}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(gzip.compress(text.encode("utf-8")))
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        return {"ref": f"sha256:{digest}", "length": len(text)}
+
+    def get(self, ref: Dict) -> str:
+        """读取引用指向的推理内容"""
+        digest = ref["ref"].split(":", 1)[1]
+        with open(self._path(digest), "rb") as file:
+            return gzip.decompress(file.read()).decode("utf-8")
+
+def is_trace_ref(value: Trace) -> bool:
+    """判断记录中的推理内容是否为推理存储中的引用"""
+    return isinstance(value, dict) and "ref" in value
+
+def resolve_trace(value: Trace, trace_directory: str) -> Optional[str]:
+    """
+    将记录中的推理内容还原为文本，只在需要时读取推理存储
+
+    Args:
+        value: 记录中的 play_thinking 或 challenge_thinking
+        trace_directory: 推理存储目录，通常为游戏记录目录下的 traces
+    Returns:
+        Optional[str]: 推理内容；引用指向的文件不存在时返回None
+    """
+    if not is_trace_ref(value):
+        return value
+    try:
+        return TraceStore(trace_directory).get(value)
+    except FileNotFoundError:
+        return None
+
+def default_trace_directory(record_directory: str) -> str:
+    """游戏记录目录对应的默认推理存储目录"""
+    return os.path.join(record_directory, DEFAULT_TRACE_SUBDIRECTORY)
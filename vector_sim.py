@@ -0,0 +1,297 @@
+import numpy as np
+from math import comb
+from typing import Dict, List, Optional
+import argparse
+import time
+
+# 牌面编码：0=Q, 1=K, 2=A, 3=Joker，-1表示该手牌位置已打出
+CARD_NAMES = ['Q', 'K', 'A', 'Joker']
+JOKER = 3
+EMPTY = -1
+DECK = np.array([0] * 6 + [1] * 6 + [2] * 6 + [JOKER] * 2, dtype=np.int8)
+HAND_SIZE = 5
+CHAMBERS = 6
+MATCHING_IN_DECK = 8  # 每种目标牌6张加2张Joker
+
+# 参数化策略，与 policy.py 中的脚本策略一一对应
+#   random_play: 随机打出1-3张牌
+#   min_play: 真牌不足时用假牌补足到的张数
+#   challenge_probability: 无条件质疑的概率
+#   challenge_impossible: 上家宣称的张数超过剩余可能的目标牌数时必定质疑
+#   lie_threshold: 按超几何分布估计上家说谎概率，超过该值时质疑（大于1表示不使用）
+VECTOR_POLICIES: Dict[str, Dict] = {
+    "random": dict(random_play=True, min_play=1, challenge_probability=0.5, challenge_impossible=False, lie_threshold=2.0),
+    "truthful": dict(random_play=False, min_play=1, challenge_probability=0.0, challenge_impossible=True, lie_threshold=2.0),
+    "threshold_bluffer": dict(random_play=False, min_play=2, challenge_probability=0.3, challenge_impossible=True, lie_threshold=2.0),
+    "probability_challenger": dict(random_play=False, min_play=1, challenge_probability=0.0, challenge_impossible=True, lie_threshold=0.5),
+}
+
+def _lie_probability_table() -> np.ndarray:
+    """
+    预先计算上家宣称为假的概率
+
+    索引为 [自己手中可当作目标牌的张数, 自己手牌数, 宣称张数, 上家出牌前手牌数]，
+    上家出牌前的手牌视为从自己看不到的牌中随机抽取。
+    """
+    table = np.zeros((HAND_SIZE + 1, HAND_SIZE + 1, 4, HAND_SIZE + 1))
+    deck_size = len(DECK)
+    for own_matching in range(HAND_SIZE + 1):
+        for own_size in range(own_matching, HAND_SIZE + 1):
+            unknown = deck_size - own_size
+            matching_unknown = MATCHING_IN_DECK - own_matching
+            for claimed in range(1, 4):
+                for hand_size in range(claimed, HAND_SIZE + 1):
+                    if claimed > matching_unknown:
+                        table[own_matching, own_size, claimed, hand_size] = 1.0
+                        continue
+                    truthful = sum(
+                        comb(matching_unknown, k) * comb(unknown - matching_unknown, hand_size - k)
+                        for k in range(claimed, min(matching_unknown, hand_size) + 1)
+                    ) / comb(unknown, hand_size)
+                    table[own_matching, own_size, claimed, hand_size] = 1 - truthful
+    return table
+
+class VectorizedSimulator:
+    def __init__(self, policies: List[str], batch_size: int = 10000, seed: Optional[int] = None):
+        """
+        以NumPy数组同时推进B局游戏的蒙特卡洛模拟器
+
+        规则与 Game 一致：每轮给存活玩家各发5张牌并随机选择目标牌，玩家轮流出1-3张牌，
+        下家决定是否质疑，输家开枪；其他玩家都没有手牌时系统自动质疑。
+
+        Args:
+            policies: 每个座位使用的策略名称（见 VECTOR_POLICIES），2-4个
+            batch_size: 同时模拟的局数B
+            seed: 随机种子
+        """
+        if not 2 <= len(policies) <= 4:
+            raise ValueError("游戏需要2-4名玩家")
+        self.policies = policies
+        self.num_players = len(policies)
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        params = [VECTOR_POLICIES[name] for name in policies]
+        self.random_play = np.array([p["random_play"] for p in params])
+        self.min_play = np.array([p["min_play"] for p in params])
+        self.challenge_probability = np.array([p["challenge_probability"] for p in params])
+        self.challenge_impossible = np.array([p["challenge_impossible"] for p in params])
+        self.lie_threshold = np.array([p["lie_threshold"] for p in params])
+        self.lie_table = _lie_probability_table()
+
+    def _create_decks(self, count: int) -> np.ndarray:
+        """为 count 局同时洗牌，返回 (count, 20) 的牌组"""
+        order = np.argsort(self.rng.random((count, len(DECK))), axis=1)
+        return DECK[order]
+
+    def _deal_cards(self, games: np.ndarray) -> None:
+        """为指定的局重新洗牌、给存活玩家各发5张牌并选择目标牌"""
+        if games.size == 0:
+            return
+        decks = self._create_decks(games.size)
+        alive = self.alive[games]
+        # 第i个存活玩家拿到牌组中第i组5张牌
+        seat_rank = np.cumsum(alive, axis=1) - 1
+        positions = seat_rank[:, :, None] * HAND_SIZE + np.arange(HAND_SIZE)
+        hands = np.take_along_axis(decks[:, None, :].repeat(self.num_players, axis=1), np.clip(positions, 0, None), axis=2)
+        self.hands[games] = np.where(alive[:, :, None], hands, EMPTY)
+        self.target[games] = self.rng.integers(0, 3, games.size)
+        self.rounds[games] += 1
+
+    def _next_player_with_cards(self, games: np.ndarray, start: np.ndarray) -> np.ndarray:
+        """返回 start 之后下一个存活且有手牌的玩家，不存在时返回 start"""
+        offsets = np.arange(1, self.num_players + 1)
+        candidates = (start[:, None] + offsets) % self.num_players
+        has_cards = (self.hands[games[:, None], candidates] != EMPTY).any(axis=2) & self.alive[games[:, None], candidates]
+        first = has_cards.argmax(axis=1)
+        return np.where(has_cards.any(axis=1), candidates[np.arange(games.size), first], start)
+
+    def _next_alive(self, games: np.ndarray, start: np.ndarray) -> np.ndarray:
+        """返回 start 之后（包含 start 自身）第一个存活的玩家"""
+        offsets = np.arange(self.num_players)
+        candidates = (start[:, None] + offsets) % self.num_players
+        alive = self.alive[games[:, None], candidates]
+        return candidates[np.arange(games.size), alive.argmax(axis=1)]
+
+    def _choose_cards(self, hands: np.ndarray, target: np.ndarray, seats: np.ndarray) -> np.ndarray:
+        """按各座位的策略参数选择要打出的手牌位置，返回 (n, 5) 的布尔掩码"""
+        n = hands.shape[0]
+        present = hands != EMPTY
+        matching = present & ((hands == target[:, None]) | (hands == JOKER))
+
+        # 真牌策略：最多打出3张可当作目标牌的牌
+        play = matching & (np.cumsum(matching, axis=1) <= 3)
+        # 真牌不足时随机补入假牌
+        min_play = np.minimum(self.min_play[seats], present.sum(axis=1))
+        for _ in range(3):
+            need = play.sum(axis=1) < min_play
+            candidates = present & ~play & ~matching
+            need &= candidates.any(axis=1)
+            if not need.any():
+                break
+            keys = np.where(candidates, self.rng.random((n, HAND_SIZE)), -1.0)
+            pick = keys.argmax(axis=1)
+            play[np.flatnonzero(need), pick[need]] = True
+
+        # 随机策略：随机打出1-3张
+        random_rows = self.random_play[seats]
+        if random_rows.any():
+            rows = np.flatnonzero(random_rows)
+            counts = present[rows].sum(axis=1)
+            k = self.rng.integers(1, np.minimum(counts, 3) + 1)
+            keys = np.where(present[rows], self.rng.random((rows.size, HAND_SIZE)), np.inf)
+            ranks = keys.argsort(axis=1).argsort(axis=1)
+            play[rows] = present[rows] & (ranks < k[:, None])
+        return play
+
+    def _decide_challenge(self, challenger_hands: np.ndarray, target: np.ndarray, seats: np.ndarray,
+                          claimed: np.ndarray, claimant_remaining: np.ndarray) -> np.ndarray:
+        """按各座位的策略参数决定是否质疑"""
+        present = challenger_hands != EMPTY
+        own_matching = (present & ((challenger_hands == target[:, None]) | (challenger_hands == JOKER))).sum(axis=1)
+        own_size = present.sum(axis=1)
+        impossible = claimed > MATCHING_IN_DECK - own_matching
+        lie = self.lie_table[own_matching, own_size, claimed, np.minimum(claimed + claimant_remaining, HAND_SIZE)]
+        return (
+            (self.challenge_impossible[seats] & impossible)
+            | (lie > self.lie_threshold[seats])
+            | (self.rng.random(seats.size) < self.challenge_probability[seats])
+        )
+
+    def _shoot(self, games: np.ndarray, shooters: np.ndarray) -> None:
+        """输家开枪，判定胜负并为未结束的局开始新一轮"""
+        hit = self.bullet[games, shooters] == self.gun[games, shooters]
+        self.gun[games, shooters] = (self.gun[games, shooters] + 1) % CHAMBERS
+        self.alive[games[hit], shooters[hit]] = False
+
+        finished = self.alive[games].sum(axis=1) == 1
+        self.done[games[finished]] = True
+        self.winner[games[finished]] = self.alive[games[finished]].argmax(axis=1)
+
+        # 开枪者存活时由其开始新一轮，否则顺延至下一个存活玩家
+        remaining = games[~finished]
+        self._deal_cards(remaining)
+        self.current[remaining] = self._next_alive(remaining, shooters[~finished])
+
+    def run(self) -> Dict[str, np.ndarray]:
+        """
+        模拟 batch_size 局游戏直到全部结束
+
+        Returns:
+            Dict: winner - 每局获胜座位；rounds - 每局轮数
+        """
+        B, P = self.batch_size, self.num_players
+        self.hands = np.full((B, P, HAND_SIZE), EMPTY, dtype=np.int8)
+        self.bullet = self.rng.integers(0, CHAMBERS, (B, P))
+        self.gun = np.zeros((B, P), dtype=np.int64)
+        self.alive = np.ones((B, P), dtype=bool)
+        self.target = np.zeros(B, dtype=np.int8)
+        self.current = self.rng.integers(0, P, B)
+        self.done = np.zeros(B, dtype=bool)
+        self.winner = np.full(B, -1)
+        self.rounds = np.zeros(B, dtype=np.int64)
+        self._deal_cards(np.arange(B))
+
+        while True:
+            games = np.flatnonzero(~self.done)
+            if games.size == 0:
+                break
+            current = self.current[games]
+            counts = (self.hands[games] != EMPTY).sum(axis=2)
+            others = counts.copy()
+            others[np.arange(games.size), current] = 0
+            system = (others * self.alive[games]).sum(axis=1) == 0
+
+            # 系统自动质疑：当前玩家剩余手牌全部打出
+            if system.any():
+                sys_games, sys_current = games[system], current[system]
+                hands = self.hands[sys_games, sys_current]
+                target = self.target[sys_games]
+                valid = ((hands == EMPTY) | (hands == target[:, None]) | (hands == JOKER)).all(axis=1)
+                self.hands[sys_games, sys_current] = EMPTY
+                # 出牌合法时无人开枪，随机选择存活玩家开始新一轮
+                reset = sys_games[valid]
+                self._deal_cards(reset)
+                if reset.size:
+                    random_start = (self.rng.random((reset.size, P)) * self.alive[reset]).argmax(axis=1)
+                    self.current[reset] = random_start
+                self._shoot(sys_games[~valid], sys_current[~valid])
+
+            # 正常出牌与质疑
+            games, current = games[~system], current[~system]
+            if games.size == 0:
+                continue
+            next_player = self._next_player_with_cards(games, current)
+            target = self.target[games]
+            hands = self.hands[games, current]
+            play = self._choose_cards(hands, target, current)
+            claimed = play.sum(axis=1)
+            lie = (play & (hands != target[:, None]) & (hands != JOKER)).any(axis=1)
+            self.hands[games, current] = np.where(play, EMPTY, hands)
+            remaining = (self.hands[games, current] != EMPTY).sum(axis=1)
+
+            challenged = self._decide_challenge(self.hands[games, next_player], target, next_player, claimed, remaining)
+            self.current[games[~challenged]] = next_player[~challenged]
+            loser = np.where(lie, current, next_player)[challenged]
+            self._shoot(games[challenged], loser)
+
+        return {"winner": self.winner.copy(), "rounds": self.rounds.copy()}
+
+def parse_arguments():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description='NumPy向量化蒙特卡洛模拟，估计各座位与策略的基准胜率',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        '-n', '--num-games',
+        type=int,
+        default=100000,
+        help='模拟局数 (默认: 100000)'
+    )
+    parser.add_argument(
+        '-p', '--policies',
+        nargs='+',
+        choices=list(VECTOR_POLICIES),
+        default=['random', 'truthful', 'threshold_bluffer', 'probability_challenger'],
+        help='每个座位使用的策略，2-4个'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help='随机种子'
+    )
+    parser.add_argument(
+        '--benchmark',
+        type=int,
+        default=0,
+        metavar='N',
+        help='额外用对象化的 Game 引擎模拟N局相同策略的游戏，对比速度和胜率'
+    )
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arguments()
+
+    simulator = VectorizedSimulator(args.policies, batch_size=args.num_games, seed=args.seed)
+    start = time.perf_counter()
+    result = simulator.run()
+    elapsed = time.perf_counter() - start
+
+    print(f"向量化模拟 {args.num_games} 局，用时 {elapsed:.2f} 秒（{args.num_games / elapsed:.0f} 局/秒），平均 {result['rounds'].mean():.2f} 轮/局")
+    wins = np.bincount(result["winner"], minlength=len(args.policies))
+    for seat, policy in enumerate(args.policies):
+        print(f"座位{seat + 1} {policy}: {wins[seat]} 场 ({wins[seat] / args.num_games * 100:.1f}%)")
+
+    if args.benchmark:
+        from simulate import run_simulations
+        player_configs = [
+            {"name": f"{policy}_{seat + 1}", "policy": policy}
+            for seat, policy in enumerate(args.policies)
+        ]
+        object_wins, object_elapsed = run_simulations(player_configs, args.benchmark, seed=args.seed)
+        print(f"\n对象化引擎模拟 {args.benchmark} 局，用时 {object_elapsed:.2f} 秒（{args.benchmark / object_elapsed:.0f} 局/秒）")
+        for config in player_configs:
+            name = config["name"]
+            print(f"{name}: {object_wins[name]} 场 ({object_wins[name] / args.benchmark * 100:.1f}%)")
+        print(f"\n向量化加速比: {(args.num_games / elapsed) / (args.benchmark / object_elapsed):.1f}x")